@@ -0,0 +1,49 @@
+#!/bin/env python3
+
+import sqlite3
+
+"""AlertStore keeps the alerts EmailTunnel has issued between runs, in an
+SQLite database.  Every alert is a row keyed by (account, line, resource,
+kind), where kind tells the alerts to the user, to the admin about the user
+and to the admin about the account apart; account-wide alerts have the line
+''.  The key is the table's primary key, so looking up one alert is a single
+index probe: a run reads only the alerts it touches, however many accounts
+share the store.
+
+The store is safe to use from one thread at a time."""
+class AlertStore:
+   def __init__(self, path):
+      self.db = sqlite3.connect(path, check_same_thread=False)
+      with self.db:
+         self.db.execute("""CREATE TABLE IF NOT EXISTS alerts (
+            account TEXT NOT NULL,
+            line TEXT NOT NULL,
+            resource TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            code INTEGER NOT NULL,
+            PRIMARY KEY (account, line, resource, kind)
+         ) WITHOUT ROWID""")
+
+   def get(self, account, line, resource, kind):
+      """Returns the code of the alert issued last, or None."""
+      row = self.db.execute("SELECT code FROM alerts WHERE account = ? AND line = ? AND resource = ? AND kind = ?",
+         (account, line, resource, kind)).fetchone()
+      return None if row is None else row[0]
+
+   def update(self, changes):
+      """Applies changes, an iterable of ((account, line, resource, kind),
+      code), in one transaction.  A code of None deletes the alert."""
+      upserts = []
+      deletes = []
+      for (key, code) in changes:
+         if code is None:
+            deletes.append(key)
+         else:
+            upserts.append(key + (code,))
+      with self.db:
+         self.db.executemany("DELETE FROM alerts WHERE account = ? AND line = ? AND resource = ? AND kind = ?", deletes)
+         self.db.executemany("INSERT OR REPLACE INTO alerts (account, line, resource, kind, code) VALUES (?, ?, ?, ?, ?)",
+            upserts)
+
+   def close(self):
+      self.db.close()
@@ -1,60 +1,78 @@
 from SharedUsageAlerter import Warn
+from MailDelivery import PrintDelivery
 
 """EmailTunnel is a module for sending email notifications to users who cause
 a usage alert.  Its main purpose is to eliminate duplicate notifications.  The
 software is designed to run periodically (daily), and we don't want to spam the
 user or the account administrator with the same notification every time.
 Instead we prefer to generate an email only when something changes.  That's what
-this module does."""
+this module does.
+
+To remember the alerts between runs, give the tunnel an AlertStore and the
+account's name.  The tunnel reads the previous alert of a line only when the
+line comes up, and writes everything that changed in one transaction when
+commit() is called at the end of the run, except those whose mail couldn't
+be sent: the next run issues them again.  Without a store, the tunnel
+remembers alerts for as long as it lives.
+
+The alerts go to a delivery from MailDelivery: by default a PrintDelivery,
+which prints them; an SmtpDelivery mails every recipient one digest per
+commit()."""
 class EmailTunnel:
-   def __init__(self):
-      self.useralerts = {}
-      self.aaau = {} # admin alerts about user
-      self.adminalert = None
-      pass
+   def __init__(self, store=None, account='', delivery=None):
+      self.store = store
+      self.delivery = delivery if delivery is not None else PrintDelivery()
+      self.account = account
+      self.alerts = {} # (line, resource, kind) -> code of the alert issued last, or None
+      self.changes = {}
+      self.queued = {} # key of a changed alert -> recipient it was queued for
 
    def alertUser(self, line, resource, wCode, wText):
-      if line not in self.useralerts:
-         self.useralerts[line] = {}
-      if resource in self.useralerts[line]:
-         if self.useralerts[line][resource] == wCode:
-            pass  # This warning has already been issued
-         elif wCode == Warn.Local.Ok:
-            # Warning is cleared.
-            del self.useralerts[line][resource]
-         else:
-            # Issue the warning.
-            print("EMAIL: Warning to %s about %s: %s" % (line, resource, wText))
-      else:
-         if wCode != Warn.Local.Ok:
-            # Issue the warning and store it.
-            self.useralerts[line][resource] = wCode
-            print("EMAIL: Warning to %s about %s: %s" % (line, resource, wText))
+      self._alert((line, resource, 'user'), wCode, Warn.Local.Ok,
+         line, "Warning to %s about %s: %s" % (line, resource, wText))
 
    def alertAdminAboutUser(self, line, resource, wCode, wText):
-      if line not in self.aaau:
-         self.aaau[line] = {}
-      if resource in self.aaau[line]:
-         if self.aaau[line] == wCode:
-            pass  # This warning has already been issued
-         elif wCode == Warn.Local.Ok:
-            # Warning is cleared.
-            del self.aaau[line][resource]
-         else:
-            # Issue the warning.
-            print("EMAIL: Warning to admin about %s (%s): %s" % (line, resource, wText))
-      else:
-         if wCode != Warn.Local.Ok:
-            # Issue the warning and store it.
-            self.aaau[line][resource] = wCode
-            print("EMAIL: Warning to admin about %s (%s): %s" % (line, resource, wText))
+      self._alert((line, resource, 'admin'), wCode, Warn.Local.Ok,
+         None, "Warning to admin about %s (%s): %s" % (line, resource, wText))
 
    def alertAdminGlobally(self, resource, wCode, wText):
-      if wCode == None:
-         self.adminalert = wCode
-      elif wCode == Warn.Global.Ok:
-         self.adminalert = None
-      elif wCode != self.adminalert:
-         # Issue the warning.
-         print("EMAIL: Global %s warning to admin: %s" % (resource, wText))
- 
+      self._alert(('', resource, 'global'), wCode, Warn.Global.Ok,
+         None, "Global %s warning to admin: %s" % (resource, wText))
+
+   def commit(self):
+      """Delivers the queued alerts and saves the alerts that changed since
+      the last commit to the store.  Returns the messages the delivery couldn't
+      send.  The alerts of those messages aren't saved, nor remembered, so the
+      next run issues them again."""
+      failed = self.delivery.flush()
+      unsent = set(m.recipient for m in failed)
+      for (key, recipient) in self.queued.items():
+         if recipient in unsent:
+            del self.changes[key]
+            del self.alerts[key]
+      if self.store is not None and self.changes:
+         self.store.update(((self.account,) + key, code) for (key, code) in self.changes.items())
+      self.changes = {}
+      self.queued = {}
+      return failed
+
+   def _alert(self, key, wCode, ok, recipient, text):
+      if self._changed(key, wCode, ok):
+         self.delivery.queue(recipient, key[1], text)
+         self.queued[key] = recipient
+
+   # Records wCode as the current alert of key and returns whether it should
+   # be issued: only if it's a warning and differs from the one issued last.
+   # Ok (or None) clears the alert.
+   def _changed(self, key, wCode, ok):
+      if key in self.alerts:
+         previous = self.alerts[key]
+      elif self.store is not None:
+         previous = self.store.get(self.account, *key)
+      else:
+         previous = None
+      current = None if wCode is None or wCode == ok else wCode
+      self.alerts[key] = current
+      if current != previous:
+         self.changes[key] = current
+      return current is not None and current != previous
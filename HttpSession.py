@@ -0,0 +1,283 @@
+#!/bin/env python3
+
+import http.client
+import http.cookiejar
+import ssl
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+"""HttpSession is a small HTTP client that keeps its connections alive.  It
+replaces the global urllib opener for VerizonScraper: every session has its own
+cookie jar, so several scrapers can live in one process, and idle connections
+are pooled per host and reused by later requests, including requests of later
+scrapes that share the session.
+
+The session counts how many connections it opened and how many requests went
+over a reused connection; see stats().  If recordLatencies is True, it also
+keeps the time every request took until its response headers arrived, in
+seconds, in the list latencies.
+
+A HostLimiter, which may be shared by many sessions, holds back requests to
+hosts that are at their rate limit or concurrency cap."""
+
+class HostLimiter:
+   """Limits the requests to every host to rate per second, in bursts of at
+   most burst requests, and to maxInFlight requests at a time.  A request is in
+   flight from when it's sent until its response is closed.  None means no
+   limit.  The limiter counts how many requests had to wait and for how long;
+   see stats()."""
+
+   def __init__(self, rate=None, burst=1, maxInFlight=None, clock=time.monotonic):
+      self.rate = rate
+      self.burst = burst
+      self.maxInFlight = maxInFlight
+      self.clock = clock
+      self.cond = threading.Condition()
+      self.hosts = {}
+      self.waited = 0
+      self.waitedSeconds = 0.0
+
+   def acquire(self, host):
+      with self.cond:
+         state = self.hosts.get(host)
+         if state is None:
+            state = self.hosts[host] = _HostState(self.burst, self.clock())
+         start = None
+         while True:
+            now = self.clock()
+            if self.rate is not None:
+               state.tokens = min(self.burst, state.tokens + (now - state.refilled) * self.rate)
+            state.refilled = now
+            if self.maxInFlight is not None and state.inFlight >= self.maxInFlight:
+               timeout = None # until a release
+            elif self.rate is not None and state.tokens < 1:
+               timeout = (1 - state.tokens) / self.rate
+            else:
+               break
+            if start is None:
+               start = now
+            self.cond.wait(timeout)
+         if self.rate is not None:
+            state.tokens -= 1
+         state.inFlight += 1
+         if start is not None:
+            self.waited += 1
+            self.waitedSeconds += self.clock() - start
+
+   def release(self, host):
+      with self.cond:
+         self.hosts[host].inFlight -= 1
+         self.cond.notify_all()
+
+   def stats(self):
+      """Returns a dictionary with the number of requests that waited and the
+      seconds they waited in total."""
+      with self.cond:
+         return {'waited': self.waited, 'waitedSeconds': self.waitedSeconds}
+
+class _HostState:
+   __slots__ = ('tokens', 'refilled', 'inFlight')
+
+   def __init__(self, tokens, refilled):
+      self.tokens = tokens
+      self.refilled = refilled
+      self.inFlight = 0
+
+class Response:
+   """A response whose connection goes back to the session's pool once the
+   body has been read and the response closed.  Use it in a with statement."""
+
+   def __init__(self, session, key, conn, resp, url):
+      self.session = session
+      self.key = key
+      self.conn = conn
+      self.resp = resp
+      self.url = url
+      self.status = resp.status
+      self.headers = resp.msg
+
+   def info(self):
+      return self.headers
+
+   def read(self, n=-1):
+      return self.resp.read() if n is None or n < 0 else self.resp.read(n)
+
+   def readlines(self):
+      return self.resp.readlines()
+
+   def __iter__(self):
+      return iter(self.resp)
+
+   def close(self):
+      if self.conn is None:
+         return
+      conn = self.conn
+      self.conn = None
+      try:
+         # The body must be consumed before the connection can carry another
+         # request.
+         self.resp.read()
+         reusable = not self.resp.will_close
+      except (http.client.HTTPException, OSError):
+         reusable = False
+      self.resp.close()
+      self.session._done(self.key)
+      if reusable:
+         self.session._release(self.key, conn)
+      else:
+         conn.close()
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *exc):
+      self.close()
+
+class HttpSession:
+   maxRedirects = 10
+   # Requests that may be sent twice without harm (RFC 7231, 4.2.2).
+   idempotentMethods = frozenset(('GET', 'HEAD', 'OPTIONS', 'TRACE', 'PUT', 'DELETE'))
+
+   # headers are sent with every request.  maxIdlePerHost bounds how many idle
+   # connections to one host are kept for reuse.  connectionClasses may replace
+   # the http.client connection class per scheme, e.g. for debugging.  limiter
+   # is a HostLimiter, or None.
+   def __init__(self, headers=(), maxIdlePerHost=8, timeout=60, connectionClasses=None, recordLatencies=False,
+         limiter=None):
+      self.headers = list(headers)
+      self.maxIdlePerHost = maxIdlePerHost
+      self.timeout = timeout
+      self.connectionClasses = {
+         'http': http.client.HTTPConnection,
+         'https': http.client.HTTPSConnection,
+      }
+      if connectionClasses:
+         self.connectionClasses.update(connectionClasses)
+      self.cookies = http.cookiejar.CookieJar()
+      self.sslContext = ssl.create_default_context()
+      self.lock = threading.Lock()
+      self.idle = {}
+      self.requests = 0
+      self.opened = 0
+      self.reused = 0
+      self.latencies = [] if recordLatencies else None
+      self.limiter = limiter
+
+   def get(self, url, headers=(), followRedirects=True):
+      return self.request('GET', url, None, headers, followRedirects)
+
+   def post(self, url, data, headers=(), followRedirects=True, idempotent=False):
+      return self.request('POST', url, data, headers, followRedirects, idempotent)
+
+   def request(self, method, url, data=None, headers=(), followRedirects=True, idempotent=None):
+      """Sends the request and returns a Response.  Redirects are followed the
+      way urllib follows them unless followRedirects is False.
+
+      A request that fails on a kept-alive connection, which the server may
+      have closed meanwhile, is sent once more on a fresh connection only if
+      it is idempotent: by default if its method is, but a caller may declare
+      e.g. a POST that only reads idempotent."""
+      for _ in range(self.maxRedirects + 1):
+         r = self._requestOnce(method, url, data, headers,
+            method in self.idempotentMethods if idempotent is None else idempotent)
+         if not followRedirects or r.status not in (301, 302, 303, 307, 308) or 'Location' not in r.headers:
+            return r
+         r.close()
+         url = urllib.parse.urljoin(url, r.headers['Location'])
+         if r.status in (301, 302, 303) and method == 'POST':
+            (method, data, idempotent) = ('GET', None, None)
+      raise http.client.HTTPException("Too many redirects at %s" % url)
+
+   def stats(self):
+      """Returns a dictionary with the number of requests sent, connections
+      opened and requests that went over a reused connection."""
+      with self.lock:
+         return {'requests': self.requests, 'opened': self.opened, 'reused': self.reused}
+
+   def close(self):
+      """Closes all idle connections."""
+      with self.lock:
+         idle = self.idle
+         self.idle = {}
+      for conns in idle.values():
+         for conn in conns:
+            conn.close()
+
+   def _requestOnce(self, method, url, data, headers, idempotent):
+      req = urllib.request.Request(url, data, method=method)
+      for (k, v) in self.headers:
+         req.add_header(k, v)
+      for (k, v) in dict(headers).items():
+         req.add_header(k, v)
+      if data is not None:
+         req.add_header('Content-Type', 'application/x-www-form-urlencoded')
+      self.cookies.add_cookie_header(req)
+      parts = urllib.parse.urlsplit(url)
+      key = (parts.scheme, parts.hostname, parts.port)
+      path = parts.path or '/'
+      if parts.query:
+         path += '?' + parts.query
+
+      if self.limiter is not None:
+         self.limiter.acquire(parts.hostname)
+      try:
+         start = time.perf_counter()
+         (conn, reused) = self._acquire(key)
+         try:
+            conn.request(method, path, data, dict(req.header_items()))
+            resp = conn.getresponse()
+         except (http.client.HTTPException, OSError):
+            conn.close()
+            if not (reused and idempotent):
+               raise
+            # The server may have closed the idle connection in the meantime.
+            # Try once more on a fresh one.
+            (conn, reused) = self._open(key)
+            try:
+               conn.request(method, path, data, dict(req.header_items()))
+               resp = conn.getresponse()
+            except Exception:
+               conn.close()
+               raise
+      except Exception:
+         self._done(key)
+         raise
+      with self.lock:
+         self.requests += 1
+         if self.latencies is not None:
+            self.latencies.append(time.perf_counter() - start)
+      self.cookies.extract_cookies(resp, req)
+      return Response(self, key, conn, resp, url)
+
+   def _acquire(self, key):
+      with self.lock:
+         conns = self.idle.get(key)
+         if conns:
+            self.reused += 1
+            return (conns.pop(), True)
+      return self._open(key)
+
+   def _open(self, key):
+      (scheme, host, port) = key
+      if scheme == 'https':
+         conn = self.connectionClasses['https'](host, port, timeout=self.timeout, context=self.sslContext)
+      else:
+         conn = self.connectionClasses['http'](host, port, timeout=self.timeout)
+      with self.lock:
+         self.opened += 1
+      return (conn, False)
+
+   # A request to key is over.
+   def _done(self, key):
+      if self.limiter is not None:
+         self.limiter.release(key[1])
+
+   def _release(self, key, conn):
+      with self.lock:
+         conns = self.idle.setdefault(key, [])
+         if len(conns) < self.maxIdlePerHost:
+            conns.append(conn)
+            return
+      conn.close()
@@ -0,0 +1,332 @@
+#!/bin/env python3
+
+import collections
+import concurrent.futures
+import email.message
+import heapq
+import mailbox
+import queue
+import smtplib
+import sys
+import threading
+import time
+import traceback
+
+"""MailDelivery holds the ways EmailTunnel can deliver alerts.  A delivery
+takes alerts with queue(recipient, resource, text), where the recipient is a
+phone line or None for the account admin, and delivers them when flush() is
+called at the end of a run.
+
+PrintDelivery prints every alert as an "EMAIL:" line and sends nothing.
+
+SmtpDelivery merges all alerts queued for one recipient, across resources,
+into a single digest message, and sends the digests over a small pool of
+SMTP connections that stay open between flushes.  It counts the messages sent
+and the connections opened, and records how long every message took to send;
+see stats().
+
+AsyncDelivery wraps another delivery and does the delivering in a background
+thread, so that flush() returns at once and the alerts of the next account can
+be evaluated meanwhile."""
+
+class PrintDelivery:
+   def queue(self, recipient, resource, text):
+      print("EMAIL: %s" % text)
+
+   def flush(self):
+      return []
+
+   def stats(self):
+      return {}
+
+   def close(self):
+      pass
+
+class SmtpDelivery:
+   # addresses maps phone lines to email addresses; alerts for lines without
+   # one are dropped and counted as undeliverable, as are the admin's without
+   # an adminAddress.  Up to poolSize messages are sent at once, each over its
+   # own connection.  connectionClass may be smtplib.SMTP_SSL, or a subclass
+   # that logs in.
+   def __init__(self, host, port=25, sender='alerts@localhost', addresses=None, adminAddress=None, poolSize=2,
+         timeout=30, connectionClass=smtplib.SMTP, subject='Usage alerts'):
+      self.host = host
+      self.port = port
+      self.sender = sender
+      self.addresses = dict(addresses or {})
+      self.adminAddress = adminAddress
+      self.poolSize = poolSize
+      self.timeout = timeout
+      self.connectionClass = connectionClass
+      self.subject = subject
+      self.lock = threading.Lock()
+      self.pending = collections.OrderedDict() # recipient -> [(resource, text)]
+      self.idle = []
+      self.sent = 0
+      self.failed = 0
+      self.undeliverable = 0
+      self.opened = 0
+      self.latencies = []
+
+   def queue(self, recipient, resource, text):
+      with self.lock:
+         self.pending.setdefault(recipient, []).append((resource, text))
+
+   def flush(self):
+      """Sends one digest to every recipient with queued alerts, and returns
+      the digests that couldn't be sent; see digest()."""
+      with self.lock:
+         (pending, self.pending) = (self.pending, collections.OrderedDict())
+      messages = []
+      for (recipient, alerts) in pending.items():
+         message = self.digest(recipient, alerts)
+         if message is None:
+            with self.lock:
+               self.undeliverable += 1
+         else:
+            messages.append(message)
+      if self.poolSize <= 1 or len(messages) <= 1:
+         results = [self.send(m) for m in messages]
+      else:
+         with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.poolSize, len(messages))) as pool:
+            results = list(pool.map(self.send, messages))
+      return [m for (m, ok) in zip(messages, results) if not ok]
+
+   def digest(self, recipient, alerts):
+      """Returns the message of alerts, a list of (resource, text), to the
+      recipient, or None if the recipient has no address.  The message keeps
+      the recipient in its recipient attribute."""
+      address = self.adminAddress if recipient is None else self.addresses.get(recipient)
+      if address is None:
+         return None
+      resources = []
+      for (resource, _) in alerts:
+         if resource not in resources:
+            resources.append(resource)
+      message = email.message.EmailMessage()
+      message['From'] = self.sender
+      message['To'] = address
+      message['Subject'] = "%s: %s" % (self.subject, ', '.join(resources))
+      message.set_content(''.join("%s\n" % text for (_, text) in alerts))
+      message.recipient = recipient
+      return message
+
+   def send(self, message):
+      """Sends message over a pooled connection and returns whether it was
+      accepted.  A server that can't be reached fails the message like one
+      that refuses it."""
+      conn = None
+      try:
+         conn = self._acquire()
+         start = time.perf_counter()
+         try:
+            conn.send_message(message)
+         except smtplib.SMTPServerDisconnected:
+            # The server closed the idle connection in the meantime.
+            self._discard(conn)
+            conn = None
+            conn = self._connect()
+            conn.send_message(message)
+      except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+         # The conversation is still fine; only this message failed.
+         self._release(conn)
+         with self.lock:
+            self.failed += 1
+         return False
+      except (smtplib.SMTPException, OSError):
+         if conn is not None:
+            self._discard(conn)
+         with self.lock:
+            self.failed += 1
+         return False
+      self._release(conn)
+      with self.lock:
+         self.sent += 1
+         self.latencies.append(time.perf_counter() - start)
+      return True
+
+   def stats(self):
+      """Returns a dictionary with the number of messages sent, failed and
+      undeliverable, the connections opened, and the average seconds it took
+      to send a message (None before the first)."""
+      with self.lock:
+         return {
+            'sent': self.sent,
+            'failed': self.failed,
+            'undeliverable': self.undeliverable,
+            'opened': self.opened,
+            'sendSeconds': sum(self.latencies) / len(self.latencies) if self.latencies else None,
+         }
+
+   def close(self):
+      """Ends the idle SMTP conversations."""
+      with self.lock:
+         (idle, self.idle) = (self.idle, [])
+      for conn in idle:
+         self._quit(conn)
+
+   def _acquire(self):
+      with self.lock:
+         if self.idle:
+            return self.idle.pop()
+      return self._connect()
+
+   def _connect(self):
+      conn = self.connectionClass(self.host, self.port, timeout=self.timeout)
+      with self.lock:
+         self.opened += 1
+      return conn
+
+   def _release(self, conn):
+      with self.lock:
+         if len(self.idle) < self.poolSize:
+            self.idle.append(conn)
+            return
+      self._quit(conn)
+
+   def _quit(self, conn):
+      try:
+         conn.quit()
+      except (smtplib.SMTPException, OSError):
+         conn.close()
+
+   def _discard(self, conn):
+      try:
+         conn.close()
+      except OSError:
+         pass
+
+class AsyncDelivery:
+   """Hands every flush() of alerts to a background thread, which delivers them
+   through the wrapped delivery.  At most maxQueued flushes wait for the
+   thread; flush() blocks while that many are waiting, so a slow mail server
+   holds back the evaluation instead of piling up alerts without bound.
+
+   Messages the wrapped delivery couldn't send are sent again with
+   exponential backoff: after backoff seconds, then twice that, and so on, up
+   to maxBackoff, retries times.  Other flushes are delivered in the
+   meantime.  Messages that still fail are appended to the mbox file
+   deadLetters.  If the wrapped delivery raises, the error is written to
+   stderr and the thread carries on with the next flush.  close() waits until
+   everything is delivered or given up."""
+
+   def __init__(self, delivery, maxQueued=100, retries=5, backoff=1.0, maxBackoff=60.0,
+         deadLetters='vz-dead-letters.mbox'):
+      self.delivery = delivery
+      self.retries = retries
+      self.backoff = backoff
+      self.maxBackoff = maxBackoff
+      self.deadLetters = deadLetters
+      self.lock = threading.Lock()
+      self.pending = []
+      self.batches = queue.Queue(maxQueued)
+      self.retrying = [] # heap of (due, sequence, attempt, message)
+      self.sequence = 0
+      self.flushes = 0
+      self.retried = 0
+      self.deadLettered = 0
+      self.blockedSeconds = 0.0
+      self.thread = threading.Thread(target=self._run, daemon=True)
+      self.thread.start()
+
+   def queue(self, recipient, resource, text):
+      self.pending.append((recipient, resource, text))
+
+   def flush(self):
+      """Queues the alerts for the background thread.  Failures end up in the
+      dead-letter file, so this always returns an empty list."""
+      (batch, self.pending) = (self.pending, [])
+      if batch:
+         start = time.monotonic()
+         self.batches.put(batch)
+         with self.lock:
+            self.flushes += 1
+            self.blockedSeconds += time.monotonic() - start
+      return []
+
+   def stats(self):
+      """Returns the wrapped delivery's stats, plus the number of flushes
+      queued, messages retried and dead-lettered, flushes waiting now, and the
+      seconds flush() was blocked in total."""
+      stats = dict(self.delivery.stats())
+      with self.lock:
+         stats.update({
+            'flushes': self.flushes,
+            'retried': self.retried,
+            'deadLettered': self.deadLettered,
+            'waiting': self.batches.qsize(),
+            'blockedSeconds': self.blockedSeconds,
+         })
+      return stats
+
+   def close(self):
+      """Delivers everything queued, retrying as needed, and closes the wrapped
+      delivery."""
+      self.batches.put(None)
+      self.thread.join()
+      self.delivery.close()
+
+   def _run(self):
+      closing = False
+      while not closing or self.retrying:
+         if closing:
+            # Only retries are left.
+            time.sleep(max(0.0, self.retrying[0][0] - time.monotonic()))
+         else:
+            timeout = max(0.0, self.retrying[0][0] - time.monotonic()) if self.retrying else None
+            try:
+               batch = self.batches.get(timeout=timeout)
+               if batch is None:
+                  closing = True # close() was called
+               else:
+                  self._deliver(batch)
+            except queue.Empty:
+               pass
+         while self.retrying and self.retrying[0][0] <= time.monotonic():
+            (_, _, attempt, message) = heapq.heappop(self.retrying)
+            with self.lock:
+               self.retried += 1
+            try:
+               sent = self.delivery.send(message)
+            except Exception:
+               self._report("Could not resend the mail to %s" % message['To'])
+               sent = False
+            if not sent:
+               self._failed(message, attempt + 1)
+
+   # Nothing the wrapped delivery raises may end the thread: the alerts were
+   # committed already, and once maxQueued batches were waiting, flush() would
+   # block for good.
+   def _deliver(self, batch):
+      try:
+         for alert in batch:
+            self.delivery.queue(*alert)
+         failed = self.delivery.flush()
+      except Exception:
+         self._report("Lost a batch of %d alerts" % len(batch))
+         return
+      for message in failed:
+         self._failed(message, 0)
+
+   def _report(self, what):
+      sys.stderr.write("%s:\n%s" % (what, traceback.format_exc()))
+
+   def _failed(self, message, attempt):
+      if attempt >= self.retries:
+         with self.lock:
+            self.deadLettered += 1
+         try:
+            box = mailbox.mbox(self.deadLetters)
+            box.lock()
+            try:
+               box.add(message)
+               box.flush()
+            finally:
+               box.unlock()
+               box.close()
+         except Exception:
+            self._report("Could not keep the mail to %s in %s" % (message['To'], self.deadLetters))
+         return
+      self.sequence += 1
+      delay = min(self.maxBackoff, self.backoff * 2 ** attempt)
+      heapq.heappush(self.retrying, (time.monotonic() + delay, self.sequence, attempt, message))
@@ -1,8 +1,15 @@
+import functools
 from SharedUsageAlerter import Warn
 
-class OutputFormatter:
-   def __init__(self, resource):
-      self.resourceForms = {
+"""OutputFormatter words the warnings for the account admin and the users.
+The texts live in LOCALES, one table per language, as templates with the
+resource's name and forms left open.  Each (resource, audience, warning code,
+locale) text is filled in once per process and shared by every formatter, so
+formatting the alerts of many accounts doesn't rebuild the same strings."""
+
+LOCALES = {
+   'en': {
+      'resourceForms': {
          'voice'  : {
                       'infinitive': 'to call',
                       'gerund': 'calling',
@@ -15,18 +22,76 @@ class OutputFormatter:
                       'infinitive': 'to use data',
                       'gerund': 'using data',
                     },
-      }
-
-      self.warningAdminTextMap = {
-         Warn.Global.Overage  : "An account overage for %s has occurred!" % resource,
-         Warn.Global.Overuse  : "An account overage for %s is predicted.  Be careful." % resource,
-         Warn.Global.Underuse : "An underuse for %s is predicted.  Rock on." % resource,
-         Warn.Global.Ok       : "All is ok for %s." % resource,
-      }
-
-      self.warningUserTextMap = {
-         Warn.Local.Overage      : "Please stop %s; you're over your %s quota!" % (self.resourceForms[resource]['gerund'], resource),
-         Warn.Local.Overuse      : "If you keep %s at your rate, you may exceed the quota." % (self.resourceForms[resource]['gerund']),
-         Warn.Local.Underuse     : "You're way under your %s quota. Feel free %s more.  Use it or lose it." % (resource, self.resourceForms[resource]['infinitive']),
+      },
+      'admin': {
+         Warn.Global.Overage  : "An account overage for {resource} has occurred!",
+         Warn.Global.Overuse  : "An account overage for {resource} is predicted.  Be careful.",
+         Warn.Global.Underuse : "An underuse for {resource} is predicted.  Rock on.",
+         Warn.Global.Ok       : "All is ok for {resource}.",
+      },
+      'user': {
+         Warn.Local.Overage      : "Please stop {gerund}; you're over your {resource} quota!",
+         Warn.Local.Overuse      : "If you keep {gerund} at your rate, you may exceed the quota.",
+         Warn.Local.Underuse     : "You're way under your {resource} quota. Feel free {infinitive} more.  Use it or lose it.",
          Warn.Local.Ok           : "All is ok.",
-      }
+      },
+      # How much a user may use per day until the end of the billing cycle.
+      'daily': {
+         'voice'  : "you can call up to {:.0f} minutes/day until the end of the billing cycle.",
+         'SMS'    : "you can send up to {:.1f} texts/day until the end of the billing cycle.",
+         'data'   : "you can use up to {:.2f} GB/day until the end of the billing cycle.",
+      },
+   },
+}
+
+@functools.lru_cache(maxsize=None)
+def template(resource, audience, code, locale='en'):
+   """Returns the text of a warning code about resource for the audience,
+   'admin' or 'user'."""
+   table = LOCALES[locale]
+   return table[audience][code].format(resource=resource, **table['resourceForms'][resource])
+
+@functools.lru_cache(maxsize=None)
+def _textMap(resource, audience, locale):
+   return dict((code, template(resource, audience, code, locale)) for code in LOCALES[locale][audience])
+
+class Rendered:
+   """The texts of one user's status: the warning in cooperative and in
+   independent mode, and how much the user may use per day (None if the
+   status has no allowance)."""
+   __slots__ = ('name', 'status', 'cooperative', 'independent', 'daily')
+
+   def __init__(self, name, status, cooperative, independent, daily):
+      self.name = name
+      self.status = status
+      self.cooperative = cooperative
+      self.independent = independent
+      self.daily = daily
+
+class OutputFormatter:
+   def __init__(self, resource, locale='en'):
+      self.resource = resource
+      self.locale = locale
+      self.resourceForms = LOCALES[locale]['resourceForms']
+      # Shared by all formatters of the resource; don't modify.
+      self.warningAdminTextMap = _textMap(resource, 'admin', locale)
+      self.warningUserTextMap = _textMap(resource, 'user', locale)
+      self.dailyFormat = LOCALES[locale]['daily'][resource].format
+
+   def render(self, statuses, health=Warn.Global.Ok):
+      """Returns a Rendered for every (name, status) of statuses, as given by
+      Alerter.iterStatuses().  health is the account's health; in cooperative
+      mode, an account-wide overage or overuse overrides the user's own
+      warning."""
+      accountWide = None
+      if health == Warn.Global.Overage or health == Warn.Global.Overuse:
+         accountWide = self.warningAdminTextMap[health]
+      userTexts = self.warningUserTextMap
+      daily = self.dailyFormat
+      out = []
+      for (name, status) in statuses:
+         independent = userTexts[status['warning-code']]
+         maxDaily = status.get('max-daily-use-to-eobc')
+         out.append(Rendered(name, status, accountWide or independent, independent,
+            daily(maxDaily) if maxDaily is not None and maxDaily > 0 else None))
+      return out
@@ -0,0 +1,80 @@
+#!/bin/env python3
+
+"""PollPlanner decides how soon each line has to be scraped again.  A line
+far inside the usage envelope won't change its warning for hours, while one
+right at the edge of Overuse may cross it before the next poll; polling both
+at the same cadence wastes most of the requests on the first kind.
+
+The planner projects every line's usage forward at its burn rate, the one
+the Alerter's end-of-cycle prediction uses: its forecaster's rate, if it has
+one for the line, or else the average rate so far.  It looks for the
+first poll at which the projected warning differs from the current one.  That
+poll is when the line is due.  The scan goes in steps of tick seconds, the
+poll interval of the caller, up to maxInterval, so a line is never checked
+later than a fixed tick cadence would have noticed the change, and never less
+often than every maxInterval seconds.
+
+Real usage comes in bursts, so the projection assumes the line may burn burst
+times faster than its average so far.  The account
+health depends on every line, so when it is projected to change, all of the
+account's lines are due then.  The end of the billing cycle counts as a
+change as well."""
+
+from SharedUsageAlerter import Alerter
+
+class PollPlanner:
+   def __init__(self, tick, maxInterval, burst=2.0):
+      self.tick = tick
+      self.steps = max(1, int(maxInterval // tick))
+      self.burst = burst
+
+   def plan(self, alerter, cycleSeconds):
+      """Returns a dictionary from every user of alerter, an Alerter, to the
+      seconds after its usage was read at which it should be read again.
+      cycleSeconds is the length of the billing cycle."""
+      bf = alerter.billingFraction()
+      gq = alerter.globalQuota()
+      envelope = alerter.envelope
+      # The billing fraction and envelope now and at every step.
+      points = [(bf, envelope.maxPct(bf), envelope.minPct(bf))]
+      for k in range(1, self.steps + 1):
+         pbf = bf + k * self.tick / cycleSeconds
+         if pbf >= 1:
+            break
+         points.append((pbf, envelope.maxPct(pbf), envelope.minPct(pbf)))
+      ending = len(points) if len(points) <= self.steps else None
+
+      rates = dict((name, self._rate(alerter, name, line.used)) for (name, line) in alerter.lines.items())
+      accountRate = None if None in rates.values() else sum(rates.values())
+      accountDue = self._due(points, ending, bf, alerter.globalUsed(), accountRate,
+         lambda pbf, gu, maxPct, minPct: Alerter._globalWarning(pbf, gq, gu, maxPct, minPct))
+      plan = {}
+      for (name, line) in alerter.lines.items():
+         lq = line.quota
+         due = self._due(points, ending, bf, line.used, rates[name],
+            lambda pbf, lu, maxPct, minPct: Alerter._localWarning(pbf, gq, lq, lu, maxPct, minPct))
+         plan[name] = min(due, accountDue) * self.tick
+      return plan
+
+   def _rate(self, alerter, name, used):
+      """Returns the burn rate per billing cycle of a user, or None."""
+      if alerter.forecaster is not None:
+         rate = alerter.forecaster.rate(name)
+         if rate is not None:
+            return rate
+      bf = alerter.billingFraction()
+      return used / bf if bf > 0 else None
+
+   def _due(self, points, ending, bf, used, rate, warning):
+      """Returns the first step at which warning(bf, used, maxPct, minPct) of
+      the usage projected at rate differs from the current one, or the number
+      of steps if it doesn't."""
+      if rate is None:
+         # No rate to project from yet.
+         return 1
+      rate *= self.burst
+      now = warning(bf, used, points[0][1], points[0][2])
+      for (k, (pbf, maxPct, minPct)) in enumerate(points[1:], 1):
+         if warning(pbf, used + rate * (pbf - bf), maxPct, minPct) != now:
+            return k
+      return ending if ending is not None else self.steps
@@ -0,0 +1,105 @@
+#!/bin/env python3
+
+import collections
+import threading
+import time
+import Snapshot
+
+"""ResponseCache remembers what VerizonScraper fetched, so that a later run
+only re-fetches what has gone stale.  Entries are keyed by (account, line,
+resource), where resource is 'sms' or 'data' for a line's overviews, or
+'lines' (with line None) for the account's set of phone numbers.
+
+Every entry lives for ttl seconds, unless expireAfter() gave it a lifetime of
+its own; that lasts until the entry is replaced.  The cache holds at most maxEntries
+entries; when it's full, the least recently used entry is evicted.  The cache
+counts hits, misses, expired entries and evictions; see stats()."""
+class ResponseCache:
+   def __init__(self, ttl=3600, maxEntries=100000, clock=time.time):
+      self.ttl = ttl
+      self.maxEntries = maxEntries
+      self.clock = clock
+      self.lock = threading.Lock()
+      self.entries = collections.OrderedDict() # key -> (fetchedAt, value)
+      self.lifetimes = {} # key -> seconds, where they differ from ttl
+      self.hits = 0
+      self.misses = 0
+      self.expired = 0
+      self.evictions = 0
+
+   def get(self, account, line, resource):
+      """Returns the cached value, or None if it's missing or expired."""
+      key = (account, line, resource)
+      with self.lock:
+         entry = self.entries.get(key)
+         if entry is None:
+            self.misses += 1
+            return None
+         if self.clock() - entry[0] > self.lifetimes.get(key, self.ttl):
+            self.misses += 1
+            self.expired += 1
+            return None
+         self.entries.move_to_end(key)
+         self.hits += 1
+         return entry[1]
+
+   def peek(self, account, line, resource):
+      """Returns (fetchedAt, value) even if the entry has expired, or None.
+      Doesn't count as a hit or miss."""
+      with self.lock:
+         return self.entries.get((account, line, resource))
+
+   def put(self, account, line, resource, value, fetchedAt=None):
+      key = (account, line, resource)
+      with self.lock:
+         self.entries[key] = (self.clock() if fetchedAt is None else fetchedAt, value)
+         self.entries.move_to_end(key)
+         self.lifetimes.pop(key, None)
+         while len(self.entries) > self.maxEntries:
+            (evicted, _) = self.entries.popitem(last=False)
+            self.lifetimes.pop(evicted, None)
+            self.evictions += 1
+
+   def expireAfter(self, account, line, resource, seconds):
+      """Makes the entry expire seconds after it was fetched instead of after
+      ttl.  Does nothing if there is no such entry."""
+      key = (account, line, resource)
+      with self.lock:
+         if key in self.entries:
+            self.lifetimes[key] = seconds
+
+   def __len__(self):
+      return len(self.entries)
+
+   def stats(self):
+      """Returns a dictionary of hits, misses (including expired entries),
+      expired, evictions, and the hit rate (None before the first lookup)."""
+      with self.lock:
+         lookups = self.hits + self.misses
+         return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hitRate': self.hits / lookups if lookups else None,
+         }
+
+   # PERSISTENCE
+   # Only the entries are saved, without their own lifetimes, oldest first, so that loading them keeps the
+   # LRU order.  The file is a Snapshot, which raises Snapshot.Error if it
+   # can't read a file.
+
+   def save(self, path):
+      with self.lock:
+         entries = [(k, fetchedAt, v) for (k, (fetchedAt, v)) in self.entries.items()]
+      Snapshot.write(path, entries)
+
+   @classmethod
+   def load(cls, path, ttl=3600, maxEntries=100000, clock=time.time):
+      cache = cls(ttl, maxEntries, clock)
+      with Snapshot.SnapshotReader(path) as snapshot:
+         for ((account, line, resource), fetchedAt, v) in snapshot:
+            cache.entries[(account, line, resource)] = (fetchedAt, v)
+         while len(cache.entries) > maxEntries:
+            cache.entries.popitem(last=False)
+      return cache
@@ -0,0 +1,103 @@
+#!/bin/env python3
+
+import concurrent.futures
+import http.client
+import threading
+import time
+from HttpSession import HostLimiter
+from VerizonScraper import VerizonScraper, Error
+
+"""ScrapeScheduler scrapes many Verizon accounts at once.  Every account gets
+its own scraper with its own HttpSession, so cookies never leak between
+accounts, and up to workers accounts are scraped in parallel threads.  All
+sessions share one HostLimiter, so no matter how many accounts run, every
+Verizon host sees at most ratePerHost requests per second and maxPerHost
+requests at a time.
+
+run() yields every account as soon as it's done, so the caller can evaluate
+its alerts while the other accounts are still being scraped:
+   scheduler = ScrapeScheduler([('user1', 'pass1'), ('user2', 'pass2')])
+   for (username, vz, error) in scheduler.run():
+      ...
+
+To keep the accounts' sessions, and their open connections, for the next
+run, pass a dictionary as sessions; it maps usernames to their HttpSession.
+
+Other keyword arguments are passed on to every scraper, e.g. a shared
+ResponseCache (which is keyed by account) or a SessionStore."""
+class ScrapeScheduler:
+   def __init__(self, accounts, workers=4, ratePerHost=10, burst=5, maxPerHost=8,
+         scraperClass=VerizonScraper, sessions=None, **scraperArgs):
+      self.accounts = list(accounts)
+      self.sessions = sessions
+      self.workers = workers
+      self.limiter = HostLimiter(ratePerHost, burst, maxPerHost)
+      self.scraperClass = scraperClass
+      self.scraperArgs = scraperArgs
+      self.lock = threading.Lock()
+      self.scraped = 0
+      self.failed = 0
+      self.requests = 0
+      self.elapsed = 0.0
+
+   def run(self):
+      """Scrapes all accounts and yields (username, scraper, None) for every
+      account that was scraped, or (username, None, error) for every account
+      that failed, in the order they finish."""
+      start = time.perf_counter()
+      pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+      futures = {}
+      try:
+         for (username, password) in self.accounts:
+            futures[pool.submit(self._scrape, username, password)] = username
+         for f in concurrent.futures.as_completed(futures):
+            try:
+               result = (futures[f], f.result(), None)
+            except (Error, http.client.HTTPException, OSError) as e:
+               result = (futures[f], None, e)
+            with self.lock:
+               if result[2] is None:
+                  self.scraped += 1
+               else:
+                  self.failed += 1
+            yield result
+      finally:
+         # If the caller stops early, don't start the remaining accounts.
+         for f in futures:
+            f.cancel()
+         pool.shutdown(wait=True)
+         self.elapsed = time.perf_counter() - start
+
+   def stats(self):
+      """Returns a dictionary with the number of accounts scraped and failed,
+      the requests sent, how many of them waited for the limiter and for how
+      long, and the seconds the last run() took."""
+      stats = self.limiter.stats()
+      with self.lock:
+         stats.update({
+            'scraped': self.scraped,
+            'failed': self.failed,
+            'requests': self.requests,
+            'elapsed': self.elapsed,
+         })
+      return stats
+
+   def _scrape(self, username, password):
+      session = None
+      if self.sessions is not None:
+         session = self.sessions.get(username)
+      if session is None:
+         session = self.scraperClass.newSession()
+      # A kept session follows this scheduler's limits.
+      session.limiter = self.limiter
+      before = session.stats()['requests']
+      try:
+         return self.scraperClass(username, password, session=session, **self.scraperArgs)
+      finally:
+         if self.sessions is not None:
+            with self.lock:
+               self.sessions[username] = session
+         else:
+            session.close()
+         with self.lock:
+            self.requests += session.stats()['requests'] - before
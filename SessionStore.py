@@ -0,0 +1,71 @@
+#!/bin/env python3
+
+import hashlib
+import http.cookiejar
+import os
+
+"""SessionStore keeps VerizonScraper's login between runs.  For every account
+it saves the session cookies and the phone numbers found at login into a
+directory, one pair of files per account.  The files hold a live login, so
+they are readable by the owner only.  Passwords are never stored."""
+class SessionStore:
+   def __init__(self, directory):
+      self.directory = directory
+
+   def load(self, account, cookieJar):
+      """Adds the saved cookies of the account to cookieJar and returns the
+      saved set of phone numbers, or returns None if nothing is saved."""
+      (cookiePath, linesPath) = self._paths(account)
+      if not (os.access(cookiePath, os.R_OK) and os.access(linesPath, os.R_OK)):
+         return None
+      saved = http.cookiejar.LWPCookieJar(cookiePath)
+      try:
+         saved.load(ignore_discard=True)
+      except (OSError, http.cookiejar.LoadError):
+         return None
+      for c in saved:
+         cookieJar.set_cookie(c)
+      with open(linesPath, 'r') as f:
+         return set(l.strip() for l in f if l.strip())
+
+   def save(self, account, cookieJar, phoneNumSet):
+      os.makedirs(self.directory, mode=0o700, exist_ok=True)
+      # makedirs leaves an existing directory's mode alone.
+      os.chmod(self.directory, 0o700)
+      (cookiePath, linesPath) = self._paths(account)
+      saved = http.cookiejar.LWPCookieJar(cookiePath)
+      for c in cookieJar:
+         saved.set_cookie(c)
+      # Session cookies are exactly what we want to keep.  This is what
+      # LWPCookieJar.save() writes, but that creates the file with the umask.
+      self._write(cookiePath, "#LWP-Cookies-2.0\n" + saved.as_lwp_str(ignore_discard=True))
+      self._write(linesPath, ''.join(phoneNum + '\n' for phoneNum in sorted(phoneNumSet)))
+
+   def forget(self, account):
+      for path in self._paths(account):
+         if os.access(path, os.F_OK):
+            os.remove(path)
+
+   def _paths(self, account):
+      name = hashlib.sha1(account.encode('utf-8')).hexdigest()
+      base = os.path.join(self.directory, name)
+      return (base + '.cookies', base + '.lines')
+
+   # Writes text to a file only the owner can read, which then replaces path,
+   # so a reader never sees it half written or readable by others.
+   def _write(self, path, text):
+      tmp = path + '.tmp'
+      fd = os.open(tmp, os.O_CREAT | os.O_WRONLY | os.O_TRUNC, 0o600)
+      try:
+         # A leftover file keeps the mode it had.
+         os.fchmod(fd, 0o600)
+         with os.fdopen(fd, 'w') as f:
+            fd = None
+            f.write(text)
+         os.replace(tmp, path)
+      except Exception:
+         if fd is not None:
+            os.close(fd)
+         if os.access(tmp, os.F_OK):
+            os.remove(tmp)
+         raise
@@ -39,14 +39,40 @@ Setup steps per resource (voice minutes, texts, data):
 4) Forward the warning to the user by email or some other way.
 5) Schedule the whole thing to run automatically as often as you please.
 
-The meat of this module is in the functions _getMaxAllowablePctUsedOfMonthlyQuota
-and _getMinPctUsedConsideredUnderuse.  They determine the upper and lower bounds
+The meat of this module is in the functions maxAllowablePctUsedOfMonthlyQuota
+and minPctUsedConsideredUnderuse.  They determine the upper and lower bounds
 of acceptable (non-warnable) usage.  I determined both of them by plotting on
 paper the path of acceptable usage.  Tweak it as needed.  Before tweaking it, I
 recommend reading through the scenarios in test-sua.py and adjusting it to suit
 your needs.  That'll ensure that your tweaks in this module work as you intend.
+
+Alerter doesn't call these functions directly.  They are compiled once into the
+lookup tables of DEFAULT_ENVELOPE, which all Alerters share.  To use your own
+curves without editing this module, build an Envelope and pass it to Alerter.
+
+Alerter predicts the usage at the end of the billing cycle by extrapolating the
+usage so far in a straight line.  That is noisy early in the cycle and slow to
+notice a change of habits.  A BurnRateForecaster, fed with the usage every
+time it's read, follows each user's recent rate instead; pass it to Alerter to
+use its predictions.
+
+Alerter.predictOverageProbability() goes beyond the warnings: it simulates
+many ways the rest of the billing cycle may go, and tells how likely each
+user and the account are to end up over their quota.  BatchAlerter does the
+same for a whole fleet of accounts within a time budget.
+
+Alerter.suggestRebalance() looks for a better way to split the individual
+quotas: one user heading for Underuse may have quota to spare that another,
+heading for Overuse, needs.
 """
 
+import bisect
+import functools
+import operator
+import random
+import time
+from array import array
+
 class Error(BaseException):
    pass
 
@@ -104,6 +130,301 @@ class Warn:
          else:
             raise Error
 
+# An Overuse alert will be issued if the current percent used of the monthly
+# quota is above the percentage returned by this function.
+def maxAllowablePctUsedOfMonthlyQuota(bf):
+   return bf/2 + 0.5
+
+# An Underuse alert will be issued if the current percent used of the monthly
+# quota is below the percentage returned by this function.  This function can
+# be used only if the user is not already in Overuse mode.
+def minPctUsedConsideredUnderuse(bf):
+   startFrac = 0.7
+   if bf < startFrac:
+      return 1 # should never trigger
+   else:
+      def pctChg(x, y):
+         return (x-y)/y
+      # Range between [50%, 70%].
+      return pctChg(1, bf) * 0.2 + 0.5
+
+class Curve:
+   """A function of the billing fraction, compiled into a lookup table with
+   one entry per step of the billing cycle.  The default of 31*24 steps is one
+   entry per hour of the longest billing cycle.  Between two entries the value
+   is linearly interpolated, or, without interpolation, taken from the entry at
+   the start of the step.
+
+   A step over which the function jumps, like minPctUsedConsideredUnderuse
+   does where Underuse starts, can't be interpolated.  Every step whose
+   midpoint is off the interpolation by more than tolerance is marked when
+   the table is compiled, and the function itself is called there."""
+
+   def __init__(self, fn, steps=31*24, interpolate=True, tolerance=1e-6):
+      self.fn = fn
+      self.steps = steps
+      self.interpolate = interpolate
+      self.table = array('d', (fn(i / steps) for i in range(steps + 1)))
+      self.exact = bytearray(abs(fn((i + 0.5) / steps) - (self.table[i] + self.table[i + 1]) / 2) > tolerance
+         for i in range(steps))
+
+   def __call__(self, bf):
+      x = bf * self.steps
+      i = int(x)
+      if i >= self.steps:
+         return self.table[self.steps]
+      if i < 0:
+         return self.table[0]
+      if self.exact[i]:
+         return self.fn(bf)
+      if not self.interpolate:
+         return self.table[i]
+      lo = self.table[i]
+      return lo + (self.table[i + 1] - lo) * (x - i)
+
+class Envelope:
+   """The band of acceptable usage: the maximum percent of the quota that may
+   be used by some point of the billing cycle before it's Overuse, and the
+   minimum below which it's Underuse.  Plain functions are compiled into
+   Curves."""
+
+   def __init__(self, maxPct=maxAllowablePctUsedOfMonthlyQuota, minPct=minPctUsedConsideredUnderuse, steps=31*24, interpolate=True):
+      self.maxPct = maxPct if isinstance(maxPct, Curve) else Curve(maxPct, steps, interpolate)
+      self.minPct = minPct if isinstance(minPct, Curve) else Curve(minPct, steps, interpolate)
+
+DEFAULT_ENVELOPE = Envelope()
+
+class _Burn:
+   __slots__ = ('bf', 'used', 'rate', 'variance')
+
+   def __init__(self, bf, used, rate):
+      self.bf = bf
+      self.used = used
+      self.rate = rate
+      self.variance = None
+
+class BurnRateForecaster:
+   """Follows the burn rate of every user: how much of the resource the user
+   goes through per billing cycle.  Every update() with a newer usage reading
+   moves the rate towards the rate since the last reading, by an exponentially
+   weighted moving average whose weights halve every halfLife of a billing
+   cycle.  The same average follows how much the usage strays from that rate:
+   the variance of the usage over a whole cycle.  An update takes constant
+   time and the forecaster keeps only the last reading, the rate and the
+   variance of every user.
+
+   The first reading of a cycle starts the rate at the average so far, the
+   same rate Alerter's straight line uses.  A reading at an earlier point of
+   the cycle than the last one, with less usage, starts a new cycle; without
+   less usage it's an old reading and is ignored, as is a reading at the same
+   point as the last one."""
+
+   def __init__(self, halfLife=0.1):
+      self.halfLife = halfLife
+      self.lines = {} # name -> _Burn
+
+   def update(self, name, bf, used):
+      """Adds the reading that the user had used used at billing fraction bf.
+      bf should be exact rather than rounded to the day."""
+      burn = self.lines.get(name)
+      if burn is None or (bf < burn.bf and used < burn.used):
+         self.lines[name] = _Burn(bf, used, used / bf if bf > 0 else None)
+         return
+      if bf <= burn.bf:
+         return
+      rate = max(0.0, (used - burn.used) / (bf - burn.bf))
+      if burn.rate is None:
+         burn.rate = rate
+      else:
+         weight = 1 - 0.5 ** ((bf - burn.bf) / self.halfLife)
+         # Over a stretch dbf, usage strays from the rate by a variance of
+         # variance*dbf.
+         strayed = used - burn.used - burn.rate * (bf - burn.bf)
+         variance = strayed * strayed / (bf - burn.bf)
+         if burn.variance is None:
+            burn.variance = variance
+         else:
+            burn.variance += weight * (variance - burn.variance)
+         burn.rate += weight * (rate - burn.rate)
+      burn.bf = bf
+      burn.used = used
+
+   def rate(self, name):
+      """Returns the user's burn rate per billing cycle, or None if it isn't
+      known yet."""
+      burn = self.lines.get(name)
+      return None if burn is None else burn.rate
+
+   def variance(self, name):
+      """Returns the variance of the user's usage over a billing cycle, or None
+      if it isn't known yet."""
+      burn = self.lines.get(name)
+      return None if burn is None else burn.variance
+
+   def usedEobc(self, name, bf, used):
+      """Returns the predicted usage by the end of the billing cycle of a user
+      who has used used by billing fraction bf, or None if the user's rate
+      isn't known yet."""
+      burn = self.lines.get(name)
+      if burn is None or burn.rate is None:
+         return None
+      return used + burn.rate * max(0.0, 1 - bf)
+
+# Without a forecaster's variance, usage is taken to stray as if every day of
+# a 30-day cycle could just as well see none or twice its mean usage.
+_DAYS = 30
+
+class _OverageSimulation:
+   """Simulates the rest of the billing cycle of one account, many paths at a
+   time.  On every path, every user's usage grows by a gamma-distributed
+   amount with the mean and variance of the user's rate over the rest of the
+   cycle.  A sum of independent gamma-distributed days is gamma-distributed
+   itself, so a path takes one draw per user, however many days are left.
+   The paths of one user are drawn together and added to the account's
+   totals column by column."""
+
+   def __init__(self, bf, gq, users, forecaster=None):
+      # users is a sequence of (name, used, quota).
+      remaining = max(0.0, 1 - bf)
+      self.gq = gq
+      self.base = 0.0 # the account's usage by the end, without the random part
+      self.growing = [] # (user index, headroom, shape, scale)
+      self.hits = {} # user index -> paths over the limit, of the growing users
+      self.fixed = [] # user index -> probability, of the others
+      for (j, (name, used, quota)) in enumerate(users):
+         rate = variance = None
+         if forecaster is not None:
+            rate = forecaster.rate(name)
+            variance = forecaster.variance(name)
+         if rate is None:
+            # Nothing to extrapolate from on the first day.
+            rate = used / bf if bf > 0 else 0.0
+            variance = None
+         if variance is None:
+            variance = rate * rate / _DAYS
+         limit = quota if quota is not None else gq
+         mean = rate * remaining
+         self.base += used
+         if mean > 0 and variance > 0:
+            self.growing.append((j, float('inf') if limit is None else limit - used,
+               mean * mean / (variance * remaining), variance / rate))
+            self.hits[j] = 0
+            self.fixed.append(None)
+         else:
+            self.base += mean
+            self.fixed.append(None if limit is None else float(used + mean > limit))
+      self.limited = [quota is not None or gq is not None for (_, _, quota) in users]
+      self.accountHits = 0
+      self.paths = 0
+
+   def run(self, paths, gamma):
+      """Adds paths more paths, drawn with gamma, a gammavariate()."""
+      totals = [self.base] * paths
+      for (j, headroom, shape, scale) in self.growing:
+         grown = [gamma(shape, scale) for _ in range(paths)]
+         self.hits[j] += sum(g > headroom for g in grown)
+         totals = list(map(operator.add, totals, grown))
+      if self.gq is not None:
+         self.accountHits += sum(t > self.gq for t in totals)
+      self.paths += paths
+
+   def userProbability(self, j):
+      """Returns the probability that user j ends up over the user's quota, or
+      over the account's if the user has none, or None if neither exists."""
+      if not self.limited[j]:
+         return None
+      if j in self.hits:
+         return self.hits[j] / self.paths if self.paths else None
+      return self.fixed[j]
+
+   def accountProbability(self):
+      """Returns the probability that the account ends up over its quota, or
+      None if it has none.  Both return None before the first path where the
+      outcome is random."""
+      if self.gq is None:
+         return None
+      if not self.growing:
+         return float(self.base > self.gq)
+      return self.accountHits / self.paths if self.paths else None
+
+# Paths are simulated at most this many at a time.  With a time budget, the
+# first round is a single path, to learn how long a path takes, and the later
+# rounds are sized to what is left of the budget.
+_BATCH = 256
+
+def _simulate(simulations, paths, budget, seed, start):
+   """Runs paths paths of every simulation, in rounds.  With a budget, in
+   seconds since start, a time.perf_counter(), it stops once the budget is
+   spent, even partway through a round, so the simulations may end up with
+   different numbers of paths, or none; the first one always gets a path."""
+   gamma = random.Random(seed).gammavariate
+   done = 0
+   n = min(_BATCH if budget is None else 1, paths)
+   while n > 0:
+      for simulation in simulations:
+         simulation.run(n, gamma)
+         if budget is not None and time.perf_counter() - start >= budget:
+            return
+      done += n
+      n = min(_BATCH, paths - done)
+      if budget is not None:
+         elapsed = time.perf_counter() - start
+         n = min(n, max(1, int((budget - elapsed) / (elapsed / done))))
+
+def _checkPaths(paths):
+   if paths < 1:
+      raise Error("Can't simulate %r paths" % paths)
+
+class LineUsage:
+   """Usage record of one user of a shared resource.  This is the compact
+   equivalent of the {'quota': ..., 'used': ...} dictionary that Alerter
+   accepts; a quota of None means there is no individual quota."""
+   __slots__ = ('quota', 'used')
+
+   def __init__(self, used, quota=None):
+      self.used = used
+      self.quota = quota
+
+   @classmethod
+   def adapt(cls, u):
+      """Returns u if it is already a LineUsage, otherwise converts a usage
+      dictionary."""
+      if isinstance(u, LineUsage):
+         return u
+      return cls(u['used'], u['quota'] if 'quota' in u else None)
+
+   # A record equals the usage dictionary it stands for, too.
+   def __eq__(self, other):
+      if isinstance(other, dict) and 'used' in other:
+         other = LineUsage.adapt(other)
+      return isinstance(other, LineUsage) and self.used == other.used and self.quota == other.quota
+
+   def __repr__(self):
+      return "LineUsage(used=%r, quota=%r)" % (self.used, self.quota)
+
+class AccountUsage:
+   """Usage snapshot of one account for one resource.  This is the compact
+   equivalent of Alerter's input dictionary; usage maps user names to
+   LineUsage records."""
+   __slots__ = ('billingFrac', 'globalQuota', 'usage')
+
+   def __init__(self, billingFrac, globalQuota, usage):
+      self.billingFrac = billingFrac
+      self.globalQuota = globalQuota
+      self.usage = usage
+
+def _waterLevel(caps, amount):
+   """Returns the level L at which the sum of min(cap, L) over caps is amount,
+   which must be between 0 and the sum of caps."""
+   caps = sorted(caps)
+   below = 0.0 # the sum of the caps under the level
+   for (i, cap) in enumerate(caps):
+      # With the level at cap, caps[i:] each hold cap.
+      if below + cap * (len(caps) - i) >= amount:
+         return (amount - below) / (len(caps) - i)
+      below += cap
+   return caps[-1] if caps else 0.0
+
 class Alerter:
    """This is the primary class of SharedUsageAlerter.  It takes the usage
    information, calculates various interesting things about it, and determines
@@ -126,26 +447,50 @@ class Alerter:
    #   billing cycle that has completed.  The first day of the cycle is 0.
    # * "user-name" is a string that uniquely identifies every user.
    #   I have the user's first name in mind.
-   def __init__(self, d):
-      self.bf = float(d['billing-frac'])
-      self.gq = d['global-quota'] if 'global-quota' in d else None
-      self.u = d['usage']
+   # Instead of the dictionary, Alerter also takes an AccountUsage, and the
+   # per-user dictionaries may be LineUsage records.  Records are the native
+   # form; dictionaries are converted to them.
+   # The optional envelope is an Envelope; the default is DEFAULT_ENVELOPE.
+   # The optional forecaster is a BurnRateForecaster, or anything with its
+   # usedEobc() and rate(), that predicts the usage of users by the end of the billing
+   # cycle.  Users it doesn't know are extrapolated in a straight line.
+   def __init__(self, d, envelope=None, forecaster=None):
+      self.envelope = envelope if envelope is not None else DEFAULT_ENVELOPE
+      self.forecaster = forecaster
+      if isinstance(d, AccountUsage):
+         self.bf = float(d.billingFrac)
+         self.gq = d.globalQuota
+         usage = d.usage
+      else:
+         self.bf = float(d['billing-frac'])
+         self.gq = d['global-quota'] if 'global-quota' in d else None
+         usage = d['usage']
+      # Only the records are kept: usage as it is if it holds records already,
+      # else converted once.
+      if all(isinstance(u, LineUsage) for u in usage.values()):
+         self.lines = usage
+      else:
+         self.lines = dict((name, LineUsage.adapt(u)) for (name, u) in usage.items())
       # Derived
-      self.gu = sum(u['used'] for u in self.u.values())
+      self.gu = sum(l.used for l in self.lines.values())
 
       # If there's at least one individual quota, then verify that the sum of
       # all available individual quotas doesn't exceed the account quota.
       doCheck = True
       indivSum = 0
-      for u in self.u.values():
-         if 'quota' not in u:
+      for l in self.lines.values():
+         lq = l.quota
+         if lq is None:
             doCheck = False
             break
          else:
-            indivSum += u['quota']
-      if doCheck and indivSum > self.gq:
+            indivSum += lq
+      if doCheck and self.gq is not None and indivSum > self.gq:
          raise Error("Individual quotas are larger than the nominal account quota")
 
+      # Cached by accountHealth().
+      self.health = None
+
    # ACCESSORS
 
    def billingFraction(self):
@@ -153,8 +498,9 @@ class Alerter:
       return self.bf
 
    def usage(self):
-      """Returns the original 'usage' element."""
-      return self.u
+      """Returns the 'usage' element as LineUsage records: the original one if
+      it held records, else its conversion."""
+      return self.lines
 
    def globalQuota(self):
       """Returns a number or None."""
@@ -165,64 +511,105 @@ class Alerter:
       return self.gu
 
    def globalUsagePrediction(self):
-      return self._eobcUsagePrediction(self.gu)
+      if self.forecaster is None:
+         return self._eobcUsagePrediction(self.gu)
+      return sum(self._eobcUsagePrediction(l.used, name) for (name, l) in self.lines.items())
 
    # WARNINGS
    def userStatus(self, name):
-      def getWarningForOneUser(lq, lu):
-         if lq is None:
-            # Only the global quota matters.
-            if self.gq is None:
-               return Warn.Local.Ok
-            if lu > self.gq:
-               return Warn.Local.Overage
-            localUsagePctOfQuota = lu / self.gq
-            if localUsagePctOfQuota > self._getMaxAllowablePctUsedOfMonthlyQuota():
-               return Warn.Local.Overuse
-            # In cooperative mode, we should not alert anyone of underuse.
-            # This is because it's possible for everyone to be under global
-            # quota yet cause an account overage.
-         else:
-            # This user has his own quota.
-            if lu > lq:
-               return Warn.Local.Overage
-
-            if lu == 0 and lq == 0:
-               return Warn.Local.Ok
-
-            localUsagePctOfQuota = lu / lq
-            if localUsagePctOfQuota > self._getMaxAllowablePctUsedOfMonthlyQuota():
-               return Warn.Local.Overuse
-            # Underuse alerts will be sent only once the billing cycle is ending.
-            if self.bf > 0.7:
-               if localUsagePctOfQuota < self._getMinPctUsedConsideredUnderuse():
-                  return Warn.Local.Underuse
-         return Warn.Local.Ok
-      status = {}
-      userdata = self.u[name]
-      status['used-eobc'] = self._eobcUsagePrediction(userdata['used'])
-      status['warning-code'] = getWarningForOneUser(userdata['quota'] if 'quota' in userdata else None, userdata['used'])
-      if 'quota' in userdata:
-         status['max-daily-use-to-eobc'] = (userdata['quota'] - userdata['used']) / (31*(1 - self.bf))
-      return status
+      return self._userStatus(name, self.lines[name],
+         self._getMaxAllowablePctUsedOfMonthlyQuota(), self._getMinPctUsedConsideredUnderuse())
+
+   def iterStatuses(self):
+      """Generates (name, status) for every user, where status is what
+      userStatus(name) returns.  The usage envelope is evaluated only once for
+      the whole pass."""
+      maxPct = self._getMaxAllowablePctUsedOfMonthlyQuota()
+      minPct = self._getMinPctUsedConsideredUnderuse()
+      for (name, line) in self.lines.items():
+         yield (name, self._userStatus(name, line, maxPct, minPct))
+
+   def allStatuses(self):
+      """Returns a dictionary from user name to userStatus(name)."""
+      return dict(self.iterStatuses())
 
    def accountHealth(self):
       """Return a usage warning for the overall account.  The warning is a
       value of Warn.Global enum."""
-      if self.gq is None:
-         return Warn.Global.Ok
-
-      if self.gu > self.gq:
-         return Warn.Global.Overage
-
-      globalUsagePctOfQuota = self.gu / self.gq
-      if globalUsagePctOfQuota > self._getMaxAllowablePctUsedOfMonthlyQuota():
-         return Warn.Global.Overuse
-      # Underuse alerts will be sent only once the billing cycle is ending.
-      if self.bf > 0.7:
-         if globalUsagePctOfQuota < self._getMinPctUsedConsideredUnderuse():
-            return Warn.Global.Underuse
-      return Warn.Global.Ok
+      if self.health is None:
+         self.health = self._globalWarning(self.bf, self.gq, self.gu,
+            self._getMaxAllowablePctUsedOfMonthlyQuota(), self._getMinPctUsedConsideredUnderuse())
+      return self.health
+
+   def predictOverageProbability(self, paths=10000, budget=None, seed=None):
+      """Simulates paths ways the rest of the billing cycle may go and returns
+      how likely the users and the account are to end it over quota:
+      {
+        'account': probability, or None without an account quota,
+        'users': {
+                   user-name: probability of going over the user's quota, or
+                              the account's without one, or None if neither
+                              exists,
+                   ...
+                 },
+        'paths': the number of paths simulated,
+      }
+      Every user's usage grows at the forecaster's rate and variance, or at
+      the average rate so far.  With a budget, in seconds, it simulates only
+      as many paths as fit in it, but at least one.  seed makes the result
+      repeatable.  paths must be at least 1."""
+      start = time.perf_counter()
+      _checkPaths(paths)
+      users = [(name, l.used, l.quota) for (name, l) in self.lines.items()]
+      simulation = _OverageSimulation(self.bf, self.gq, users, self.forecaster)
+      _simulate([simulation], paths, budget, seed, start)
+      return {
+         'account': simulation.accountProbability(),
+         'users': dict((name, simulation.userProbability(j)) for (j, (name, _, _)) in enumerate(users)),
+         'paths': simulation.paths,
+      }
+
+   def suggestRebalance(self):
+      """Suggests new individual quotas for the users who have one, with the
+      same total, that cover everyone's predicted usage by the end of the
+      billing cycle as well as possible.  No quota goes below what its user
+      has already used.  Returns None if the users have used more than their
+      quotas add up to, and otherwise:
+      {
+        'quotas': {user-name: suggested quota, ...},
+        'overage-before': predicted usage over the current quotas in total,
+        'overage-after': predicted usage over the suggested quotas in total,
+      }
+      If the total covers every prediction, the users whose quota covers
+      their prediction give up what the others lack, evenly from the most
+      spare quota down, and the rest keep their quotas.  If it doesn't, every
+      quota goes to its user's prediction less the same shortfall, as far as
+      their usage allows.  Either way it takes O(n log n) for n users."""
+      names = [name for (name, l) in self.lines.items() if l.quota is not None]
+      quotas = [self.lines[name].quota for name in names]
+      used = [self.lines[name].used for name in names]
+      total = sum(quotas)
+      if sum(used) > total:
+         return None
+      predicted = [self._eobcUsagePrediction(u, name) for (name, u) in zip(names, used)]
+      # Nobody needs more than the predicted usage or less than the used.
+      needed = [max(p, u) for (p, u) in zip(predicted, used)]
+      if sum(needed) <= total:
+         # Cap everyone's spare quota at the same level, just low enough for
+         # the others' needs.
+         spare = [max(0.0, q - n) for (q, n) in zip(quotas, needed)]
+         level = _waterLevel(spare, total - sum(needed))
+         suggested = [n + min(s, level) for (n, s) in zip(needed, spare)]
+      else:
+         # Cut everyone short by the same amount, but not below the used.
+         room = [n - u for (n, u) in zip(needed, used)]
+         shortfall = _waterLevel(room, sum(needed) - total)
+         suggested = [n - min(r, shortfall) for (n, r) in zip(needed, room)]
+      return {
+         'quotas': dict(zip(names, suggested)),
+         'overage-before': sum(max(0.0, p - q) for (p, q) in zip(predicted, quotas)),
+         'overage-after': sum(max(0.0, p - q) for (p, q) in zip(predicted, suggested)),
+      }
 
    @staticmethod
    def getLocalWarnText(code):
@@ -233,24 +620,353 @@ class Alerter:
       return Warn.Global.name(code)
 
    # HELPERS
-   def _eobcUsagePrediction(self, usednow):
+   def _userStatus(self, name, line, maxPct, minPct):
+      status = {}
+      status['used-eobc'] = self._eobcUsagePrediction(line.used, name)
+      status['warning-code'] = self._localWarning(self.bf, self.gq, line.quota, line.used, maxPct, minPct)
+      if line.quota is not None:
+         status['max-daily-use-to-eobc'] = self._maxDailyUse(self.bf, line.quota, line.used)
+      return status
+
+   def _eobcUsagePrediction(self, usednow, name=None):
+      if self.forecaster is not None and name is not None:
+         predicted = self.forecaster.usedEobc(name, self.bf, usednow)
+         if predicted is not None:
+            return predicted
       return usednow / self.bf
 
-   # An Overuse alert will be issued if the current percent used of the monthly
-   # quota is above the percentage returned by this function.
    def _getMaxAllowablePctUsedOfMonthlyQuota(self):
-      return self.bf/2 + 0.5
+      return self.envelope.maxPct(self.bf)
 
-   # An Underuse alert will be issued if the current percent used of the monthly
-   # quota is below the percentage returned by this function.  This function can
-   # be used only if the user is not already in Overuse mode.
    def _getMinPctUsedConsideredUnderuse(self):
-      startFrac = 0.7
-      if self.bf < startFrac:
-         return 1 # should never trigger
+      return self.envelope.minPct(self.bf)
+
+   # The warning rules below are static so that PollPlanner can run them at
+   # other billing fractions; BatchAlerter._warnings applies the same rules to
+   # whole columns.  maxPct and minPct are the envelope values for billing
+   # fraction bf.
+
+   @staticmethod
+   def _maxDailyUse(bf, lq, lu):
+      return (lq - lu) / (31*(1 - bf))
+
+   @staticmethod
+   def _localWarning(bf, gq, lq, lu, maxPct, minPct):
+      if lq is None:
+         # Only the global quota matters.
+         if gq is None:
+            return Warn.Local.Ok
+         if lu > gq:
+            return Warn.Local.Overage
+         if lu == 0 and gq == 0:
+            return Warn.Local.Ok
+         localUsagePctOfQuota = lu / gq
+         if localUsagePctOfQuota > maxPct:
+            return Warn.Local.Overuse
+         # In cooperative mode, we should not alert anyone of underuse.
+         # This is because it's possible for everyone to be under global
+         # quota yet cause an account overage.
       else:
-         def pctChg(x, y):
-            return (x-y)/y
-         # Range between [50%, 70%].
-         return pctChg(1, self.bf) * 0.2 + 0.5
+         # This user has his own quota.
+         if lu > lq:
+            return Warn.Local.Overage
+
+         if lu == 0 and lq == 0:
+            return Warn.Local.Ok
+
+         localUsagePctOfQuota = lu / lq
+         if localUsagePctOfQuota > maxPct:
+            return Warn.Local.Overuse
+         # Underuse alerts will be sent only once the billing cycle is ending.
+         if bf > 0.7:
+            if localUsagePctOfQuota < minPct:
+               return Warn.Local.Underuse
+      return Warn.Local.Ok
 
+   @staticmethod
+   def _globalWarning(bf, gq, gu, maxPct, minPct):
+      if gq is None:
+         return Warn.Global.Ok
+
+      if gu > gq:
+         return Warn.Global.Overage
+
+      if gu == 0 and gq == 0:
+         return Warn.Global.Ok
+
+      globalUsagePctOfQuota = gu / gq
+      if globalUsagePctOfQuota > maxPct:
+         return Warn.Global.Overuse
+      # Underuse alerts will be sent only once the billing cycle is ending.
+      if bf > 0.7:
+         if globalUsagePctOfQuota < minPct:
+            return Warn.Global.Underuse
+      return Warn.Global.Ok
+
+class IncrementalAlerter(Alerter):
+   """An Alerter whose usage records can be changed in place.  The global used
+   total, the sum of individual quotas, the account health and the per-user
+   statuses are kept up to date in constant time per change, so a stream of
+   small usage updates does not have to rebuild the whole Alerter.
+
+   The input is copied; usage() returns the live copy as LineUsage records."""
+
+   def __init__(self, d, envelope=None, forecaster=None):
+      Alerter.__init__(self, d, envelope, forecaster)
+      self.lines = dict((name, LineUsage(l.used, l.quota)) for (name, l) in self.lines.items())
+      self.indivSum = 0
+      self.uncapped = 0
+      for l in self.lines.values():
+         self._countQuota(l.quota, 1)
+      self.statuses = {}
+
+   # MUTATORS
+
+   def updateUsage(self, name, used):
+      """Sets the amount used by an existing user."""
+      line = self.lines[name]
+      self.gu += used - line.used
+      line.used = used
+      self._invalidate(name)
+
+   def setQuota(self, name, quota):
+      """Sets or, with None, removes the individual quota of an existing user.
+      Raises Error and keeps the old quota if the individual quotas would
+      exceed the account quota."""
+      line = self.lines[name]
+      oldquota = line.quota
+      self._quotaChange(oldquota, quota)
+      try:
+         self._checkQuotas()
+      except Error:
+         self._quotaChange(quota, oldquota)
+         raise
+      line.quota = quota
+      self.statuses.pop(name, None)
+
+   def addUser(self, name, used, quota=None):
+      if name in self.lines:
+         raise Error("User %s already exists" % name)
+      self._countQuota(quota, 1)
+      try:
+         self._checkQuotas()
+      except Error:
+         self._countQuota(quota, -1)
+         raise
+      self.lines[name] = LineUsage(used, quota)
+      self.gu += used
+      self._invalidate(name)
+
+   def removeUser(self, name):
+      line = self.lines.pop(name)
+      self._countQuota(line.quota, -1)
+      self.gu -= line.used
+      if not self.lines:
+         # Shed any floating-point drift accumulated along the way.
+         self.gu = 0
+         self.indivSum = 0
+      self._invalidate(name)
+
+   # WARNINGS
+
+   def userStatus(self, name):
+      if name not in self.statuses:
+         self.statuses[name] = Alerter.userStatus(self, name)
+      return self.statuses[name]
+
+   def iterStatuses(self):
+      maxPct = self._getMaxAllowablePctUsedOfMonthlyQuota()
+      minPct = self._getMinPctUsedConsideredUnderuse()
+      for (name, line) in self.lines.items():
+         if name not in self.statuses:
+            self.statuses[name] = self._userStatus(name, line, maxPct, minPct)
+         yield (name, self.statuses[name])
+
+   # HELPERS
+
+   def _invalidate(self, name):
+      self.statuses.pop(name, None)
+      self.health = None
+
+   def _countQuota(self, quota, sign):
+      if quota is None:
+         self.uncapped += sign
+      else:
+         self.indivSum += sign * quota
+
+   def _quotaChange(self, oldquota, newquota):
+      self._countQuota(oldquota, -1)
+      self._countQuota(newquota, 1)
+
+   def _checkQuotas(self):
+      if self.uncapped == 0 and self.gq is not None and self.indivSum > self.gq:
+         raise Error("Individual quotas are larger than the nominal account quota")
+
+# BatchAlerter keeps missing quotas as NaN; the per-account code takes None.
+def _none(q):
+   return None if q != q else q
+
+class BatchAlerter:
+   """BatchAlerter evaluates a whole fleet of accounts at once.  Its results are
+   identical to building one Alerter per account and calling userStatus() and
+   accountHealth() on it, but every rule is applied to whole columns in a few
+   passes, without a Python call per account or user.  The envelope is
+   evaluated once per distinct billing fraction."""
+
+   # The input is columnar.  Any sequence works, including array.array and
+   # NumPy arrays.
+   # Per-account columns, one row per account:
+   # * billingFrac: number ranged [0, 1), like Alerter's 'billing-frac'.
+   # * globalQuota: number, or None/NaN when the account has no cap.
+   # Per-user columns, one row per user of any account:
+   # * account: row index of the user's account in the per-account columns.
+   # * quota: number, or None/NaN when the user has no individual quota.
+   # * used: number.
+   # The optional envelope is an Envelope, like Alerter's.
+   # Missing quotas are kept as NaN, which fails every comparison, so a
+   # column without a cap comes out Ok by the same tests as one with it.
+   def __init__(self, billingFrac, globalQuota, account, quota, used, envelope=None):
+      envelope = envelope if envelope is not None else DEFAULT_ENVELOPE
+      nan = float('nan')
+      self.bf = array('d', billingFrac)
+      self.gq = array('d', (nan if q is None else q for q in globalQuota))
+      self.acct = array('l', account)
+      self.lq = array('d', (nan if q is None else q for q in quota))
+      self.lu = array('d', used)
+      if len(self.bf) != len(self.gq):
+         raise Error("Per-account columns have different lengths")
+      if not len(self.acct) == len(self.lq) == len(self.lu):
+         raise Error("Per-user columns have different lengths")
+
+      # Per-account pass: envelope values and global usage.  A fleet's
+      # billing fractions are mostly the same few days.
+      maxPctOf = dict((bf, envelope.maxPct(bf)) for bf in set(self.bf))
+      minPctOf = dict((bf, envelope.minPct(bf)) for bf in set(self.bf))
+      self.maxPct = array('d', map(maxPctOf.__getitem__, self.bf))
+      self.minPct = array('d', map(minPctOf.__getitem__, self.bf))
+      # One sort groups the users by account; an account's total is then a
+      # sum() over its slice, as Alerter adds it up.
+      order = sorted(range(len(self.acct)), key=self.acct.__getitem__)
+      byAccount = array('l', map(self.acct.__getitem__, order))
+      if byAccount and (byAccount[0] < 0 or byAccount[-1] >= len(self.bf)):
+         raise Error("Per-user rows refer to missing accounts")
+      bounds = list(map(functools.partial(bisect.bisect_left, byAccount), range(len(self.bf) + 1)))
+      slices = list(map(slice, bounds, bounds[1:]))
+      lu = list(map(self.lu.__getitem__, order))
+      lq = list(map(self.lq.__getitem__, order))
+      self.gu = array('d', [sum(lu[s]) for s in slices])
+
+      # Same validation as Alerter: accounts where every user has an
+      # individual quota must not hand out more than the account quota.  A
+      # user without one makes the sum NaN.
+      for (a, (s, gq)) in enumerate(zip([sum(lq[s]) for s in slices], self.gq)):
+         if s > gq:
+            raise Error("Individual quotas are larger than the nominal account quota (account %d)" % a)
+
+      # Underuse alerts are sent only once the billing cycle is ending.
+      late = [bf > 0.7 for bf in self.bf]
+      self.health = self._warnings(Warn.Global, self.gu, self.gq, self.maxPct, self.minPct, late)
+
+      # Per-user passes: broadcast the account columns to users, then apply
+      # the same rules as Alerter.userStatus.  A user's limit is the
+      # individual quota if there is one, else the account's; only users
+      # with an individual quota are told of underuse.
+      ubf = array('d', map(self.bf.__getitem__, self.acct))
+      limit = [gq if lq != lq else lq for (lq, gq) in zip(self.lq, map(self.gq.__getitem__, self.acct))]
+      mayUnderuse = [l and lq == lq for (l, lq) in zip(map(late.__getitem__, self.acct), self.lq)]
+      self.codes = self._warnings(Warn.Local, self.lu, limit,
+         map(self.maxPct.__getitem__, self.acct), map(self.minPct.__getitem__, self.acct), mayUnderuse)
+      self.eobc = array('d', map(operator.truediv, self.lu, ubf))
+      self.maxDaily = array('d', [(lq - lu) / (31*(1 - bf)) for (bf, lq, lu) in zip(ubf, self.lq, self.lu)])
+
+   @staticmethod
+   def _warnings(warn, used, limit, maxPct, minPct, mayUnderuse):
+      """Applies Alerter's warning rules to columns: Overage past the limit,
+      Overuse past maxPct of it, Underuse below minPct where mayUnderuse is
+      true, and Ok otherwise, including where there is no limit (NaN) or usage
+      and limit are both 0.  warn is Warn.Global or Warn.Local."""
+      nan = float('nan')
+      (overage, overuse, underuse, ok) = (warn.Overage, warn.Overuse, warn.Underuse, warn.Ok)
+      over = map(operator.gt, used, limit)
+      pct = [u / l if l else nan for (u, l) in zip(used, limit)]
+      return array('b', [overage if o else overuse if p > mx else underuse if m and p < mn else ok
+         for (o, p, mx, mn, m) in zip(over, pct, maxPct, minPct, mayUnderuse)])
+
+   @classmethod
+   def fromAccounts(cls, accounts, envelope=None):
+      """Builds a BatchAlerter from a sequence of Alerter input dictionaries.
+      Returns the BatchAlerter and a list of (account index, user name) tuples
+      that maps every per-user row back to its user."""
+      billingFrac, globalQuota = [], []
+      account, quota, used, names = [], [], [], []
+      for (i, d) in enumerate(accounts):
+         billingFrac.append(d['billing-frac'])
+         globalQuota.append(d['global-quota'] if 'global-quota' in d else None)
+         for (name, u) in d['usage'].items():
+            line = LineUsage.adapt(u)
+            account.append(i)
+            quota.append(line.quota)
+            used.append(line.used)
+            names.append((i, name))
+      return (cls(billingFrac, globalQuota, account, quota, used, envelope), names)
+
+   # ACCESSORS
+   # Per-account results are indexed by account row, per-user results by user
+   # row.
+
+   def globalUsed(self):
+      """Returns array of numbers."""
+      return self.gu
+
+   def accountHealth(self):
+      """Returns array of Warn.Global values."""
+      return self.health
+
+   def warningCodes(self):
+      """Returns array of Warn.Local values."""
+      return self.codes
+
+   def usedEobc(self):
+      """Returns array of predicted usage by the end of the billing cycle."""
+      return self.eobc
+
+   def maxDailyUseToEobc(self):
+      """Returns array of numbers.  NaN for users without individual quota,
+      which is where Alerter.userStatus omits 'max-daily-use-to-eobc'."""
+      return self.maxDaily
+
+   def predictOverageProbability(self, paths=10000, budget=None, seed=None):
+      """Does what Alerter.predictOverageProbability does, for every account.
+      Returns (account probabilities, user probabilities, paths), arrays
+      indexed like accountHealth(), warningCodes() and accountHealth() again,
+      the probabilities with NaN where Alerter gives None.  With a budget, in
+      seconds, the whole fleet is simulated in rounds until the budget is
+      spent, setting up included; paths tells how many paths each account
+      got, and an account the budget didn't reach at all gets none and NaN
+      probabilities."""
+      start = time.perf_counter()
+      _checkPaths(paths)
+      rows = [[] for _ in self.bf]
+      for (row, a) in enumerate(self.acct):
+         rows[a].append(row)
+      simulations = [_OverageSimulation(self.bf[a], _none(self.gq[a]), [(row, self.lu[row], _none(self.lq[row])) for row in rows[a]])
+         for a in range(len(self.bf))]
+      _simulate(simulations, paths, budget, seed, start)
+      nan = float('nan')
+      accounts = array('d', (nan if p is None else p for p in (s.accountProbability() for s in simulations)))
+      users = array('d', bytes(8 * len(self.acct)))
+      for (a, simulation) in enumerate(simulations):
+         for (j, row) in enumerate(rows[a]):
+            p = simulation.userProbability(j)
+            users[row] = nan if p is None else p
+      return (accounts, users, array('l', (s.paths for s in simulations)))
+
+   def userStatus(self, row):
+      """Returns the same dictionary as Alerter.userStatus for one user row."""
+      status = {
+         'used-eobc': self.eobc[row],
+         'warning-code': self.codes[row],
+      }
+      if self.lq[row] == self.lq[row]:
+         status['max-daily-use-to-eobc'] = self.maxDaily[row]
+      return status
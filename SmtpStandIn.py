@@ -0,0 +1,118 @@
+#!/bin/env python3
+
+import email.parser
+import email.policy
+import socketserver
+import threading
+import time
+
+"""SmtpStandIn is a local SMTP server that accepts every message and keeps it,
+so that mail delivery can be exercised and timed without a real mail server.
+It speaks just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET,
+NOOP and QUIT, without authentication or TLS.
+
+Every command is delayed by latency seconds to imitate a remote server, and
+with failEvery set, every failEvery-th message is refused with a 451.
+
+Typical use:
+   standIn = SmtpStandIn()
+   standIn.start()
+   delivery = SmtpDelivery('127.0.0.1', standIn.port(), ...)
+   ...
+   standIn.stop()
+   standIn.messages  # [(sender, recipients, email.message.EmailMessage)]"""
+class SmtpStandIn:
+   def __init__(self, latency=0.0, port=0, failEvery=None):
+      self.latency = latency
+      self.failEvery = failEvery
+      self.messages = []
+      self.connections = 0
+      self.attempts = 0
+      self.lock = threading.Lock()
+      self.server = socketserver.ThreadingTCPServer(('127.0.0.1', port), _Handler)
+      self.server.daemon_threads = True
+      self.server.standIn = self
+      self.thread = None
+
+   def start(self):
+      self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+      self.thread.start()
+
+   def stop(self):
+      self.server.shutdown()
+      self.server.server_close()
+      self.thread.join()
+
+   def port(self):
+      return self.server.server_address[1]
+
+   # Returns whether to accept the next message, and keeps it if so.
+   def accept(self, sender, recipients, data):
+      with self.lock:
+         self.attempts += 1
+         if self.failEvery and self.attempts % self.failEvery == 0:
+            return False
+         message = email.parser.BytesParser(policy=email.policy.default).parsebytes(data)
+         self.messages.append((sender, recipients, message))
+      return True
+
+class _Handler(socketserver.StreamRequestHandler):
+   def handle(self):
+      standIn = self.server.standIn
+      with standIn.lock:
+         standIn.connections += 1
+      self._reply('220 stand-in ESMTP')
+      (sender, recipients) = (None, [])
+      while True:
+         line = self.rfile.readline()
+         if not line:
+            return
+         if standIn.latency:
+            time.sleep(standIn.latency)
+         (command, _, arg) = line.decode('ascii', 'replace').strip().partition(' ')
+         command = command.upper()
+         if command == 'EHLO':
+            self._reply('250-stand-in', '250 8BITMIME')
+         elif command == 'HELO':
+            self._reply('250 stand-in')
+         elif command == 'MAIL':
+            (sender, recipients) = (self._address(arg), [])
+            self._reply('250 OK')
+         elif command == 'RCPT':
+            recipients.append(self._address(arg))
+            self._reply('250 OK')
+         elif command == 'DATA':
+            self._reply('354 End data with <CR><LF>.<CR><LF>')
+            if standIn.accept(sender, recipients, self._data()):
+               self._reply('250 OK')
+            else:
+               self._reply('451 Try again later')
+            (sender, recipients) = (None, [])
+         elif command == 'RSET':
+            (sender, recipients) = (None, [])
+            self._reply('250 OK')
+         elif command == 'NOOP':
+            self._reply('250 OK')
+         elif command == 'QUIT':
+            self._reply('221 Bye')
+            return
+         else:
+            self._reply('502 Command not implemented')
+
+   def _data(self):
+      lines = []
+      while True:
+         line = self.rfile.readline()
+         if not line or line == b'.\r\n':
+            break
+         if line.startswith(b'..'):
+            line = line[1:]
+         lines.append(line)
+      return b''.join(lines)
+
+   def _address(self, arg):
+      # FROM:<a@b> or TO:<a@b>, maybe with parameters after it.
+      return arg.partition(':')[2].strip().split(' ')[0].strip('<>')
+
+   def _reply(self, *lines):
+      self.wfile.write(''.join(l + '\r\n' for l in lines).encode('ascii'))
@@ -0,0 +1,223 @@
+#!/bin/env python3
+
+import datetime
+import math
+import mmap
+import os
+import struct
+from VerizonScraper import Overview
+
+"""Snapshot is the file format ResponseCache is saved in.  Unlike a pickle, it
+holds nothing but data: every cache entry is one fixed-width record with the
+typed fields of an Overview, so the file doesn't depend on the layout of any
+class, and a snapshot written by an older version still loads after the code
+has changed.
+
+A file starts with a magic string and a version number, which selects the
+layout of the rest.  Version 1 is, all little-endian:
+   header:  record count, reference count, string count
+   records: one _RECORD_V1 per entry
+   refs:    string indices that records point at: the phone numbers of a
+            'lines' entry, or the name/value pairs of an Overview's extras
+   strings: string count + 1 byte offsets, then the UTF-8 bytes they delimit
+Accounts and phone numbers are stored once each in the string table.  A
+summaryAllowance that is text, like the data overview's, is kept in the
+string table too, and a number in the record.
+
+SnapshotReader maps the file into memory and decodes records and strings only
+when they're read."""
+
+class Error(BaseException):
+   pass
+
+MAGIC = b'VZSNAP'
+VERSION = 1
+
+_HEADER = struct.Struct('<6sH')
+_COUNTS_V1 = struct.Struct('<III')
+# account, line, resource, fetchedAt, billCyleEndDate, summaryAllowance as a
+# number, summaryAllowance as text, summaryAllowanceInKB, summaryUsage,
+# summaryUsageInKB, individualUsage, first ref, ref count
+_RECORD_V1 = struct.Struct('<IIBdidIdqdqII')
+_REF = struct.Struct('<I')
+
+_NONE = 0xffffffff # no string
+_NO_INT = -2**63 # no integer
+_RESOURCES = ('lines', 'sms', 'data')
+
+def write(path, entries):
+   """Writes the snapshot of entries, an iterable of ((account, line,
+   resource), fetchedAt, value), to path.  The file is replaced atomically."""
+   strings = {}
+   def intern(s):
+      if s is None:
+         return _NONE
+      i = strings.get(s)
+      if i is None:
+         i = strings[s] = len(strings)
+      return i
+
+   records = bytearray()
+   refs = []
+   count = 0
+   for ((account, line, resource), fetchedAt, value) in entries:
+      firstRef = len(refs)
+      if resource == 'lines':
+         refs.extend(intern(phoneNum) for phoneNum in sorted(value))
+         fields = (0, _NaN, _NONE, _NaN, _NO_INT, _NaN, _NO_INT)
+      else:
+         if value.extra:
+            for (k, v) in value.extra.items():
+               refs.append(intern(k))
+               refs.append(intern(None if v is None else str(v)))
+         fields = (
+            _fromDate(value.billCyleEndDate),
+            _fromAllowance(value.summaryAllowance),
+            intern(_allowanceText(value.summaryAllowance)),
+            _fromFloat(value.summaryAllowanceInKB),
+            _fromInt(value.summaryUsage),
+            _fromFloat(value.summaryUsageInKB),
+            _fromInt(value.individualUsage),
+         )
+      records += _RECORD_V1.pack(intern(account), intern(line), _RESOURCES.index(resource), fetchedAt,
+         *fields, firstRef, len(refs) - firstRef)
+      count += 1
+
+   blobs = [s.encode('utf-8') for s in strings]
+   offsets = [0]
+   for b in blobs:
+      offsets.append(offsets[-1] + len(b))
+   tmpPath = path + '.tmp'
+   with open(tmpPath, 'wb') as f:
+      f.write(_HEADER.pack(MAGIC, VERSION))
+      f.write(_COUNTS_V1.pack(count, len(refs), len(blobs)))
+      f.write(records)
+      f.write(struct.pack('<%dI' % len(refs), *refs))
+      f.write(struct.pack('<%dI' % len(offsets), *offsets))
+      f.write(b''.join(blobs))
+   os.replace(tmpPath, path)
+
+class SnapshotReader:
+   """Reads a snapshot through mmap.  len() is the number of entries; iterating
+   yields them as ((account, line, resource), fetchedAt, value), in the order
+   they were written.  Use it in a with statement."""
+
+   def __init__(self, path):
+      self.file = open(path, 'rb')
+      try:
+         size = os.fstat(self.file.fileno()).st_size
+         if size < _HEADER.size:
+            raise Error("%s is not a snapshot" % path)
+         self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+      except (Exception, Error):
+         self.file.close()
+         raise
+      (magic, self.version) = _HEADER.unpack_from(self.map, 0)
+      if magic != MAGIC:
+         self.close()
+         raise Error("%s is not a snapshot" % path)
+      layout = self.layouts.get(self.version)
+      if layout is None:
+         self.close()
+         raise Error("%s is a snapshot of version %d, which is newer than this code" % (path, self.version))
+      layout(self)
+
+   def __len__(self):
+      return self.count
+
+   def __iter__(self):
+      return self.entries()
+
+   def close(self):
+      self.map.close()
+      self.file.close()
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *exc):
+      self.close()
+
+   def string(self, i):
+      if i == _NONE:
+         return None
+      s = self.strings[i]
+      if s is None:
+         (start, end) = struct.unpack_from('<II', self.map, self.offsetsAt + 4 * i)
+         s = self.strings[i] = str(self.map[self.blobsAt + start:self.blobsAt + end], 'utf-8')
+      return s
+
+   # VERSION 1
+
+   def _layoutV1(self):
+      (self.count, refCount, stringCount) = _COUNTS_V1.unpack_from(self.map, _HEADER.size)
+      self.recordsAt = _HEADER.size + _COUNTS_V1.size
+      self.refsAt = self.recordsAt + self.count * _RECORD_V1.size
+      self.offsetsAt = self.refsAt + refCount * _REF.size
+      self.blobsAt = self.offsetsAt + (stringCount + 1) * 4
+      self.strings = [None] * stringCount
+      self.entries = self._entriesV1
+
+   def _entriesV1(self):
+      records = memoryview(self.map)[self.recordsAt:self.refsAt]
+      try:
+         yield from self._entries(_RECORD_V1.iter_unpack(records))
+      finally:
+         records.release()
+
+   # records yields tuples of _RECORD_V1's fields.
+   def _entries(self, records):
+      dates = {0: None}
+      for (account, line, resource, fetchedAt, endDate, allowance, allowanceText, allowanceInKB, usage, usageInKB,
+            individualUsage, firstRef, refCount) in records:
+         resource = _RESOURCES[resource]
+         refs = ()
+         if refCount:
+            refs = struct.unpack_from('<%dI' % refCount, self.map, self.refsAt + firstRef * _REF.size)
+         if resource == 'lines':
+            value = set(self.string(r) for r in refs)
+         else:
+            # All lines of an account end their billing cycle on the same day.
+            if endDate not in dates:
+               dates[endDate] = datetime.date.fromordinal(endDate)
+            value = Overview.__new__(Overview)
+            value.billCyleEndDate = dates[endDate]
+            value.summaryAllowance = self.string(allowanceText) if allowanceText != _NONE else _toAllowance(allowance)
+            value.summaryAllowanceInKB = None if allowanceInKB != allowanceInKB else allowanceInKB
+            value.summaryUsage = None if usage == _NO_INT else usage
+            value.summaryUsageInKB = None if usageInKB != usageInKB else usageInKB
+            value.individualUsage = None if individualUsage == _NO_INT else individualUsage
+            value.extra = None
+            for j in range(0, refCount, 2):
+               value[self.string(refs[j])] = self.string(refs[j + 1])
+         yield ((self.string(account), self.string(line), resource), fetchedAt, value)
+
+   # Every version the reader understands, and how to set up reading it.
+   layouts = {
+      1: _layoutV1,
+   }
+
+# FIELD ENCODINGS
+# Missing numbers are NaN (which alone isn't equal to itself) or _NO_INT, and
+# a missing date is 0.  An allowance that is text, like 'Unlimited', is kept
+# as NaN and the text.
+
+_NaN = float('nan')
+
+def _fromDate(d):
+   return 0 if d is None else d.toordinal()
+
+def _fromFloat(x):
+   return _NaN if x is None else float(x)
+
+def _fromInt(n):
+   return _NO_INT if n is None else int(n)
+
+def _fromAllowance(a):
+   return _NaN if isinstance(a, str) else _fromFloat(a)
+
+def _allowanceText(a):
+   return a if isinstance(a, str) else None
+
+def _toAllowance(a):
+   return None if math.isnan(a) else int(a)
@@ -0,0 +1,198 @@
+#!/bin/env python3
+
+import mmap
+import os
+import struct
+
+"""UsageHistory keeps every usage reading of every line, so that the burn
+rates of a BurnRateForecaster survive a restart and the history of a cycle
+can be looked at later.  A reading is a sample of one series, a series being
+the (account, line, resource) it was read for.
+
+The history is append-only and made of two files.  The samples file starts
+with a magic string and a version number; version 1 continues with one
+_SAMPLE_V1 per sample, all little-endian:
+   series, recorded at, billing fraction, used
+Samples are appended in the order they're recorded, so their times never go
+down, and a stretch of time is found by bisection.  A sample cut short by a
+crash is dropped when the history is opened again.  The keys file next to it
+holds the series, one tab-separated key per line; the series number of a
+sample is its line number there.
+
+HistoryReader maps the samples file into memory and decodes the samples one
+at a time while they're read, so reading a cycle of thousands of lines holds
+no more than one sample in Python objects at a time."""
+
+class Error(BaseException):
+   pass
+
+MAGIC = b'VZHIST'
+VERSION = 1
+
+_HEADER = struct.Struct('<6sH')
+# series, recorded at, billing fraction, used
+_SAMPLE_V1 = struct.Struct('<Iddd')
+_TIME_OFFSET = 4
+
+def _keysPath(path):
+   return path + '.keys'
+
+# Returns the keys, and the length in bytes of the complete lines they were
+# read from.
+def _readKeys(path):
+   keys = []
+   length = 0
+   if os.access(_keysPath(path), os.R_OK):
+      with open(_keysPath(path), 'rb') as f:
+         for l in f:
+            if l.endswith(b'\n'):
+               keys.append(tuple(str(l[:-1], 'utf-8').split('\t')))
+               length += len(l)
+   return (keys, length)
+
+class UsageHistory:
+   """Appends samples to the history at path, creating it if needed.  Use it
+   in a with statement, or close() it."""
+
+   def __init__(self, path):
+      self.path = path
+      (self.keys, length) = _readKeys(path)
+      self.series = dict((key, i) for (i, key) in enumerate(self.keys))
+      self.last = 0.0
+      self.file = open(path, 'a+b')
+      try:
+         size = self.file.seek(0, os.SEEK_END)
+         if size == 0:
+            self.file.write(_HEADER.pack(MAGIC, VERSION))
+         else:
+            self.file.seek(0)
+            header = self.file.read(_HEADER.size)
+            if len(header) < _HEADER.size or _HEADER.unpack(header)[0] != MAGIC:
+               raise Error("%s is not a usage history" % path)
+            if _HEADER.unpack(header)[1] != VERSION:
+               raise Error("%s is a usage history of version %d, which this code can't append to"
+                  % (path, _HEADER.unpack(header)[1]))
+            whole = _HEADER.size + (size - _HEADER.size) // _SAMPLE_V1.size * _SAMPLE_V1.size
+            if whole != size:
+               self.file.truncate(whole)
+            if whole > _HEADER.size:
+               self.file.seek(whole - _SAMPLE_V1.size + _TIME_OFFSET)
+               (self.last,) = struct.unpack('<d', self.file.read(8))
+            self.file.seek(0, os.SEEK_END)
+      except (Exception, Error):
+         self.file.close()
+         raise
+      self.keysFile = open(_keysPath(path), 'a', encoding='utf-8')
+      if self.keysFile.tell() != length:
+         self.keysFile.truncate(length)
+
+   def append(self, account, line, resource, recordedAt, bf, used):
+      """Adds a sample: the line had used used of the resource at billing
+      fraction bf.  A recordedAt before the last sample's counts as the same
+      time as that one."""
+      key = (account, line, resource)
+      series = self.series.get(key)
+      if series is None:
+         if any('\t' in k or '\n' in k for k in key):
+            raise Error("Can't record the series %r" % (key,))
+         series = self.series[key] = len(self.keys)
+         self.keys.append(key)
+         self.keysFile.write('\t'.join(key) + '\n')
+         # A sample must never refer to a series that isn't on disk.
+         self.keysFile.flush()
+      self.last = max(self.last, recordedAt)
+      self.file.write(_SAMPLE_V1.pack(series, self.last, bf, used))
+
+   def flush(self):
+      self.file.flush()
+
+   def close(self):
+      self.file.close()
+      self.keysFile.close()
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *exc):
+      self.close()
+
+class HistoryReader:
+   """Reads a usage history through mmap.  len() is the number of samples;
+   samples() yields them as ((account, line, resource), recordedAt, bf,
+   used), in the order they were recorded.  Use it in a with statement."""
+
+   def __init__(self, path):
+      self.file = open(path, 'rb')
+      try:
+         size = os.fstat(self.file.fileno()).st_size
+         if size < _HEADER.size:
+            raise Error("%s is not a usage history" % path)
+         self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+      except (Exception, Error):
+         self.file.close()
+         raise
+      (magic, self.version) = _HEADER.unpack_from(self.map, 0)
+      if magic != MAGIC:
+         self.close()
+         raise Error("%s is not a usage history" % path)
+      if self.version != VERSION:
+         self.close()
+         raise Error("%s is a usage history of version %d, which is newer than this code" % (path, self.version))
+      self.count = (size - _HEADER.size) // _SAMPLE_V1.size
+      (self.keys, _) = _readKeys(path)
+
+   def __len__(self):
+      return self.count
+
+   def close(self):
+      self.map.close()
+      self.file.close()
+
+   def __enter__(self):
+      return self
+
+   def __exit__(self, *exc):
+      self.close()
+
+   def recordedAt(self, i):
+      """Returns the time sample i was recorded at."""
+      return struct.unpack_from('<d', self.map, _HEADER.size + i * _SAMPLE_V1.size + _TIME_OFFSET)[0]
+
+   def find(self, since):
+      """Returns the index of the first sample recorded at since or later."""
+      (lo, hi) = (0, self.count)
+      while lo < hi:
+         mid = (lo + hi) // 2
+         if self.recordedAt(mid) < since:
+            lo = mid + 1
+         else:
+            hi = mid
+      return lo
+
+   def samples(self, since=None):
+      """Yields the samples recorded at since or later, or all of them."""
+      start = _HEADER.size + (0 if since is None else self.find(since)) * _SAMPLE_V1.size
+      samples = memoryview(self.map)[start:_HEADER.size + self.count * _SAMPLE_V1.size]
+      keys = self.keys
+      try:
+         for (series, recordedAt, bf, used) in _SAMPLE_V1.iter_unpack(samples):
+            yield (keys[series], recordedAt, bf, used)
+      finally:
+         samples.release()
+
+def replay(path, forecasters, since=None):
+   """Feeds the samples of the history at path recorded at since or later to
+   forecasters, a dictionary from (account, resource) to BurnRateForecaster;
+   forecasters it lacks are created by calling its default_factory, if it's a
+   collections.defaultdict, and otherwise the samples are skipped.  Returns
+   the number of samples fed."""
+   fed = 0
+   with HistoryReader(path) as history:
+      for ((account, line, resource), _, bf, used) in history.samples(since):
+         try:
+            forecaster = forecasters[(account, resource)]
+         except KeyError:
+            continue
+         forecaster.update(line, bf, used)
+         fed += 1
+   return fed
@@ -1,48 +1,242 @@
 #!/bin/env python3
 
+import collections.abc
+import concurrent.futures
 import datetime
-import http.client
+import functools
 import re
-import urllib.request
+import threading
+import urllib.parse
 import xml.etree.ElementTree as ET
+from HttpSession import HttpSession
 
-# Thanks, http://stackoverflow.com/questions/603856/how-do-you-get-default-headers-in-a-urllib2-request
-class PrintedHTTPConnection(http.client.HTTPConnection):
-	def send(self, s):
-		print("PrintedHTTPConnection: %s" % s)
-		http.client.HTTPConnection.send(self, s)
+class Error(BaseException):
+   pass
 
-class PrintedHTTPSConnection(http.client.HTTPSConnection):
-	def send(self, s):
-		print("PrintedHTTPSConnection: %s" % s)
-		http.client.HTTPSConnection.send(self, s)
+# FIELD CONVERTERS
 
-class PrintedHTTPHandler(urllib.request.HTTPHandler):
-	def http_open(self, req):
-		return self.do_open(PrintedHTTPConnection, req)
+# Every line of an account has the same billCyleEndDate, so parse it once.
+@functools.lru_cache(maxsize=64)
+def _parseDate(v):
+   return datetime.datetime.strptime(v, "%m/%d/%y").date()
 
-class PrintedHTTPSHandler(urllib.request.HTTPSHandler):
-	def https_open(self, req):
-		return self.do_open(PrintedHTTPSConnection, req)
+def _parsePrettyFloat(v):
+   return float(v.replace(',', ''))
+
+def _parsePrettyInt(v):
+   return int(_parsePrettyFloat(v))  # convert to float first because some logical integers end with ".0".
+
+def _parseAllowance(v):
+   return v if v == 'Unlimited' else _parsePrettyInt(v)
+
+class Overview:
+   """One line's usage overview of one resource (SMS or data), as returned by
+   Verizon and fixed up.  The fields we know about live in slots; anything else
+   Verizon sends goes to the 'extra' dictionary.  Fields can also be read with
+   the dictionary syntax, e.g. overview['billCyleEndDate']."""
+   fields = ('billCyleEndDate', 'summaryAllowance', 'summaryAllowanceInKB',
+      'summaryUsage', 'summaryUsageInKB', 'individualUsage')
+   __slots__ = fields + ('extra',)
+
+   def __init__(self):
+      for k in self.__slots__:
+         setattr(self, k, None)
+
+   def __getitem__(self, k):
+      if k in self.fields:
+         return getattr(self, k)
+      if self.extra is not None and k in self.extra:
+         return self.extra[k]
+      raise KeyError(k)
+
+   def __setitem__(self, k, v):
+      if k in self.fields:
+         setattr(self, k, v)
+      else:
+         if self.extra is None:
+            self.extra = {}
+         self.extra[k] = v
+
+   def __contains__(self, k):
+      if k in self.fields:
+         return getattr(self, k) is not None
+      return self.extra is not None and k in self.extra
+
+   def get(self, k, default=None):
+      return self[k] if k in self else default
+
+class LineInfo:
+   """Overviews of one phone line: the 'sms' and 'data' Overview records.  Also
+   readable as lineInfo['sms'] and lineInfo['data']."""
+   __slots__ = ('sms', 'data')
+
+   def __init__(self, sms=None, data=None):
+      self.sms = sms
+      self.data = data
+
+   def __getitem__(self, resource):
+      return getattr(self, resource)
+
+   def __setitem__(self, resource, v):
+      setattr(self, resource, v)
+
+class LazyLineInfo(collections.abc.Mapping):
+   """The LineInfo of a lazy VerizonScraper: each overview is fetched the first
+   time it's read, and remembered."""
+   __slots__ = ('scraper', 'phoneNum')
+   resources = ('sms', 'data')
+
+   def __init__(self, scraper, phoneNum):
+      self.scraper = scraper
+      self.phoneNum = phoneNum
+
+   def __getitem__(self, resource):
+      if resource not in self.resources:
+         raise KeyError(resource)
+      return self.scraper.getOverview(self.phoneNum, resource)
+
+   def __iter__(self):
+      return iter(self.resources)
+
+   def __len__(self):
+      return len(self.resources)
+
+   @property
+   def sms(self):
+      return self['sms']
+
+   @property
+   def data(self):
+      return self['data']
+
+class LazyAccountInfo(collections.abc.Mapping):
+   """The account info of a lazy VerizonScraper, from phone number to
+   LazyLineInfo."""
+   __slots__ = ('scraper',)
+
+   def __init__(self, scraper):
+      self.scraper = scraper
+
+   def __getitem__(self, phoneNum):
+      if phoneNum not in self.scraper.accountInfo:
+         raise KeyError(phoneNum)
+      return LazyLineInfo(self.scraper, phoneNum)
+
+   def __iter__(self):
+      return iter(self.scraper.accountInfo)
+
+   def __len__(self):
+      return len(self.scraper.accountInfo)
 
 """VerizonScraper is a module that retrieves account information from Verizon's
 web interface.  Verizon does not provide a convenient API for retrieving usage
 info, so this tool simulates a user going through the browser.
 
 To use this module, you need your My Verizon credentials.  Once the object
-exists, you can call getPhoneNumSet() and getAccountInfo()."""
+exists, you can call getPhoneNumSet() and getAccountInfo().
+
+The per-line overviews are fetched one request at a time unless concurrency
+is more than 1, in which case up to that many requests are in flight at once.
+They all share the cookie session of the login.
+
+All requests go through an HttpSession, which keeps connections alive between
+requests.  Pass the same session to later scrapers of the account to reuse its
+connections as well.
+
+With a ResponseCache, the scraper takes the phone numbers and overviews from
+the cache while they are fresh and fetches only the missing or expired ones.
+It doesn't even log in if everything is fresh.
+
+With a SessionStore, the login of a previous run is reused: its cookies and
+phone numbers are loaded and checked with one cheap request, and the full
+login happens only if that session has expired.
+
+A lazy scraper fetches nothing but the phone numbers up front.  Its
+getAccountInfo() fetches every overview the first time it's read; prefetch()
+warms up many of them at once.  A lazy scraper trusts a restored session
+without checking it first.  If Verizon has expired the session, the scraper
+logs in again and retries the request.
+
+A differential scraper (which needs a cache) re-fetches expired overviews of
+one resource by first fetching a single line's.  Its account-wide summary
+fields are compared with every other line's previous overview; where they
+didn't move, nobody's usage did since that overview was fetched, and it is
+kept and refreshed without fetching it again.  The lines whose overviews are
+older than the last change are fetched.  Most runs then cost one request per
+resource.  getSkippedFetches() counts the requests saved."""
 class VerizonScraper:
-   def __init__(self, username, password):
-      self._initUrllib()
-      self._getInitialCj()
-      self.phoneNumSet = self._doLogin(username, password)
+   # Where the scraper goes.  Subclasses may point these elsewhere, e.g. at the
+   # local stand-in in VerizonStandIn.
+   indexUrl = 'http://www.verizonwireless.com/b2c/index.html'
+   loginUrl = 'https://login.verizonwireless.com:443/amserver/UI/Login'
+   loginReferer = 'https://login.vzw.com/cdsso/public/controller?action=logout'
+   secureUrl = 'https://nbillpay.verizonwireless.com/vzw/secure/'
+
+   # Bytes read from a response at a time while parsing it.
+   readSize = 16384
+
+   # The account-wide fields of each resource's overview: the billing cycle,
+   # the plan's allowance and the usage total.
+   summaryFields = {
+      'sms': ('billCyleEndDate', 'summaryAllowance', 'summaryUsage'),
+      'data': ('billCyleEndDate', 'summaryAllowance', 'summaryAllowanceInKB', 'summaryUsageInKB'),
+   }
 
+   # How the fields of each resource's overview are converted from their text.
+   # Fields without a converter are kept as text and counted as unknown; the
+   # required ones are counted as missing if a response lacks them.  See
+   # getFieldReport().
+   schemas = {
+      'sms': {
+         'billCyleEndDate': _parseDate, # lol, Cyle. I spent 10 mins figuring out why this field isn't getting fixed up.
+         'summaryAllowance': _parseAllowance,
+         'summaryAllowanceInKB': _parsePrettyFloat,
+         'summaryUsageInKB': _parsePrettyFloat,
+         'summaryUsage': _parsePrettyInt,
+         'individualUsage': _parsePrettyInt,
+      },
+      'data': {
+         'billCyleEndDate': _parseDate,
+         'summaryAllowance': str,
+         'summaryAllowanceInKB': _parsePrettyFloat,
+         'summaryUsageInKB': _parsePrettyFloat,
+         'summaryUsage': _parsePrettyInt,
+         'individualUsage': _parsePrettyInt,
+      },
+   }
+   requiredFields = {
+      'sms': ('billCyleEndDate', 'summaryAllowance', 'summaryUsage', 'individualUsage'),
+      'data': ('billCyleEndDate', 'summaryAllowanceInKB', 'summaryUsageInKB', 'individualUsage'),
+   }
+
+   userAgent = 'Mozilla/5.0 (Windows NT 6.2; Win64; x64; rv:16.0) Gecko/20121026 Firefox/16.0'
+
+   def __init__(self, username, password, concurrency=1, session=None, cache=None, sessionStore=None, lazy=False, differential=False):
+      self.session = session if session is not None else self.newSession()
+      self.username = username
+      self.password = password
+      self.concurrency = concurrency
+      self.cache = cache
+      self.sessionStore = sessionStore
+      self.lazy = lazy
+      self.differential = differential
+      self.skippedFetches = 0
+      self.fieldLock = threading.Lock()
+      self.unknownFields = collections.Counter()
+      self.missingFields = collections.Counter()
+      self.loggedIn = False
+      self.loginLock = threading.Lock()
+      self.loginGeneration = 0
+
+      self.phoneNumSet = set()
       self.accountInfo = {}
-      for phoneNum in self.phoneNumSet:
-         lineInfo = {'data': None, 'sms': None}
-         lineInfo['data'] = self._getDataOverview(phoneNum)
-         lineInfo['sms'] = self._getSmsOverview(phoneNum)
-         self.accountInfo[phoneNum] = lineInfo
+      phoneNumSet = self._cached(None, 'lines')
+      if phoneNumSet is None:
+         self._login()
+      else:
+         self._setLines(phoneNumSet)
+      if not lazy:
+         self.prefetch()
 
    """This returns the set of phone numbers associated with the account.  The
    phone numbers are formatted as strings of pure digits."""
@@ -50,27 +244,189 @@ class VerizonScraper:
       return self.phoneNumSet
 
    """This returns per-line usage info.  It's formed like this:
-   ['phonenum': {
-      'sms': {
-         usage data provided by Verizon and partially fixed-up
-      },
-      'data': {
-         usage data provided by Verizon and partially fixed-up
-      },
+   {'phonenum': LineInfo(
+      sms=Overview(usage data provided by Verizon and partially fixed-up),
+      data=Overview(usage data provided by Verizon and partially fixed-up),
+    ),
     ...more phone numbers...
-   ]"""
+   }
+   A lazy scraper returns a LazyAccountInfo of the same shape instead."""
    def getAccountInfo(self):
+      if self.lazy:
+         return LazyAccountInfo(self)
       return self.accountInfo
 
-   def _initUrllib(self):
-      cj = urllib.request.HTTPCookieProcessor()
-      #opener = urllib.request.build_opener(cj, PrintedHTTPHandler(), PrintedHTTPSHandler())
-      opener = urllib.request.build_opener(cj)
-      opener.addheaders = [('User-Agent', 'Mozilla/5.0 (Windows NT 6.2; Win64; x64; rv:16.0) Gecko/20121026 Firefox/16.0')]
-      urllib.request.install_opener(opener)
+   """This returns the Overview of one resource ('sms' or 'data') of one line,
+   fetching it if it isn't known yet."""
+   def getOverview(self, phoneNum, resource):
+      overview = self.accountInfo[phoneNum][resource]
+      if overview is None:
+         self.prefetch([phoneNum], [resource])
+         overview = self.accountInfo[phoneNum][resource]
+      return overview
+
+   """This fetches the overviews of the given lines and resources that aren't
+   known yet, up to 'concurrency' requests at a time.  By default it fetches
+   both resources of every line."""
+   def prefetch(self, lines=None, resources=('data', 'sms')):
+      todo = self._missing(self.phoneNumSet if lines is None else lines, resources)
+      if todo and not self.loggedIn:
+         before = self.phoneNumSet
+         self._login()
+         if self.phoneNumSet != before:
+            # The lines changed since they were cached.
+            todo = [(phoneNum, resource) for (phoneNum, resource) in todo if phoneNum in self.accountInfo]
+            if lines is None:
+               todo.extend(self._missing(self.phoneNumSet - before, resources))
+      if self.differential and self.cache is not None:
+         todo = self._skipUnchanged(todo)
+      self._fetchOverviews(todo, self.concurrency)
+
+   """This returns how many overview requests the differential mode saved."""
+   def getSkippedFetches(self):
+      return self.skippedFetches
+
+   """This returns the fields the fetched overviews had that the schemas don't
+   know, and the required fields they lacked, as {'unknown': Counter,
+   'missing': Counter}, where the counters count overviews by (resource,
+   field).  A new or renamed field on Verizon's side shows up here."""
+   def getFieldReport(self):
+      with self.fieldLock:
+         return {'unknown': collections.Counter(self.unknownFields), 'missing': collections.Counter(self.missingFields)}
+
+   # Returns the (phoneNum, resource) overviews of lines and resources that
+   # are neither known nor cached, and takes the cached ones.
+   def _missing(self, lines, resources):
+      todo = []
+      for phoneNum in lines:
+         for resource in resources:
+            if self.accountInfo[phoneNum][resource] is not None:
+               continue
+            overview = self._cached(phoneNum, resource)
+            if overview is None:
+               todo.append((phoneNum, resource))
+            else:
+               self.accountInfo[phoneNum][resource] = overview
+      return todo
+
+   def _skipUnchanged(self, todo):
+      """Probes one line per resource of todo and returns what still has to be
+      fetched: every line whose previous overview's summary differs from the
+      probe's, since that overview is older than somebody's usage."""
+      byResource = collections.OrderedDict()
+      for (phoneNum, resource) in todo:
+         byResource.setdefault(resource, []).append(phoneNum)
+      remaining = []
+      for (resource, phoneNums) in byResource.items():
+         previous = [self.cache.peek(self.username, phoneNum, resource) for phoneNum in phoneNums[1:]]
+         if all(p is None for p in previous):
+            remaining.extend((phoneNum, resource) for phoneNum in phoneNums)
+            continue
+         probe = self._fetcher(resource)(phoneNums[0])
+         self._store(phoneNums[0], resource, probe)
+         fields = self.summaryFields[resource]
+         # Without the usage total there's nothing to tell a change by.
+         comparable = fields[-1] in probe
+         for (phoneNum, p) in zip(phoneNums[1:], previous):
+            # The lines may have been fetched at different times, so each one
+            # is compared on its own.
+            if p is not None and comparable and all(probe.get(f) == p[1].get(f) for f in fields):
+               self._store(phoneNum, resource, p[1])
+               self.skippedFetches += 1
+            else:
+               remaining.append((phoneNum, resource))
+      return remaining
+
+   def _login(self):
+      phoneNumSet = None
+      if self.sessionStore is not None:
+         phoneNumSet = self.sessionStore.load(self.username, self.session.cookies)
+         if phoneNumSet is not None and not self.lazy and not self._sessionIsLive():
+            phoneNumSet = None
+      if phoneNumSet is None:
+         phoneNumSet = self._fullLogin()
+      self.loggedIn = True
+      self._loggedInTo(phoneNumSet)
+
+   def _fullLogin(self):
+      self._getInitialCj()
+      phoneNumSet = self._doLogin(self.username, self.password)
+      if self.sessionStore is not None:
+         self.sessionStore.save(self.username, self.session.cookies, phoneNumSet)
+      self.loginGeneration += 1
+      return phoneNumSet
+
+   # Logs in again after a request found the session expired.  generation is
+   # the login the request was made under; if another thread has logged in
+   # since, there is nothing to do.
+   def _relogin(self, generation):
+      with self.loginLock:
+         if self.loginGeneration == generation:
+            self._loggedInTo(self._fullLogin())
+
+   # Takes the lines found at login, and caches them.
+   def _loggedInTo(self, phoneNumSet):
+      self._setLines(phoneNumSet)
+      if self.cache is not None:
+         self.cache.put(self.username, None, 'lines', phoneNumSet)
+
+   # Takes phoneNumSet as the account's lines, keeping the overviews of the
+   # lines that stay.
+   def _setLines(self, phoneNumSet):
+      self.accountInfo = dict((phoneNum, self.accountInfo.get(phoneNum) or LineInfo())
+         for phoneNum in phoneNumSet)
+      self.phoneNumSet = phoneNumSet
+
+   def _cached(self, phoneNum, resource):
+      if self.cache is None:
+         return None
+      return self.cache.get(self.username, phoneNum, resource)
+
+   def _store(self, phoneNum, resource, overview):
+      lineInfo = self.accountInfo.get(phoneNum)
+      if lineInfo is not None: # else the line left the account meanwhile
+         lineInfo[resource] = overview
+      if self.cache is not None:
+         self.cache.put(self.username, phoneNum, resource, overview)
+
+   def _fetcher(self, resource):
+      if resource == 'data':
+         return self._getDataOverview
+      elif resource == 'sms':
+         return self._getSmsOverview
+      raise KeyError(resource)
+
+   def _fetchOverviews(self, todo, concurrency):
+      """Fetches the (phoneNum, resource) overviews in todo into accountInfo."""
+      if concurrency <= 1:
+         for (phoneNum, resource) in todo:
+            self._store(phoneNum, resource, self._fetcher(resource)(phoneNum))
+         return
+      with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+         futures = dict((pool.submit(self._fetcher(resource), phoneNum), (phoneNum, resource))
+            for (phoneNum, resource) in todo)
+         for f in concurrent.futures.as_completed(futures):
+            (phoneNum, resource) = futures[f]
+            self._store(phoneNum, resource, f.result())
+
+   """This returns the HttpSession the scraper uses."""
+   def getSession(self):
+      return self.session
+
+   """This returns a new HttpSession suitable for scraping Verizon, whose
+   requests go through the HostLimiter limiter if one is given."""
+   @classmethod
+   def newSession(cls, limiter=None):
+      return HttpSession(headers=[('User-Agent', cls.userAgent)], limiter=limiter)
+
+   # An expired session gets redirected to the login page.
+   def _sessionIsLive(self):
+      with self.session.get(self.secureUrl + 'router.action', followRedirects=False) as r:
+         return r.status == 200
 
    def _getInitialCj(self):
-      r = urllib.request.urlopen('http://www.verizonwireless.com/b2c/index.html')
+      with self.session.get(self.indexUrl) as r:
+         pass
 
    # The login function's responsibility is to log in to Verizon Wireless and
    # retrieve phone numbers associated with this account.
@@ -86,10 +442,12 @@ class VerizonScraper:
          'rememberUserName': 'Y',
          'signIntoMyVerizonButton': '',
       }).encode('utf-8')
-      req = urllib.request.Request('https://login.verizonwireless.com:443/amserver/UI/Login', logindata)
-      req.add_header('Referer', 'https://login.vzw.com/cdsso/public/controller?action=logout')
-      r = urllib.request.urlopen(req)
+      with self.session.post(self.loginUrl, logindata, {'Referer': self.loginReferer}) as r:
+         if r.status != 200:
+            raise Error("Verizon answered %d to the login" % r.status)
+         return self._parseLoginPage(r)
 
+   def _parseLoginPage(self, r):
       # The layout of the webpage is a bit different depending on whether there's
       # just one line or multiple lines associated with the account.  Fortunately
       # we can always search through the webpage both ways end end up with the
@@ -110,7 +468,7 @@ class VerizonScraper:
             num = moMulti.group(1).replace('-', '')
             phoneNums.append(num)
       #f.close()
-      #for c in cj.cookiejar:
+      #for c in self.session.cookies:
       #	if c.name == 'JSESSIONID':	
       #		sid = c.value
       #		print("Session ID: %s" % c.value)
@@ -123,60 +481,78 @@ class VerizonScraper:
       for l in lines:
          yield l.decode('utf-8')
 
+   # Verizon redirects requests of an expired session to the login page.  When
+   # that happens, log in again and retry once.  The secure pages only read,
+   # so they may be posted again if a kept-alive connection drops them.
+   def _postSecure(self, page, reqData):
+      for attempt in range(2):
+         generation = self.loginGeneration
+         r = self.session.post(self.secureUrl + page, reqData,
+            {'Referer': self.secureUrl + 'router.action'}, followRedirects=False, idempotent=True)
+         if r.status == 200:
+            return r
+         r.close()
+         if r.status not in (301, 302, 303, 307, 308):
+            raise Error("Verizon answered %d to %s" % (r.status, page))
+         if attempt == 0:
+            self._relogin(generation)
+      raise Error("Verizon keeps redirecting %s; is the login failing?" % page)
+
    def _getSmsOverview(self, phoneNum):
       reqData = urllib.parse.urlencode({
          'activeMtn': phoneNum,
       }).encode('utf-8')
-      req = urllib.request.Request('https://nbillpay.verizonwireless.com/vzw/secure/overview/OverviewMessaging.action', reqData)
-      req.add_header('Referer', 'https://nbillpay.verizonwireless.com/vzw/secure/router.action')
-      r = urllib.request.urlopen(req)
-      xmlstring = ''.join(self._decodeToUtf8(r.readlines()))
-      root = ET.fromstring(xmlstring)
-      dataDict = {}
-      for child in root:
-         (k, v) = self._fixupSmsEntry(child.tag, child.text)
-         dataDict[k] = v
-      return dataDict
+      with self._postSecure('overview/OverviewMessaging.action', reqData) as r:
+         return self._checkFields('sms', self._parseOverview(r, self.schemas['sms']))
 
    def _getDataOverview(self, phoneNum):
       reqData = urllib.parse.urlencode({
          'activeMtn': phoneNum,
          'connectHotspotCall': 'false',
       }).encode('utf-8')
-      req = urllib.request.Request('https://nbillpay.verizonwireless.com/vzw/secure/overview/OverviewData.action', reqData)
-      req.add_header('Referer', 'https://nbillpay.verizonwireless.com/vzw/secure/router.action')
-      r = urllib.request.urlopen(req)
-      xmlstring = ''.join(self._decodeToUtf8(r.readlines()))
-      root = ET.fromstring(xmlstring)
-      dataDict = {}
-      for child in root:
-         (k, v) = self._fixupDataEntry(child.tag, child.text)
-         dataDict[k] = v
-      return dataDict
-
-   def _fixupSmsEntry(self, k, v):
-      # integers
-      if k == 'summaryAllowance':
-         if v != 'Unlimited':
-            v = int(self._fixupPrettyFloatStr(v))  # convert to float first because some logical integers end with ".0".
-      else:
-         return self._fixupGenericEntry(k, v)
-      return (k, v)
-
-   def _fixupDataEntry(self, k, v):
-      return self._fixupGenericEntry(k, v)
-
-   def _fixupGenericEntry(self, k, v):
-      if k == 'billCyleEndDate': # lol, Cyle. I spent 10 mins figuring out why this field isn't getting fixed up.
-         v = datetime.datetime.strptime(v, "%m/%d/%y").date()
-      # floats
-      elif k == 'summaryAllowanceInKB' or k == 'summaryUsageInKB':
-         v = self._fixupPrettyFloatStr(v)
-      # integers
-      elif k == 'summaryUsage' or k == 'individualUsage':
-         v = int(self._fixupPrettyFloatStr(v))  # convert to float first because some logical integers end with ".0".
-      return (k, v)
-
-   def _fixupPrettyFloatStr(self, n):
-      return float(n.replace(',', ''))
+      with self._postSecure('overview/OverviewData.action', reqData) as r:
+         return self._checkFields('data', self._parseOverview(r, self.schemas['data']))
+
+   # The overview XML is a flat list of fields under the root element.  It is
+   # parsed straight from the response bytes as they arrive; every field is
+   # converted by its schema entry as soon as its element is complete, and the
+   # finished elements are dropped after each chunk, so the whole document never
+   # sits in memory.
+   def _parseOverview(self, r, schema):
+      parser = ET.XMLPullParser(('start', 'end'))
+      overview = Overview()
+      root = None
+      depth = 0
+      while True:
+         chunk = r.read(self.readSize)
+         if not chunk:
+            break
+         parser.feed(chunk)
+         for (event, elem) in parser.read_events():
+            if event == 'start':
+               if root is None:
+                  root = elem
+               depth += 1
+            else:
+               depth -= 1
+               if depth == 1:
+                  convert = schema.get(elem.tag)
+                  v = elem.text
+                  if convert is not None and v is not None:
+                     v = convert(v)
+                  overview[elem.tag] = v
+         if root is not None:
+            del root[:]
+      parser.close()
+      return overview
+
+   def _checkFields(self, resource, overview):
+      schema = self.schemas[resource]
+      unknown = [k for k in (overview.extra or ()) if k not in schema]
+      missing = [k for k in self.requiredFields[resource] if k not in overview]
+      if unknown or missing:
+         with self.fieldLock:
+            self.unknownFields.update((resource, k) for k in unknown)
+            self.missingFields.update((resource, k) for k in missing)
+      return overview
 
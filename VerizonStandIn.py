@@ -0,0 +1,246 @@
+#!/bin/env python3
+
+import http.server
+import os
+import random
+import ssl
+import string
+import threading
+import time
+import urllib.parse
+
+"""VerizonStandIn is a local imitation of the parts of Verizon's web site that
+VerizonScraper talks to.  It serves a login page listing the account's phone
+numbers and the SMS and data overview XML for each of them, so the scraper can
+be exercised and timed without the live site.
+
+The responses are filled in from fixture templates: login.html,
+OverviewMessaging.xml and OverviewData.xml in fixtureDir.  The bundled ones in
+fixtures/verizon are synthetic, written from the patterns and field names
+VerizonScraper looks for rather than captured from the live site.  Other
+templates can be put in a directory of their own, with the account-specific
+values replaced by the $placeholders the bundled templates use.
+
+The account is synthetic: phone numbers 555-000-0000 and up, with usage
+derived from the phone number plus whatever addUsage() adds.  Like on the real
+site, summaryUsage and summaryUsageInKB are totals of the whole account and
+individualUsage is the line's own usage.
+
+Every request is delayed by latency seconds, give or take a uniformly random
+jitter, to imitate the round trip to Verizon, and fails with a 503 with
+probability errorRate.  Each login starts a session that lasts sessionTtl
+seconds (forever if None); requests for the secure pages without a live
+session are redirected to the login page, like on the real site.  Given a
+certfile (and keyfile), the stand-in speaks HTTPS.
+
+Typical use:
+   standIn = StandIn(lines=8, latency=0.05)
+   standIn.start()
+   vz = standIn.scraperClass(VerizonScraper)('user', 'pass')
+   standIn.stop()"""
+
+SESSION_COOKIE = 'JSESSIONID'
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'verizon')
+
+class StandIn:
+   # seed makes the jitter and the errors repeatable.
+   def __init__(self, lines=4, latency=0.0, port=0, sessionTtl=None, jitter=0.0, errorRate=0.0,
+         fixtureDir=DEFAULT_FIXTURES, certfile=None, keyfile=None, seed=None):
+      self.phoneNums = ['%010d' % (5550000000 + i) for i in range(lines)]
+      self.latency = latency
+      self.jitter = jitter
+      self.errorRate = errorRate
+      self.random = random.Random(seed)
+      self.templates = {}
+      for name in ('login.html', 'OverviewMessaging.xml', 'OverviewData.xml'):
+         with open(os.path.join(fixtureDir, name), 'r', encoding='utf-8') as f:
+            self.templates[name] = string.Template(f.read())
+      self.sessionTtl = sessionTtl
+      self.sessions = {} # session cookie value -> login time
+      # The end of the billing cycle the overviews report, as Verizon writes it.
+      self.billCycleEnd = '12/24/12'
+      self.extraSms = dict((n, 0) for n in self.phoneNums)
+      self.extraDataKB = dict((n, 0) for n in self.phoneNums)
+      self.logins = 0
+      self.requests = 0
+      self.errors = 0
+      self.lock = threading.Lock()
+      self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), _Handler)
+      self.server.daemon_threads = True
+      self.server.standIn = self
+      self.scheme = 'http'
+      if certfile is not None:
+         context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+         context.load_cert_chain(certfile, keyfile)
+         self.server.socket = context.wrap_socket(self.server.socket, server_side=True)
+         self.scheme = 'https'
+      self.thread = None
+
+   def start(self):
+      self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+      self.thread.start()
+
+   def stop(self):
+      self.server.shutdown()
+      self.server.server_close()
+      self.thread.join()
+
+   def baseUrl(self):
+      (host, port) = self.server.server_address
+      return '%s://%s:%d/' % (self.scheme, host, port)
+
+   def urls(self):
+      """Returns the VerizonScraper URL attributes that point at this stand-in."""
+      base = self.baseUrl()
+      return {
+         'indexUrl': base + 'b2c/index.html',
+         'loginUrl': base + 'amserver/UI/Login',
+         'loginReferer': base + 'cdsso/public/controller?action=logout',
+         'secureUrl': base + 'vzw/secure/',
+      }
+
+   def scraperClass(self, cls):
+      """Returns a subclass of the scraper class cls that talks to this
+      stand-in."""
+      return type('StandIn' + cls.__name__, (cls,), self.urls())
+
+   def addUsage(self, phoneNum, sms=0, dataKB=0):
+      """Makes a line use more."""
+      with self.lock:
+         self.extraSms[phoneNum] += sms
+         self.extraDataKB[phoneNum] += dataKB
+
+   def setLines(self, lines):
+      """Gives the account lines lines from now on, as if some were added or
+      cancelled."""
+      with self.lock:
+         self.phoneNums = ['%010d' % (5550000000 + i) for i in range(lines)]
+         for n in self.phoneNums:
+            self.extraSms.setdefault(n, 0)
+            self.extraDataKB.setdefault(n, 0)
+
+   def expireSessions(self):
+      """Logs everybody out."""
+      with self.lock:
+         self.sessions.clear()
+
+   # SESSIONS
+
+   def newSession(self):
+      with self.lock:
+         self.logins += 1
+         token = 'standin%d' % self.logins
+         self.sessions[token] = time.time()
+      return token
+
+   def isLive(self, token):
+      with self.lock:
+         started = self.sessions.get(token)
+      if started is None:
+         return False
+      return self.sessionTtl is None or time.time() - started < self.sessionTtl
+
+   # Counts a request and returns how long to delay it and whether to fail it.
+   def nextRequest(self):
+      with self.lock:
+         self.requests += 1
+         delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+         fail = self.random.random() < self.errorRate
+         if fail:
+            self.errors += 1
+      return (delay, fail)
+
+   # RESPONSES
+
+   def loginPage(self):
+      # Same two layouts the scraper knows: one line, or a drop-down of lines.
+      selectedMtn = ''
+      mtnOptions = ''
+      if len(self.phoneNums) == 1:
+         selectedMtn = "\tSELECTED_MTN :'%s'," % self.phoneNums[0]
+      else:
+         mtnOptions = '\n'.join('    <option value="%s-%s-%s">' % (n[0:3], n[3:6], n[6:10]) for n in self.phoneNums)
+      return self.templates['login.html'].substitute(selectedMtn=selectedMtn, mtnOptions=mtnOptions)
+
+   def smsOverview(self, phoneNum):
+      return self.templates['OverviewMessaging.xml'].substitute(
+         billCyleEndDate=self.billCycleEnd,
+         summaryAllowance='1,000.0',
+         summaryUsage='{:,}'.format(sum(self._smsUsed(n) for n in self.phoneNums)),
+         individualUsage='{:,}'.format(self._smsUsed(phoneNum)),
+      )
+
+   def dataOverview(self, phoneNum):
+      return self.templates['OverviewData.xml'].substitute(
+         billCyleEndDate=self.billCycleEnd,
+         summaryAllowanceInKB='{:,.2f}'.format(2 * 1024 * 1024),
+         summaryUsageInKB='{:,.2f}'.format(sum(self._dataUsedKB(n) for n in self.phoneNums)),
+         individualUsage='{:,}'.format(int(self._dataUsedKB(phoneNum))),
+      )
+
+   def _smsUsed(self, phoneNum):
+      return int(phoneNum) % 997 + self.extraSms[phoneNum]
+
+   def _dataUsedKB(self, phoneNum):
+      return (int(phoneNum) % 1511) * 1024 + self.extraDataKB[phoneNum]
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+   protocol_version = 'HTTP/1.1'
+   # Headers and body go out in separate writes; without this, keep-alive
+   # connections stall on delayed ACKs.
+   disable_nagle_algorithm = True
+
+   def do_GET(self):
+      self._serve(None)
+
+   def do_POST(self):
+      length = int(self.headers.get('Content-Length', 0))
+      form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'))
+      self._serve(form)
+
+   def _serve(self, form):
+      standIn = self.server.standIn
+      (delay, fail) = standIn.nextRequest()
+      if delay:
+         time.sleep(delay)
+      if fail:
+         self._reply(503, 'text/html', 'Service unavailable\n')
+         return
+      path = urllib.parse.urlsplit(self.path).path
+      if path == '/b2c/index.html':
+         self._reply(200, 'text/html', '<html></html>\n', [('Set-Cookie', 'VZINIT=1; Path=/')])
+      elif path == '/amserver/UI/Login' and form is not None:
+         self._reply(200, 'text/html', standIn.loginPage(), [('Set-Cookie', '%s=%s; Path=/' % (SESSION_COOKIE, standIn.newSession()))])
+      elif path.startswith('/vzw/secure/'):
+         if not standIn.isLive(self._cookies().get(SESSION_COOKIE)):
+            self._reply(302, 'text/html', '', [('Location', '/amserver/UI/Login')])
+         elif path == '/vzw/secure/router.action':
+            self._reply(200, 'text/html', '<html></html>\n')
+         elif path == '/vzw/secure/overview/OverviewMessaging.action' and form is not None:
+            self._reply(200, 'text/xml', standIn.smsOverview(form['activeMtn'][0]))
+         elif path == '/vzw/secure/overview/OverviewData.action' and form is not None:
+            self._reply(200, 'text/xml', standIn.dataOverview(form['activeMtn'][0]))
+         else:
+            self._reply(404, 'text/html', 'Not found\n')
+      else:
+         self._reply(404, 'text/html', 'Not found\n')
+
+   def _cookies(self):
+      cookies = {}
+      for pair in self.headers.get('Cookie', '').split(';'):
+         (k, _, v) = pair.strip().partition('=')
+         cookies[k] = v
+      return cookies
+
+   def _reply(self, code, contentType, body, headers=()):
+      body = body.encode('utf-8')
+      self.send_response(code)
+      self.send_header('Content-Type', contentType + '; charset=UTF-8')
+      self.send_header('Content-Length', str(len(body)))
+      for (k, v) in headers:
+         self.send_header(k, v)
+      self.end_headers()
+      self.wfile.write(body)
+
+   def log_message(self, *args):
+      pass
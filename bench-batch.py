@@ -0,0 +1,66 @@
+#!/bin/env python3
+
+"""Evaluates a fleet of accounts with one Alerter per account and with one
+BatchAlerter over all of them, and compares the time each takes to every
+account's health and every user's warning code: the BatchAlerter both from
+the accounts' dictionaries and from ready columns."""
+
+import random
+import time
+from SharedUsageAlerter import Alerter, BatchAlerter
+
+ACCOUNTS = 50000
+USERS_PER_ACCOUNT = 4
+RUNS = 3
+
+def fleet():
+   rnd = random.Random(1)
+   accounts = []
+   for _ in range(ACCOUNTS):
+      # Accounts are polled on their own billing cycles, a day apart.
+      bf = rnd.randint(1, 30) / 31
+      usage = {}
+      for j in range(USERS_PER_ACCOUNT):
+         quota = rnd.choice((None, 1.0, 2.0))
+         usage['user%d' % j] = {'quota': quota, 'used': rnd.uniform(0, 2.5) * bf}
+      accounts.append({'billing-frac': bf, 'global-quota': 10.0, 'usage': usage})
+   return accounts
+
+def perAccount(accounts):
+   health, codes = [], []
+   for d in accounts:
+      a = Alerter(d)
+      health.append(a.accountHealth())
+      codes.extend(a.userStatus(name)['warning-code'] for name in d['usage'])
+   return (health, codes)
+
+def batch(accounts):
+   (b, _) = BatchAlerter.fromAccounts(accounts)
+   return (list(b.accountHealth()), list(b.warningCodes()))
+
+def columns(accounts):
+   (b, _) = BatchAlerter.fromAccounts(accounts)
+   return (b.bf, b.gq, b.acct, b.lq, b.lu)
+
+def batchColumns(columns):
+   b = BatchAlerter(*columns)
+   return (list(b.accountHealth()), list(b.warningCodes()))
+
+def measure(f, data):
+   best = None
+   for _ in range(RUNS):
+      start = time.perf_counter()
+      result = f(data)
+      elapsed = time.perf_counter() - start
+      best = elapsed if best is None else min(best, elapsed)
+   return (result, best)
+
+accounts = fleet()
+print("%d accounts of %d users:" % (ACCOUNTS, USERS_PER_ACCOUNT))
+results = []
+for (name, f, data) in (("per account", perAccount, accounts), ("batch", batch, accounts),
+      ("columns", batchColumns, columns(accounts))):
+   (result, elapsed) = measure(f, data)
+   results.append(result)
+   print("   %-11s %7.3f s, %6.2f us/user" % (name, elapsed, elapsed / (ACCOUNTS * USERS_PER_ACCOUNT) * 1e6))
+assert results[0] == results[1] == results[2]
@@ -0,0 +1,76 @@
+#!/bin/env python3
+
+"""Records a billing cycle of usage readings of a big account into a
+UsageHistory, then compares warming up the BurnRateForecasters from it by
+loading every sample into a list first and by streaming the samples straight
+from the mapped file: time and peak memory.  Also times finding the last day
+of the cycle by bisection."""
+
+import collections
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+import UsageHistory
+from SharedUsageAlerter import BurnRateForecaster
+
+LINES = 2000
+READINGS_PER_DAY = 4
+DAYS = 31
+START = 1356998400.0 # any start of a cycle
+
+def record(path):
+   rnd = random.Random(1)
+   rates = [rnd.uniform(0.5, 5) for _ in range(LINES)]
+   used = [0.0] * LINES
+   with UsageHistory.UsageHistory(path) as history:
+      for step in range(1, DAYS * READINGS_PER_DAY + 1):
+         bf = step / (DAYS * READINGS_PER_DAY)
+         t = START + bf * DAYS * 86400
+         for n in range(LINES):
+            used[n] += rates[n] / (DAYS * READINGS_PER_DAY) * rnd.uniform(0, 2)
+            history.append('user', '%010d' % (5550000000 + n), 'data', t, bf, used[n])
+
+def loaded(path):
+   forecasters = collections.defaultdict(BurnRateForecaster)
+   with UsageHistory.HistoryReader(path) as history:
+      samples = list(history.samples())
+   for ((account, line, resource), _, bf, used) in samples:
+      forecasters[(account, resource)].update(line, bf, used)
+   return forecasters
+
+def streamed(path):
+   forecasters = collections.defaultdict(BurnRateForecaster)
+   UsageHistory.replay(path, forecasters)
+   return forecasters
+
+# Tracing the memory slows Python down, so the time is taken from a run of
+# its own.
+def measure(f, *args):
+   start = time.perf_counter()
+   f(*args)
+   elapsed = time.perf_counter() - start
+   tracemalloc.start()
+   result = f(*args)
+   peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   return (result, elapsed, peak)
+
+with tempfile.TemporaryDirectory() as d:
+   path = os.path.join(d, 'history')
+   start = time.perf_counter()
+   record(path)
+   print("%d lines x %d readings: recorded in %.2f s, %d bytes"
+      % (LINES, DAYS * READINGS_PER_DAY, time.perf_counter() - start, os.path.getsize(path)))
+   rates = None
+   for (name, warmUp) in (("loaded", loaded), ("streamed", streamed)):
+      (forecasters, elapsed, peak) = measure(warmUp, path)
+      rate = forecasters[('user', 'data')].rate('5550000007')
+      assert rates is None or rates == rate
+      rates = rate
+      print("   %-8s warm-up %6.2f s, peak %8.1f MB" % (name, elapsed, peak / 2**20))
+   with UsageHistory.HistoryReader(path) as history:
+      start = time.perf_counter()
+      lastDay = sum(1 for _ in history.samples(START + (DAYS - 1) * 86400))
+      print("   last day: %d samples in %.1f ms" % (lastDay, (time.perf_counter() - start) * 1000))
@@ -0,0 +1,79 @@
+#!/bin/env python3
+
+"""Compares mailing a run's alerts one message and one SMTP conversation per
+alert with SmtpDelivery's per-recipient digests over pooled connections,
+against the local SMTP stand-in.  Then measures how long the evaluation of
+several accounts is held up by delivering their alerts, with SmtpDelivery and
+with AsyncDelivery in front of it."""
+
+import email.message
+import smtplib
+import time
+from MailDelivery import SmtpDelivery, AsyncDelivery
+from SmtpStandIn import SmtpStandIn
+
+LINES = 50
+RESOURCES = ('data', 'SMS')
+LATENCY = 0.002 # seconds per SMTP command
+ACCOUNTS = 10
+
+def alerts():
+   for n in range(LINES):
+      for resource in RESOURCES:
+         yield ('%010d' % (5550000000 + n), resource, "Warning about %s" % resource)
+
+def addresses():
+   return dict(('%010d' % (5550000000 + n), 'line%d@example.com' % n) for n in range(LINES))
+
+def onePerAlert(port):
+   to = addresses()
+   for (line, resource, text) in alerts():
+      message = email.message.EmailMessage()
+      message['From'] = 'alerts@localhost'
+      message['To'] = to[line]
+      message['Subject'] = 'Usage alert: %s' % resource
+      message.set_content(text + '\n')
+      with smtplib.SMTP('127.0.0.1', port) as conn:
+         conn.send_message(message)
+   return (LINES * len(RESOURCES), LINES * len(RESOURCES))
+
+def digests(port, poolSize):
+   delivery = SmtpDelivery('127.0.0.1', port, addresses=addresses(), poolSize=poolSize)
+   for (line, resource, text) in alerts():
+      delivery.queue(line, resource, text)
+   delivery.flush()
+   delivery.close()
+   stats = delivery.stats()
+   return (stats['sent'], stats['opened'])
+
+print("%d lines x %d resources, %.0f ms per SMTP command:" % (LINES, len(RESOURCES), LATENCY * 1000))
+for (name, send) in (
+      ("one message per alert", onePerAlert),
+      ("digests, 1 connection", lambda port: digests(port, 1)),
+      ("digests, 4 connections", lambda port: digests(port, 4))):
+   standIn = SmtpStandIn(latency=LATENCY)
+   standIn.start()
+   start = time.perf_counter()
+   (sent, opened) = send(standIn.port())
+   elapsed = time.perf_counter() - start
+   standIn.stop()
+   print("   %-23s %6.3f s, %3d messages, %3d connections" % (name, elapsed, sent, opened))
+
+# Every account flushes its alerts at the end of its evaluation.
+print("%d accounts of %d lines:" % (ACCOUNTS, LINES))
+for (name, wrap) in (("synchronous", lambda d: d), ("asynchronous", AsyncDelivery)):
+   standIn = SmtpStandIn(latency=LATENCY)
+   standIn.start()
+   delivery = wrap(SmtpDelivery('127.0.0.1', standIn.port(), addresses=addresses(), poolSize=4))
+   start = time.perf_counter()
+   held = 0.0
+   for _ in range(ACCOUNTS):
+      for (line, resource, text) in alerts():
+         delivery.queue(line, resource, text)
+      flushStart = time.perf_counter()
+      delivery.flush()
+      held += time.perf_counter() - flushStart
+   delivery.close()
+   elapsed = time.perf_counter() - start
+   standIn.stop()
+   print("   %-13s evaluation held up %6.3f s, all delivered after %6.3f s" % (name, held, elapsed))
@@ -0,0 +1,57 @@
+#!/bin/env python3
+
+"""Measures how much memory one phone line's usage costs when it's held as
+nested dictionaries versus the compact record classes."""
+
+import datetime
+import tracemalloc
+from SharedUsageAlerter import LineUsage
+from VerizonScraper import Overview, LineInfo
+
+LINES = 100000
+
+def usageDict(i):
+   return {'quota': 2.0 + i, 'used': 1.0 + i}
+
+def usageRecord(i):
+   return LineUsage(1.0 + i, 2.0 + i)
+
+def overviewFields(i):
+   return {
+      'billCyleEndDate': datetime.date(2013, 1, 1 + i % 28),
+      'summaryAllowance': 1000 + i,
+      'summaryUsage': 500 + i,
+      'individualUsage': 100 + i,
+      'summaryAllowanceInKB': 2097152.0 + i,
+      'summaryUsageInKB': 1048576.0 + i,
+   }
+
+def lineInfoDict(i):
+   return {'sms': overviewFields(i), 'data': overviewFields(i)}
+
+def lineInfoRecord(i):
+   def overview():
+      o = Overview()
+      for (k, v) in overviewFields(i).items():
+         o[k] = v
+      return o
+   return LineInfo(overview(), overview())
+
+def bytesPerLine(make):
+   tracemalloc.start()
+   before = tracemalloc.get_traced_memory()[0]
+   lines = dict((str(5550000000 + i), make(i)) for i in range(LINES))
+   after = tracemalloc.get_traced_memory()[0]
+   tracemalloc.stop()
+   del lines
+   return (after - before) / LINES
+
+def compare(what, makeDict, makeRecord):
+   d = bytesPerLine(makeDict)
+   r = bytesPerLine(makeRecord)
+   print("%-28s dict %6.0f B/line, record %6.0f B/line, saved %6.0f B/line (%.0f%%)"
+      % (what, d, r, d - r, (d - r) / d * 100))
+
+print("Memory per line, %d lines (values included):" % LINES)
+compare("Alerter usage:", usageDict, usageRecord)
+compare("VerizonScraper account info:", lineInfoDict, lineInfoRecord)
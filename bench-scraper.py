@@ -0,0 +1,107 @@
+#!/bin/env python3
+
+"""Times full VerizonScraper runs against the local stand-in.  First a scrape
+sequentially and with several concurrency limits, counting the connections
+used; then a series of scrapes over one session, reporting throughput and the
+latency percentiles of whole scrapes and of single requests; finally many
+accounts at once through the ScrapeScheduler.  Run with --help for the
+knobs."""
+
+import argparse
+import math
+import time
+from HttpSession import HttpSession
+from ScrapeScheduler import ScrapeScheduler
+from VerizonScraper import VerizonScraper, Error
+from VerizonStandIn import StandIn
+
+def percentile(sortedValues, p):
+   """Nearest-rank percentile of an already sorted list."""
+   if not sortedValues:
+      return float('nan')
+   rank = max(1, math.ceil(p / 100 * len(sortedValues)))
+   return sortedValues[rank - 1]
+
+def percentiles(values):
+   values = sorted(values)
+   return "p50 %7.1f ms, p90 %7.1f ms, p99 %7.1f ms" % tuple(percentile(values, p) * 1000 for p in (50, 90, 99))
+
+def newSession():
+   return HttpSession(headers=[('User-Agent', VerizonScraper.userAgent)], recordLatencies=True)
+
+def timeScrape(scraperClass, lines, concurrency, session=None):
+   start = time.perf_counter()
+   vz = scraperClass('user', 'pass', concurrency=concurrency, session=session)
+   elapsed = time.perf_counter() - start
+   assert len(vz.getAccountInfo()) == lines
+   return (elapsed, vz.getSession())
+
+def connectionStats(session):
+   stats = session.stats()
+   return "%2d requests, %2d connections opened, %2d reused" % (stats['requests'], stats['opened'], stats['reused'])
+
+def concurrencySweep(scraperClass, args):
+   base = None
+   for concurrency in (1, 2, 4, 8, 16):
+      (elapsed, session) = timeScrape(scraperClass, args.lines, concurrency)
+      base = base or elapsed
+      print("concurrency %2d: %.3f s (%.1fx); %s" % (concurrency, elapsed, base / elapsed, connectionStats(session)))
+   # A long-running process scraping again over the same session.
+   (elapsed, session) = timeScrape(scraperClass, args.lines, 4)
+   (elapsed, session) = timeScrape(scraperClass, args.lines, 4, session)
+   print("two scrapes, one session, concurrency 4: %.3f s for the second; %s" % (elapsed, connectionStats(session)))
+
+def throughput(scraperClass, args):
+   session = newSession()
+   scrapeTimes = []
+   failures = 0
+   start = time.perf_counter()
+   for _ in range(args.scrapes):
+      try:
+         (elapsed, session) = timeScrape(scraperClass, args.lines, args.concurrency, session)
+         scrapeTimes.append(elapsed)
+      except Error:
+         failures += 1
+   total = time.perf_counter() - start
+   requests = session.stats()['requests']
+   print("%d scrapes at concurrency %d in %.3f s, %d failed:" % (args.scrapes, args.concurrency, total, failures))
+   print("   %7.2f scrapes/s, %7.1f requests/s" % (len(scrapeTimes) / total, requests / total))
+   print("   scrape:  %s" % percentiles(scrapeTimes))
+   print("   request: %s" % percentiles(session.latencies))
+
+def scheduled(scraperClass, args):
+   accounts = [('user%d' % i, 'pass') for i in range(args.accounts)]
+   scheduler = ScrapeScheduler(accounts, args.workers, args.rate_per_host, maxPerHost=args.max_per_host,
+      scraperClass=scraperClass, concurrency=args.concurrency)
+   for (username, vz, error) in scheduler.run():
+      assert error is not None or len(vz.getAccountInfo()) == args.lines
+   stats = scheduler.stats()
+   print("%d accounts, %d workers, at most %s requests/s and %s in flight per host:"
+      % (args.accounts, args.workers, args.rate_per_host, args.max_per_host))
+   print("   %.3f s, %d failed; %7.1f requests/s, %d requests waited %.1f s in total"
+      % (stats['elapsed'], stats['failed'], stats['requests'] / stats['elapsed'], stats['waited'], stats['waitedSeconds']))
+
+parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+parser.add_argument('--lines', type=int, default=10, help="lines on the account")
+parser.add_argument('--latency', type=float, default=0.05, help="seconds per request")
+parser.add_argument('--jitter', type=float, default=0.0, help="seconds the latency varies by, either way")
+parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests that fail")
+parser.add_argument('--scrapes', type=int, default=20, help="scrapes in the throughput run")
+parser.add_argument('--concurrency', type=int, default=4, help="concurrency of the throughput run")
+parser.add_argument('--accounts', type=int, default=8, help="accounts in the scheduler run")
+parser.add_argument('--workers', type=int, default=4, help="accounts the scheduler scrapes at once")
+parser.add_argument('--rate-per-host', type=float, default=100, help="scheduler's requests per second per host")
+parser.add_argument('--max-per-host', type=int, default=8, help="scheduler's requests in flight per host")
+parser.add_argument('--seed', type=int, default=1, help="seed for the jitter and the errors")
+args = parser.parse_args()
+
+standIn = StandIn(lines=args.lines, latency=args.latency, jitter=args.jitter, errorRate=args.error_rate, seed=args.seed)
+standIn.start()
+scraperClass = standIn.scraperClass(VerizonScraper)
+print("%d lines, %.0f ms latency per request (+/- %.0f ms), %.1f%% errors:"
+   % (args.lines, args.latency * 1000, args.jitter * 1000, args.error_rate * 100))
+if args.error_rate == 0:
+   concurrencySweep(scraperClass, args)
+throughput(scraperClass, args)
+scheduled(scraperClass, args)
+standIn.stop()
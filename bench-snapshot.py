@@ -0,0 +1,68 @@
+#!/bin/env python3
+
+"""Compares saving and loading a ResponseCache of a big account as a pickle of
+its entries (the old format) and as a Snapshot: file size, and the time to
+save and to load it."""
+
+import os
+import pickle
+import tempfile
+import time
+from ResponseCache import ResponseCache
+from VerizonScraper import VerizonScraper
+from VerizonStandIn import StandIn
+
+LINES = 5000
+RUNS = 5
+
+def fillCache():
+   # Overviews parsed from the stand-in's responses, without running a server.
+   standIn = StandIn(lines=LINES)
+   standIn.server.server_close()
+   vz = VerizonScraper.__new__(VerizonScraper)
+   cache = ResponseCache()
+   cache.put('user', None, 'lines', set(standIn.phoneNums))
+   for n in standIn.phoneNums:
+      for (resource, body) in (('sms', standIn.smsOverview(n)), ('data', standIn.dataOverview(n))):
+         cache.put('user', n, resource, vz._parseOverview(_Body(body.encode('utf-8')), vz.schemas[resource]))
+   return cache
+
+class _Body:
+   def __init__(self, body):
+      self.body = body
+
+   def read(self, n):
+      (chunk, self.body) = (self.body[:n], self.body[n:])
+      return chunk
+
+def savePickle(cache, path):
+   entries = [(k, fetchedAt, v) for (k, (fetchedAt, v)) in cache.entries.items()]
+   with open(path, 'wb') as f:
+      pickle.dump(entries, f, pickle.HIGHEST_PROTOCOL)
+
+def loadPickle(path):
+   cache = ResponseCache()
+   with open(path, 'rb') as f:
+      for ((account, line, resource), fetchedAt, v) in pickle.load(f):
+         cache.put(account, line, resource, v, fetchedAt)
+   return cache
+
+def best(f, *args):
+   times = []
+   for _ in range(RUNS):
+      start = time.perf_counter()
+      f(*args)
+      times.append(time.perf_counter() - start)
+   return min(times)
+
+cache = fillCache()
+with tempfile.TemporaryDirectory() as d:
+   print("%d lines, %d cache entries:" % (LINES, len(cache)))
+   for (name, save, load) in (
+         ("pickle", savePickle, loadPickle),
+         ("snapshot", lambda c, p: c.save(p), ResponseCache.load)):
+      path = os.path.join(d, name)
+      saveTime = best(save, cache, path)
+      loadTime = best(load, path)
+      assert load(path).peek('user', '5550000007', 'data')[1].individualUsage == cache.peek('user', '5550000007', 'data')[1].individualUsage
+      print("   %-8s %8d bytes, save %6.1f ms, load %6.1f ms" % (name, os.path.getsize(path), saveTime * 1000, loadTime * 1000))
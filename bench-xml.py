@@ -0,0 +1,57 @@
+#!/bin/env python3
+
+"""Compares the old way of parsing an overview response (read all lines,
+decode them, join them, parse the whole tree) with the streaming parser now in
+VerizonScraper, on the stand-in's responses."""
+
+import io
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from VerizonScraper import VerizonScraper, Overview
+from VerizonStandIn import StandIn
+
+RUNS = 2000
+
+def parseWhole(vz, body):
+   r = io.BytesIO(body)
+   xmlstring = ''.join(vz._decodeToUtf8(r.readlines()))
+   root = ET.fromstring(xmlstring)
+   overview = Overview()
+   schema = vz.schemas['data']
+   for child in root:
+      convert = schema.get(child.tag)
+      overview[child.tag] = convert(child.text) if convert is not None and child.text is not None else child.text
+   return overview
+
+def parseStreaming(vz, body):
+   return vz._parseOverview(io.BytesIO(body), vz.schemas['data'])
+
+def measure(parse, vz, body):
+   start = time.perf_counter()
+   for _ in range(RUNS):
+      parse(vz, body)
+   perResponse = (time.perf_counter() - start) / RUNS
+   tracemalloc.start()
+   parse(vz, body)
+   peak = tracemalloc.get_traced_memory()[1]
+   tracemalloc.stop()
+   return (perResponse, peak)
+
+def responses():
+   standIn = StandIn(lines=1)
+   body = standIn.dataOverview(standIn.phoneNums[0])
+   yield ("plain overview", body.encode('utf-8'))
+   # The real site sends many fields we don't use.
+   padding = ''.join('<unusedField%d>%s</unusedField%d>\n' % (i, 'x' * 40, i) for i in range(2000))
+   yield ("overview with 2000 extra fields", body.replace('</overviewData>', padding + '</overviewData>').encode('utf-8'))
+   standIn.server.server_close()
+
+# The parsing methods don't need a logged-in scraper.
+vz = VerizonScraper.__new__(VerizonScraper)
+for (what, body) in responses():
+   assert parseWhole(vz, body).summaryUsageInKB == parseStreaming(vz, body).summaryUsageInKB
+   print("%s (%d bytes):" % (what, len(body)))
+   for (name, parse) in (("whole", parseWhole), ("streaming", parseStreaming)):
+      (perResponse, peak) = measure(parse, vz, body)
+      print("   %-9s %8.1f us/response, peak %8d bytes" % (name, perResponse * 1e6, peak))
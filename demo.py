@@ -20,25 +20,26 @@ def showDataAlerts(d):
    email = EmailTunnel()
    # EOBC: End Of Billing Cycle
    print("== DATA ALERTS ==")
-   globalWarning = a.getGlobalWarnText(a.accountHealth())
+   health = a.accountHealth()
+   globalWarning = a.getGlobalWarnText(health)
    print("Global status (%.1f / %.1f GB) is %s.  Estimated usage by EOBC: %.1f GB."
       % (a.globalUsed(), a.globalQuota(), globalWarning, a.globalUsagePrediction()))
-   print("Message to admin: %s" % of.warningAdminTextMap[a.accountHealth()])
-   email.alertAdminGlobally(resource, a.accountHealth(), globalWarning)
+   print("Message to admin: %s" % of.warningAdminTextMap[health])
+   email.alertAdminGlobally(resource, health, globalWarning)
 
-   for (name, usage) in d['usage'].items():
-      status = a.userStatus(name)
+   for (name, status) in a.iterStatuses():
+      usage = d['usage'][name]
       localquota = usage['quota'] if 'quota' in usage else "inf"
       print("%s (used %.1f / %.1f GB):" % (name, usage['used'], localquota))
       print("\tto account admin: %s.  Est. local use by EOBC: %.1f / %.1f GB."
          % (a.getLocalWarnText(status['warning-code']), status['used-eobc'], localquota))
       if 'max-daily-use-to-eobc' in status and status['max-daily-use-to-eobc'] > 0:
          print("\tto user: you can use up to %.2f GB/day until the end of the billing cycle." % status['max-daily-use-to-eobc'])
-      print("\tto user (coop mode): %s" % getUserWarningTextCooperative(of, status['warning-code'], a.accountHealth()))
+      print("\tto user (coop mode): %s" % getUserWarningTextCooperative(of, status['warning-code'], health))
       print("\tto user (ind mode):  %s" % getUserWarningTextIndependent(of, status['warning-code']))
       email.alertAdminAboutUser(name, resource, status['warning-code'], a.getLocalWarnText(status['warning-code']))
       if coopMode:
-         email.alertUser(name, resource, status['warning-code'], getUserWarningTextCooperative(of, status['warning-code'], a.accountHealth()))
+         email.alertUser(name, resource, status['warning-code'], getUserWarningTextCooperative(of, status['warning-code'], health))
       else:
          email.alertUser(name, resource, status['warning-code'], getUserWarningTextIndependent(of, status['warning-code']))
 
@@ -0,0 +1,254 @@
+#!/bin/env python3
+
+import contextlib
+import io
+import mailbox
+import os
+import socket
+import tempfile
+import time
+import unittest
+from SharedUsageAlerter import Warn
+from AlertStore import AlertStore
+from EmailTunnel import EmailTunnel
+from MailDelivery import SmtpDelivery, AsyncDelivery
+from SmtpStandIn import SmtpStandIn
+
+"""This is a unit-testing module for EmailTunnel, AlertStore and MailDelivery."""
+
+# Returns the EMAIL lines f prints.
+def emails(f, *args):
+   out = io.StringIO()
+   with contextlib.redirect_stdout(out):
+      f(*args)
+   return [l for l in out.getvalue().splitlines() if l.startswith('EMAIL')]
+
+# Returns a local port nothing listens on.
+def closedPort():
+   with socket.socket() as s:
+      s.bind(('127.0.0.1', 0))
+      return s.getsockname()[1]
+
+# Returns the recipients of the messages in the mbox at path.
+def mboxRecipients(path):
+   box = mailbox.mbox(path)
+   try:
+      return [m['To'] for m in box]
+   finally:
+      box.close()
+
+class TestEmailTunnel(unittest.TestCase):
+   def test_user_dedup(self):
+      email = EmailTunnel()
+      self.assertEqual(1, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Overuse, "slow down")))
+      self.assertEqual(0, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Overuse, "slow down")))
+      # A different warning is news.
+      self.assertEqual(1, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Overage, "stop")))
+      self.assertEqual(0, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Overage, "stop")))
+      # Once cleared, the same warning is issued again.
+      self.assertEqual(0, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Ok, "ok")))
+      self.assertEqual(1, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Overage, "stop")))
+      # Resources are separate.
+      self.assertEqual(1, len(emails(email.alertUser, 'Yuri', 'SMS', Warn.Local.Overage, "stop")))
+
+   def test_admin_about_user_dedup(self):
+      email = EmailTunnel()
+      self.assertEqual(1, len(emails(email.alertAdminAboutUser, 'Yuri', 'data', Warn.Local.Overuse, "Yuri")))
+      self.assertEqual(0, len(emails(email.alertAdminAboutUser, 'Yuri', 'data', Warn.Local.Overuse, "Yuri")))
+      # Alerts to the admin don't count as alerts to the user.
+      self.assertEqual(1, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Overuse, "slow down")))
+
+   def test_global_dedup(self):
+      email = EmailTunnel()
+      self.assertEqual(1, len(emails(email.alertAdminGlobally, 'data', Warn.Global.Overuse, "careful")))
+      self.assertEqual(0, len(emails(email.alertAdminGlobally, 'data', Warn.Global.Overuse, "careful")))
+      self.assertEqual(1, len(emails(email.alertAdminGlobally, 'SMS', Warn.Global.Overuse, "careful")))
+      self.assertEqual(0, len(emails(email.alertAdminGlobally, 'data', Warn.Global.Ok, "ok")))
+      self.assertEqual(1, len(emails(email.alertAdminGlobally, 'data', Warn.Global.Overuse, "careful")))
+
+   def test_store_across_runs(self):
+      with tempfile.TemporaryDirectory() as d:
+         path = os.path.join(d, 'alerts.sqlite')
+         store = AlertStore(path)
+         email = EmailTunnel(store, 'acct')
+         self.assertEqual(1, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Overuse, "slow down")))
+         self.assertEqual(1, len(emails(email.alertUser, 'John', 'data', Warn.Local.Underuse, "use more")))
+         self.assertEqual(1, len(emails(email.alertAdminGlobally, 'data', Warn.Global.Overuse, "careful")))
+         email.commit()
+         store.close()
+
+         # The next run remembers.
+         store = AlertStore(path)
+         email = EmailTunnel(store, 'acct')
+         self.assertEqual(0, len(emails(email.alertUser, 'Yuri', 'data', Warn.Local.Overuse, "slow down")))
+         self.assertEqual(0, len(emails(email.alertUser, 'John', 'data', Warn.Local.Ok, "ok")))
+         self.assertEqual(0, len(emails(email.alertAdminGlobally, 'data', Warn.Global.Overuse, "careful")))
+         # Another account sharing the store doesn't.
+         other = EmailTunnel(store, 'other')
+         self.assertEqual(1, len(emails(other.alertUser, 'Yuri', 'data', Warn.Local.Overuse, "slow down")))
+         email.commit()
+         self.assertEqual(Warn.Local.Overuse, store.get('acct', 'Yuri', 'data', 'user'))
+         self.assertEqual(None, store.get('acct', 'John', 'data', 'user'))
+         # Nothing of the uncommitted tunnel was saved.
+         self.assertEqual(None, store.get('other', 'Yuri', 'data', 'user'))
+         store.close()
+
+class TestSmtpDelivery(unittest.TestCase):
+   def setUp(self):
+      self.standIn = SmtpStandIn()
+      self.standIn.start()
+      self.delivery = SmtpDelivery('127.0.0.1', self.standIn.port(), addresses={'111': 'u1@example.com',
+         '222': 'u2@example.com'}, adminAddress='admin@example.com', poolSize=2)
+
+   def tearDown(self):
+      self.delivery.close()
+      self.standIn.stop()
+
+   def test_digest(self):
+      email = EmailTunnel(delivery=self.delivery)
+      email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+      email.alertUser('111', 'SMS', Warn.Local.Overage, "stop texting")
+      email.alertUser('222', 'data', Warn.Local.Underuse, "use more")
+      email.alertUser('333', 'data', Warn.Local.Underuse, "use more")
+      email.alertAdminGlobally('data', Warn.Global.Overuse, "careful")
+      email.alertAdminAboutUser('111', 'data', Warn.Local.Overuse, "111 is overusing")
+      self.assertEqual([], email.commit())
+      byRecipient = dict((recipients[0], message) for (_, recipients, message) in self.standIn.messages)
+      self.assertEqual(['admin@example.com', 'u1@example.com', 'u2@example.com'], sorted(byRecipient))
+      # One message per recipient, with all their alerts.
+      body = byRecipient['u1@example.com'].get_content()
+      self.assertIn("slow down", body)
+      self.assertIn("stop texting", body)
+      self.assertEqual("Usage alerts: data, SMS", byRecipient['u1@example.com']['Subject'])
+      self.assertIn("111 is overusing", byRecipient['admin@example.com'].get_content())
+      stats = self.delivery.stats()
+      self.assertEqual(3, stats['sent'])
+      self.assertEqual(1, stats['undeliverable'])
+
+   def test_connection_reuse(self):
+      for code in (Warn.Local.Overuse, Warn.Local.Overage, Warn.Local.Underuse):
+         email = EmailTunnel(delivery=self.delivery)
+         email.alertUser('111', 'data', code, "alert")
+         email.alertUser('222', 'data', code, "alert")
+         email.commit()
+      self.assertEqual(6, len(self.standIn.messages))
+      self.assertLessEqual(self.delivery.stats()['opened'], 2)
+      self.assertEqual(self.delivery.stats()['opened'], self.standIn.connections)
+
+   def test_refused(self):
+      self.standIn.failEvery = 2
+      email = EmailTunnel(delivery=self.delivery)
+      email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+      email.alertUser('222', 'data', Warn.Local.Underuse, "use more")
+      failed = email.commit()
+      self.assertEqual(1, len(failed))
+      self.assertEqual(1, len(self.standIn.messages))
+      self.assertEqual(1, self.delivery.stats()['failed'])
+
+   def test_unreachable(self):
+      delivery = SmtpDelivery('127.0.0.1', closedPort(), addresses={'111': 'u1@example.com'})
+      email = EmailTunnel(delivery=delivery)
+      email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+      self.assertEqual(['u1@example.com'], [m['To'] for m in email.commit()])
+      self.assertEqual(1, delivery.stats()['failed'])
+      self.assertEqual(0, delivery.stats()['opened'])
+      delivery.close()
+
+   # An alert whose mail failed isn't saved, so the next run sends it again.
+   def test_failed_not_saved(self):
+      self.standIn.failEvery = 2
+      with tempfile.TemporaryDirectory() as d:
+         store = AlertStore(os.path.join(d, 'alerts.sqlite'))
+         email = EmailTunnel(store, 'acct', self.delivery)
+         email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+         email.alertUser('222', 'data', Warn.Local.Overuse, "slow down")
+         email.alertAdminGlobally('data', Warn.Global.Overuse, "careful")
+         failed = email.commit()
+         self.assertEqual(1, len(failed))
+         unsent = [k for k in (('111', 'data', 'user'), ('222', 'data', 'user'), ('', 'data', 'global'))
+            if store.get('acct', *k) is None]
+         self.assertEqual(1, len(unsent))
+
+         self.standIn.failEvery = 0
+         email = EmailTunnel(store, 'acct', self.delivery)
+         email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+         email.alertUser('222', 'data', Warn.Local.Overuse, "slow down")
+         email.alertAdminGlobally('data', Warn.Global.Overuse, "careful")
+         self.assertEqual([], email.commit())
+         self.assertEqual(3, len(self.standIn.messages))
+         self.assertIsNotNone(store.get('acct', *unsent[0]))
+         store.close()
+
+   def test_async_retry(self):
+      self.standIn.failEvery = 2
+      delivery = AsyncDelivery(self.delivery, backoff=0.01)
+      email = EmailTunnel(delivery=delivery)
+      email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+      email.alertUser('222', 'data', Warn.Local.Underuse, "use more")
+      self.assertEqual([], email.commit())
+      delivery.close()
+      # The refused message went through on a retry.
+      self.assertEqual(['u1@example.com', 'u2@example.com'], sorted(r[0] for (_, r, _) in self.standIn.messages))
+      self.assertEqual(1, delivery.stats()['retried'])
+      self.assertEqual(0, delivery.stats()['deadLettered'])
+
+   def test_async_dead_letters(self):
+      self.standIn.failEvery = 1
+      with tempfile.TemporaryDirectory() as d:
+         path = os.path.join(d, 'dead.mbox')
+         delivery = AsyncDelivery(self.delivery, retries=2, backoff=0.01, deadLetters=path)
+         email = EmailTunnel(delivery=delivery)
+         email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+         email.commit()
+         delivery.close()
+         self.assertEqual(2, delivery.stats()['retried'])
+         self.assertEqual(['u1@example.com'], mboxRecipients(path))
+
+   def test_async_unreachable(self):
+      with tempfile.TemporaryDirectory() as d:
+         path = os.path.join(d, 'dead.mbox')
+         unreachable = SmtpDelivery('127.0.0.1', closedPort(), addresses={'111': 'u1@example.com'})
+         delivery = AsyncDelivery(unreachable, retries=2, backoff=0.01, deadLetters=path)
+         email = EmailTunnel(delivery=delivery)
+         email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+         email.commit()
+         delivery.close()
+         self.assertEqual(2, delivery.stats()['retried'])
+         self.assertEqual(['u1@example.com'], mboxRecipients(path))
+
+   # A delivery that raises doesn't end the thread.
+   def test_async_survives(self):
+      class Broken:
+         def __init__(self):
+            self.flushes = 0
+         def queue(self, *alert):
+            pass
+         def flush(self):
+            self.flushes += 1
+            raise RuntimeError("broken")
+         def stats(self):
+            return {}
+         def close(self):
+            pass
+      broken = Broken()
+      delivery = AsyncDelivery(broken, maxQueued=1)
+      with contextlib.redirect_stderr(io.StringIO()) as err:
+         for _ in range(3):
+            delivery.queue('111', 'data', "slow down")
+            delivery.flush()
+         delivery.close()
+      self.assertEqual(3, broken.flushes)
+      self.assertIn("RuntimeError", err.getvalue())
+
+   def test_async_doesnt_block(self):
+      self.standIn.latency = 0.05
+      delivery = AsyncDelivery(self.delivery)
+      start = time.perf_counter()
+      email = EmailTunnel(delivery=delivery)
+      email.alertUser('111', 'data', Warn.Local.Overuse, "slow down")
+      email.commit()
+      self.assertLess(time.perf_counter() - start, 0.05)
+      delivery.close()
+      self.assertEqual(1, len(self.standIn.messages))
+
+unittest.main()
@@ -0,0 +1,336 @@
+#!/bin/env python3
+
+import datetime
+import os
+import tempfile
+import unittest
+import Snapshot
+from HttpSession import HttpSession
+from ResponseCache import ResponseCache
+from SessionStore import SessionStore
+from VerizonScraper import VerizonScraper, Overview
+from VerizonStandIn import StandIn
+
+"""This is a unit-testing module for VerizonScraper and the modules it keeps
+its state in, run against the local stand-in for Verizon's site."""
+
+class Clock:
+   def __init__(self):
+      self.now = 0.0
+
+   def __call__(self):
+      return self.now
+
+class TestResponseCache(unittest.TestCase):
+   def test_ttl(self):
+      clock = Clock()
+      cache = ResponseCache(ttl=100, clock=clock)
+      self.assertIsNone(cache.get('user', '111', 'sms'))
+      cache.put('user', '111', 'sms', 'a')
+      clock.now = 100
+      self.assertEqual('a', cache.get('user', '111', 'sms'))
+      clock.now = 101
+      self.assertIsNone(cache.get('user', '111', 'sms'))
+      # Expired entries can still be peeked at.
+      self.assertEqual((0.0, 'a'), cache.peek('user', '111', 'sms'))
+      cache.put('user', '111', 'sms', 'b')
+      self.assertEqual('b', cache.get('user', '111', 'sms'))
+      self.assertEqual({'hits': 2, 'misses': 2, 'expired': 1, 'evictions': 0, 'hitRate': 0.5}, cache.stats())
+
+   def test_expire_after(self):
+      clock = Clock()
+      cache = ResponseCache(ttl=100, clock=clock)
+      cache.put('user', '111', 'sms', 'a')
+      cache.put('user', '222', 'sms', 'a')
+      cache.expireAfter('user', '111', 'sms', 10)
+      cache.expireAfter('user', '333', 'sms', 10) # no such entry
+      clock.now = 50
+      self.assertIsNone(cache.get('user', '111', 'sms'))
+      self.assertEqual('a', cache.get('user', '222', 'sms'))
+      self.assertIsNone(cache.get('user', '333', 'sms'))
+      # A new value lives for ttl again.
+      cache.put('user', '111', 'sms', 'b')
+      clock.now = 140
+      self.assertEqual('b', cache.get('user', '111', 'sms'))
+      # Lifetimes can be longer than ttl too.
+      cache.expireAfter('user', '111', 'sms', 1000)
+      clock.now = 1000
+      self.assertEqual('b', cache.get('user', '111', 'sms'))
+
+   def test_lru(self):
+      cache = ResponseCache(maxEntries=2, clock=Clock())
+      cache.put('user', '111', 'sms', 'a')
+      cache.put('user', '222', 'sms', 'b')
+      # Reading 111 makes 222 the least recently used.
+      cache.get('user', '111', 'sms')
+      cache.put('user', '333', 'sms', 'c')
+      self.assertEqual(2, len(cache))
+      self.assertIsNone(cache.peek('user', '222', 'sms'))
+      self.assertEqual('a', cache.get('user', '111', 'sms'))
+      # An evicted entry's own lifetime goes with it.
+      cache.expireAfter('user', '333', 'sms', 0)
+      cache.put('user', '444', 'sms', 'd')
+      cache.put('user', '555', 'sms', 'e')
+      self.assertEqual({}, cache.lifetimes)
+      self.assertEqual(3, cache.stats()['evictions'])
+
+   def test_save_load(self):
+      clock = Clock()
+      cache = ResponseCache(ttl=100, clock=clock)
+      cache.put('user', None, 'lines', {'111', '222'})
+      cache.put('user', '111', 'sms', overview(summaryUsage=3), fetchedAt=-50)
+      cache.put('user', '222', 'sms', overview(summaryUsage=4))
+      with tempfile.TemporaryDirectory() as d:
+         path = os.path.join(d, 'cache')
+         cache.save(path)
+         loaded = ResponseCache.load(path, ttl=100, maxEntries=2, clock=clock)
+      # The oldest entry didn't fit.
+      self.assertEqual(2, len(loaded))
+      self.assertIsNone(loaded.peek('user', None, 'lines'))
+      clock.now = 60
+      self.assertIsNone(loaded.get('user', '111', 'sms'))
+      self.assertEqual(4, loaded.get('user', '222', 'sms')['summaryUsage'])
+
+# Runs a stand-in of lines lines for every test; newScraper() makes scrapers
+# that talk to it and closes their connections after the test.
+class StandInTest(unittest.TestCase):
+   lines = 4
+
+   def setUp(self):
+      self.standIn = StandIn(lines=self.lines)
+      self.standIn.start()
+      self.scraperClass = self.standIn.scraperClass(VerizonScraper)
+      self.sessions = []
+
+   def tearDown(self):
+      for session in self.sessions:
+         session.close()
+      self.standIn.stop()
+
+   def newScraper(self, **args):
+      vz = self.scraperClass('user', 'pass', **args)
+      self.sessions.append(vz.getSession())
+      return vz
+
+class TestDifferential(StandInTest):
+   lines = 3
+
+   def setUp(self):
+      StandInTest.setUp(self)
+      self.clock = Clock()
+      self.cache = ResponseCache(ttl=3600, clock=self.clock)
+      (self.a, self.b, self.c) = self.standIn.phoneNums
+
+   def scraper(self):
+      return self.newScraper(cache=self.cache, lazy=True, differential=True)
+
+   def smsUsed(self, vz, phoneNum):
+      return vz.getOverview(phoneNum, 'sms')['individualUsage']
+
+   def test_unchanged(self):
+      self.newScraper(cache=self.cache, differential=True)
+      self.clock.now = 7200
+      vz = self.scraper()
+      requests = self.standIn.requests
+      vz.prefetch([self.a, self.b, self.c], ('sms',))
+      self.assertEqual(1, self.standIn.requests - requests)
+      self.assertEqual(2, vz.getSkippedFetches())
+
+   # A new billing cycle can start with the same usage total, but the cached
+   # overviews belong to the old one.
+   def test_new_cycle(self):
+      self.newScraper(cache=self.cache, differential=True)
+      self.standIn.billCycleEnd = '01/24/13'
+      self.clock.now = 7200
+      vz = self.scraper()
+      vz.prefetch([self.a, self.b, self.c], ('sms', 'data'))
+      self.assertEqual(0, vz.getSkippedFetches())
+      self.assertEqual(datetime.date(2013, 1, 24), vz.getOverview(self.c, 'data')['billCyleEndDate'])
+
+   # The lines were fetched at different times: B after A's usage changed, C
+   # and A before.  Probing B mustn't keep A's and C's stale overviews.
+   def test_fetched_at_different_times(self):
+      self.newScraper(cache=self.cache, differential=True)
+      before = self.standIn._smsUsed(self.a)
+      self.standIn.addUsage(self.a, sms=50)
+      self.clock.now = 1000
+      self.cache.expireAfter('user', self.b, 'sms', 0)
+      self.scraper().prefetch([self.b], ('sms',))
+
+      self.clock.now = 7200
+      vz = self.scraper()
+      vz.prefetch([self.b, self.a, self.c], ('sms',))
+      self.assertEqual(before + 50, self.smsUsed(vz, self.a))
+      self.assertEqual(0, vz.getSkippedFetches())
+
+      # Now that every overview is as new as the last change, the probe
+      # settles them all.
+      self.clock.now = 14400
+      vz = self.scraper()
+      vz.prefetch([self.c, self.a, self.b], ('sms',))
+      self.assertEqual(2, vz.getSkippedFetches())
+      self.assertEqual(before + 50, self.smsUsed(vz, self.a))
+
+class TestLineChanges(StandInTest):
+   lines = 3
+
+   def setUp(self):
+      StandInTest.setUp(self)
+      self.clock = Clock()
+      self.cache = ResponseCache(ttl=3600, clock=self.clock)
+
+   # The cached lines are used until a fetch needs a login, which finds the
+   # account's lines have changed.
+   def test_login_finds_other_lines(self):
+      self.newScraper(cache=self.cache)
+      (a, b, c) = self.standIn.phoneNums
+      self.standIn.setLines(2)
+      self.standIn.addUsage(a, sms=5)
+      self.cache.expireAfter('user', a, 'sms', 0)
+      self.clock.now = 1
+      vz = self.newScraper(cache=self.cache)
+      self.assertEqual({a, b}, vz.getPhoneNumSet())
+      self.assertEqual({a, b}, set(vz.getAccountInfo()))
+      self.assertEqual(self.standIn._smsUsed(a), vz.getOverview(a, 'sms')['individualUsage'])
+      self.assertEqual({a, b}, self.cache.peek('user', None, 'lines')[1])
+
+      self.standIn.setLines(4)
+      self.cache.expireAfter('user', a, 'sms', 0)
+      self.clock.now = 2
+      vz = self.newScraper(cache=self.cache)
+      d = self.standIn.phoneNums[3]
+      self.assertEqual(set(self.standIn.phoneNums), set(vz.getAccountInfo()))
+      self.assertEqual(self.standIn._dataUsedKB(d), vz.getAccountInfo()[d].data['individualUsage'])
+
+class TestHttpSession(StandInTest):
+   # Makes the idle connections look like ones the server has closed.
+   def dropIdle(self, session):
+      for conns in session.idle.values():
+         for conn in conns:
+            conn.sock.close()
+
+   # A request that fails on a kept-alive connection is sent again only if
+   # that does no harm.
+   def test_stale_connection(self):
+      session = HttpSession()
+      self.sessions.append(session)
+      urls = self.standIn.urls()
+      with session.get(urls['indexUrl']) as r:
+         r.read()
+      self.dropIdle(session)
+      with session.get(urls['indexUrl']) as r:
+         self.assertEqual(200, r.status)
+      self.assertEqual(2, session.stats()['opened'])
+      self.dropIdle(session)
+      with self.assertRaises(OSError):
+         session.post(urls['loginUrl'], b'IDToken1=user&IDToken2=pass')
+      self.assertEqual(2, session.stats()['opened'])
+
+class TestSessions(StandInTest):
+   def setUp(self):
+      StandInTest.setUp(self)
+      self.directory = tempfile.TemporaryDirectory()
+      self.sessionStore = SessionStore(self.directory.name)
+
+   def tearDown(self):
+      self.directory.cleanup()
+      StandInTest.tearDown(self)
+
+   def scraper(self, **args):
+      return self.newScraper(sessionStore=self.sessionStore, **args)
+
+   # A saved session is checked with one request, and logged in again only
+   # once Verizon has expired it.
+   def test_saved_session(self):
+      self.scraper()
+      self.assertEqual(1, self.standIn.logins)
+      requests = self.standIn.requests
+      vz = self.scraper()
+      self.assertEqual(1, self.standIn.logins)
+      self.assertEqual(1 + 2 * 4, self.standIn.requests - requests)
+      self.standIn.expireSessions()
+      vz = self.scraper()
+      self.assertEqual(2, self.standIn.logins)
+      self.assertEqual(set(self.standIn.phoneNums), vz.getPhoneNumSet())
+
+   # The saved login is the owner's only, whatever the umask and whoever
+   # made the directory.
+   def test_file_modes(self):
+      os.chmod(self.directory.name, 0o755)
+      umask = os.umask(0o022)
+      try:
+         self.scraper()
+      finally:
+         os.umask(umask)
+      self.assertEqual(0o700, os.stat(self.directory.name).st_mode & 0o777)
+      names = os.listdir(self.directory.name)
+      self.assertEqual(2, len(names))
+      for name in names:
+         self.assertEqual(0o600, os.stat(os.path.join(self.directory.name, name)).st_mode & 0o777)
+
+   # A lazy scraper trusts the saved session and fetches only what's read.
+   def test_lazy(self):
+      self.scraper()
+      requests = self.standIn.requests
+      vz = self.scraper(lazy=True)
+      self.assertEqual(0, self.standIn.requests - requests)
+      (a, b) = self.standIn.phoneNums[:2]
+      self.assertEqual(self.standIn._smsUsed(a), vz.getAccountInfo()[a]['sms']['individualUsage'])
+      self.assertEqual(1, self.standIn.requests - requests)
+      self.assertEqual(1, self.standIn.logins)
+
+      # An expired session costs one login and a retry.
+      self.standIn.expireSessions()
+      requests = self.standIn.requests
+      self.assertEqual(self.standIn._smsUsed(b), vz.getAccountInfo()[b].sms['individualUsage'])
+      self.assertEqual(2, self.standIn.logins)
+      self.assertEqual(4, self.standIn.requests - requests)
+
+   # Requests in flight together when the session expires log in once.
+   def test_lazy_concurrent_relogin(self):
+      self.scraper()
+      vz = self.scraper(lazy=True, concurrency=4)
+      self.standIn.expireSessions()
+      vz.prefetch()
+      self.assertEqual(2, self.standIn.logins)
+      for n in self.standIn.phoneNums:
+         self.assertEqual(self.standIn._smsUsed(n), vz.getOverview(n, 'sms')['individualUsage'])
+
+def overview(**fields):
+   o = Overview()
+   for (k, v) in fields.items():
+      o[k] = v
+   return o
+
+class TestSnapshot(unittest.TestCase):
+   def test_round_trip(self):
+      entries = [
+         (('user', None, 'lines'), 10.0, {'5550000000', '5550000001'}),
+         (('user', '5550000000', 'sms'), 11.0, overview(billCyleEndDate=datetime.date(2012, 12, 24),
+            summaryAllowance=1000, summaryUsage=25, individualUsage=7, newField='x')),
+         (('user', '5550000001', 'sms'), 12.5, overview(billCyleEndDate=datetime.date(2012, 12, 24),
+            summaryAllowance='Unlimited', summaryUsage=25, individualUsage=18)),
+         (('user', '5550000000', 'data'), 13.0, overview(billCyleEndDate=datetime.date(2012, 12, 24),
+            summaryAllowance='2,048 MB', summaryAllowanceInKB=2097152.0, summaryUsageInKB=1536.5,
+            individualUsage=1024, emptyField=None, otherField='y')),
+         (('other', '5550000001', 'data'), 14.0, overview(summaryAllowance='2048')),
+         (('other', '5550000002', 'sms'), 15.0, overview()),
+      ]
+      with tempfile.TemporaryDirectory() as d:
+         path = os.path.join(d, 'snapshot')
+         Snapshot.write(path, entries)
+         with Snapshot.SnapshotReader(path) as snapshot:
+            self.assertEqual(len(entries), len(snapshot))
+            loaded = list(snapshot)
+      for ((key, fetchedAt, value), (loadedKey, loadedAt, loadedValue)) in zip(entries, loaded):
+         self.assertEqual(key, loadedKey)
+         self.assertEqual(fetchedAt, loadedAt)
+         if key[2] == 'lines':
+            self.assertEqual(value, loadedValue)
+            continue
+         for k in Overview.fields:
+            self.assertEqual(value[k], loadedValue[k], (key, k))
+            self.assertIs(type(value[k]), type(loadedValue[k]), (key, k))
+         self.assertEqual(value.extra, loadedValue.extra)
+
+unittest.main()
@@ -1,7 +1,14 @@
 #!/bin/env python3
 
+import collections
+import os
+import tempfile
+import time
 import unittest
-from SharedUsageAlerter import Warn, Alerter, Error as SuaError
+import UsageHistory
+import SharedUsageAlerter as sua
+from SharedUsageAlerter import Warn, Curve, Envelope, LineUsage, AccountUsage, Alerter, BatchAlerter, IncrementalAlerter, BurnRateForecaster, Error as SuaError
+from PollPlanner import PollPlanner
 
 """This is a unit-testing module for SharedUsageAlerter.  If you ever tweak
 SharedUsageAlerter, be sure to rerun this."""
@@ -33,6 +40,8 @@ class TestSequenceFunctions(unittest.TestCase):
       a = Alerter(d)
       self.assertEqual(d['billing-frac'], a.billingFraction())
       self.assertEqual(d['usage'], a.usage())
+      # The dictionaries are converted to records, which alone are kept.
+      self.assertIsInstance(a.usage()['Yuri the Streamer'], LineUsage)
       self.assertEqual(d['global-quota'], a.globalQuota())
       self.assertEqual(sum(u['used'] for u in d['usage'].values()), a.globalUsed())
 
@@ -148,4 +157,524 @@ class TestSequenceFunctions(unittest.TestCase):
       self.assertEqual(a.accountHealth(), Warn.Global.Underuse)
       self.assertEqual(a.userStatus('John the Hermit')['warning-code'], Warn.Local.Overuse)
 
+   # An explicit None quota means the same as no quota at all.
+   def test_none_quota(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 6,   # GB
+         'usage': {
+            'Philip the Model Citizen': {
+               'quota': None,
+               'used': 5,    # GB
+            },
+            'John the Hermit': {
+               'quota': 2,   # GB
+               'used': 0.1,  # GB
+            },
+         },
+      }
+      a = Alerter(d)
+      self.assertEqual(a.userStatus('Philip the Model Citizen')['warning-code'], Warn.Local.Overuse)
+      self.assertNotIn('max-daily-use-to-eobc', a.userStatus('Philip the Model Citizen'))
+
+   # An account with a zero cap that nobody uses is fine.
+   def test_zero_global_quota(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 0,
+         'usage': {
+            'John the Hermit': {
+               'used': 0,
+            },
+         },
+      }
+      a = Alerter(d)
+      self.assertEqual(a.accountHealth(), Warn.Global.Ok)
+      self.assertEqual(a.userStatus('John the Hermit')['warning-code'], Warn.Local.Ok)
+
+   def test_batch_matches_alerter(self):
+      accounts = []
+      for bf in (1.0/30, 0.2, 0.5, 0.75, 0.8, 0.95):
+         accounts.append({
+            'billing-frac': bf,
+            'global-quota': 6,
+            'usage': {
+               'Philip the Model Citizen': {'quota': 2, 'used': 1},
+               'John the Hermit': {'quota': 2, 'used': 0.1},
+               'Yuri the Streamer': {'quota': 1, 'used': 1.2},
+               'Zero the Idle': {'quota': 0, 'used': 0},
+            },
+         })
+         accounts.append({
+            'billing-frac': bf,
+            'global-quota': 10,
+            'usage': {
+               'David the Downloader': {'used': 4.5},
+               'John the Hermit': {'quota': None, 'used': 0.5},
+            },
+         })
+         accounts.append({
+            'billing-frac': bf,
+            'global-quota': None,
+            'usage': {
+               'Yuri the Streamer': {'used': 100},
+            },
+         })
+         accounts.append({
+            'billing-frac': bf,
+            'global-quota': 0,
+            'usage': {
+               'Zero the Idle': {'used': 0},
+            },
+         })
+      (b, names) = BatchAlerter.fromAccounts(accounts)
+      for (i, d) in enumerate(accounts):
+         a = Alerter(d)
+         self.assertEqual(a.accountHealth(), b.accountHealth()[i])
+         self.assertEqual(a.globalUsed(), b.globalUsed()[i])
+      for (row, (i, name)) in enumerate(names):
+         self.assertEqual(Alerter(accounts[i]).userStatus(name), b.userStatus(row))
+
+   def test_batch_columns(self):
+      nan = float('nan')
+      b = BatchAlerter([0.8, 0.2], [6, nan], [0, 0, 1], [2, nan, nan], [0.1, 3, 1])
+      self.assertEqual(list(b.accountHealth()), [Warn.Global.Underuse, Warn.Global.Ok])
+      self.assertEqual(list(b.warningCodes()), [Warn.Local.Underuse, Warn.Local.Ok, Warn.Local.Ok])
+      self.assertTrue(b.maxDailyUseToEobc()[1] != b.maxDailyUseToEobc()[1])
+
+   def test_batch_init_02(self):
+      with self.assertRaises(SuaError):
+         BatchAlerter([0.8], [1], [0], [2], [1])
+
+   def test_incremental_01(self):
+      d = {
+         'billing-frac': 0.8,
+         'global-quota': 6,   # GB
+         'usage': {
+            'John the Hermit': {
+               'quota': 2,   # GB
+               'used': 0.1,  # GB
+            },
+         },
+      }
+      a = IncrementalAlerter(d)
+      self.assertEqual(a.userStatus('John the Hermit')['warning-code'], Warn.Local.Underuse)
+      a.updateUsage('John the Hermit', 1.9)
+      self.assertEqual(a.userStatus('John the Hermit')['warning-code'], Warn.Local.Overuse)
+      self.assertAlmostEqual(a.globalUsed(), 1.9)
+      # The caller's dictionary is left alone.
+      self.assertEqual(d['usage']['John the Hermit']['used'], 0.1)
+
+      a.addUser('David the Downloader', 7.1, 4)
+      self.assertAlmostEqual(a.globalUsed(), 9.0)
+      self.assertEqual(a.accountHealth(), Warn.Global.Overage)
+      a.setQuota('John the Hermit', 1)
+      self.assertEqual(a.userStatus('John the Hermit')['warning-code'], Warn.Local.Overage)
+      a.removeUser('David the Downloader')
+      self.assertEqual(a.accountHealth(), Warn.Global.Underuse)
+      self.assertEqual(Alerter({'billing-frac': 0.8, 'global-quota': 6, 'usage': a.usage()}).userStatus('John the Hermit'),
+         a.userStatus('John the Hermit'))
+
+   def test_incremental_quota_check(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 3,
+         'usage': {
+            'John the Hermit': {'quota': 2, 'used': 0},
+         },
+      }
+      a = IncrementalAlerter(d)
+      with self.assertRaises(SuaError):
+         a.addUser('Yuri the Streamer', 0, 2)
+      self.assertNotIn('Yuri the Streamer', a.usage())
+      with self.assertRaises(SuaError):
+         a.setQuota('John the Hermit', 4)
+      self.assertEqual(a.usage()['John the Hermit'].quota, 2)
+      # Without a quota for everyone the sum is not checked.
+      a.addUser('Yuri the Streamer', 0)
+      a.setQuota('John the Hermit', 4)
+      with self.assertRaises(SuaError):
+         a.setQuota('Yuri the Streamer', 1)
+
+   def test_all_statuses(self):
+      d = {
+         'billing-frac': 0.8,
+         'global-quota': 6,   # GB
+         'usage': {
+            'Philip the Model Citizen': {'quota': 2, 'used': 1},
+            'John the Hermit': {'quota': 2, 'used': 0.1},
+            'Yuri the Streamer': {'quota': 1, 'used': 1.2},
+            'David the Downloader': {'used': 1.1},
+         },
+      }
+      a = Alerter(d)
+      statuses = a.allStatuses()
+      self.assertEqual(sorted(statuses.keys()), sorted(d['usage'].keys()))
+      for name in d['usage']:
+         self.assertEqual(statuses[name], a.userStatus(name))
+      self.assertEqual([name for (name, _) in a.iterStatuses()], list(d['usage'].keys()))
+      i = IncrementalAlerter(d)
+      i.updateUsage('John the Hermit', 1.9)
+      self.assertEqual(i.allStatuses()['John the Hermit']['warning-code'], Warn.Local.Overuse)
+
+   def test_records(self):
+      d = {
+         'billing-frac': 0.8,
+         'global-quota': 6,   # GB
+         'usage': {
+            'John the Hermit': {'quota': 2, 'used': 0.1},
+            'David the Downloader': {'used': 4},
+         },
+      }
+      r = AccountUsage(0.8, 6, {
+         'John the Hermit': LineUsage(0.1, 2),
+         'David the Downloader': LineUsage(4),
+      })
+      a = Alerter(d)
+      b = Alerter(r)
+      self.assertIs(b.usage(), r.usage)
+      self.assertEqual(a.globalUsed(), b.globalUsed())
+      self.assertEqual(a.accountHealth(), b.accountHealth())
+      self.assertEqual(a.allStatuses(), b.allStatuses())
+      with self.assertRaises(SuaError):
+         Alerter(AccountUsage(0.8, 1, {'John the Hermit': LineUsage(0, 2)}))
+
+   # The compiled envelope follows the closed-form curves closely, even
+   # around the jump of minPct where Underuse starts.
+   def test_envelope_table(self):
+      for i in range(1, 1000):
+         bf = i / 1000
+         self.assertAlmostEqual(sua.DEFAULT_ENVELOPE.maxPct(bf), sua.maxAllowablePctUsedOfMonthlyQuota(bf))
+         self.assertAlmostEqual(sua.DEFAULT_ENVELOPE.minPct(bf), sua.minPctUsedConsideredUnderuse(bf), places=6)
+      for i in range(-10, 100):
+         bf = 0.7 + i / 100000
+         self.assertAlmostEqual(sua.DEFAULT_ENVELOPE.minPct(bf), sua.minPctUsedConsideredUnderuse(bf), places=6)
+      self.assertEqual(1, sum(sua.DEFAULT_ENVELOPE.minPct.exact))
+      c = Curve(lambda bf: bf, steps=10, interpolate=False)
+      self.assertEqual(c(0.25), 0.2)
+      self.assertEqual(c(1.5), 1)
+      # Just past 0.7, Underuse goes by the closed form too.
+      d = {
+         'billing-frac': 0.7001,
+         'global-quota': 10,
+         'usage': {'Sam': {'quota': 10, 'used': 6}},
+      }
+      self.assertEqual(Alerter(d).userStatus('Sam')['warning-code'], Warn.Local.Ok)
+
+   # A shop that considers anything over the straight line to be overuse.
+   def test_custom_envelope(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 6,   # GB
+         'usage': {
+            'Philip the Model Citizen': {'quota': 2, 'used': 1.2},
+         },
+      }
+      strict = Envelope(maxPct=lambda bf: bf)
+      self.assertEqual(Alerter(d).userStatus('Philip the Model Citizen')['warning-code'], Warn.Local.Ok)
+      self.assertEqual(Alerter(d, strict).userStatus('Philip the Model Citizen')['warning-code'], Warn.Local.Overuse)
+      (b, _) = BatchAlerter.fromAccounts([d], strict)
+      self.assertEqual(list(b.warningCodes()), [Warn.Local.Overuse])
+
+   def test_forecaster(self):
+      f = BurnRateForecaster(halfLife=0.1)
+      self.assertIsNone(f.usedEobc('Sam', 0.2, 1))
+      # The first reading starts at the average rate: a straight line.
+      f.update('Sam', 0.2, 1)
+      self.assertAlmostEqual(f.rate('Sam'), 5)
+      self.assertAlmostEqual(f.usedEobc('Sam', 0.2, 1), 5)
+      # Sam speeds up to 20 per cycle; the rate follows, halfway per halfLife.
+      f.update('Sam', 0.3, 3)
+      self.assertAlmostEqual(f.rate('Sam'), 12.5)
+      self.assertAlmostEqual(f.usedEobc('Sam', 0.3, 3), 3 + 12.5 * 0.7)
+      # The same reading again, and an older one, change nothing.
+      f.update('Sam', 0.3, 3)
+      f.update('Sam', 0.25, 3)
+      self.assertAlmostEqual(f.rate('Sam'), 12.5)
+      # A new cycle starts over.
+      f.update('Sam', 0.05, 0.1)
+      self.assertAlmostEqual(f.rate('Sam'), 2)
+
+   def test_history(self):
+      with tempfile.TemporaryDirectory() as d:
+         path = os.path.join(d, 'history')
+         with UsageHistory.UsageHistory(path) as h:
+            h.append('acct', '111', 'data', 100.0, 0.1, 1.0)
+            h.append('acct', '222', 'data', 100.0, 0.1, 0.5)
+            h.append('acct', '111', 'sms', 200.0, 0.2, 10)
+         # Appending continues the history, and the time never goes down.
+         with UsageHistory.UsageHistory(path) as h:
+            h.append('acct', '111', 'data', 300.0, 0.3, 3.0)
+            h.append('acct', '222', 'data', 250.0, 0.35, 0.7)
+         with UsageHistory.HistoryReader(path) as r:
+            self.assertEqual(5, len(r))
+            self.assertEqual([
+               (('acct', '111', 'data'), 100.0, 0.1, 1.0),
+               (('acct', '222', 'data'), 100.0, 0.1, 0.5),
+               (('acct', '111', 'sms'), 200.0, 0.2, 10.0),
+               (('acct', '111', 'data'), 300.0, 0.3, 3.0),
+               (('acct', '222', 'data'), 300.0, 0.35, 0.7),
+            ], list(r.samples()))
+            self.assertEqual(0, r.find(50))
+            self.assertEqual(0, r.find(100))
+            self.assertEqual(2, r.find(150))
+            self.assertEqual(3, r.find(300))
+            self.assertEqual(5, r.find(301))
+            self.assertEqual([200.0, 300.0, 300.0], [t for (_, t, _, _) in r.samples(200)])
+            self.assertEqual([], list(r.samples(1000)))
+
+         forecasters = collections.defaultdict(BurnRateForecaster)
+         self.assertEqual(5, UsageHistory.replay(path, forecasters))
+         self.assertAlmostEqual(forecasters[('acct', 'data')].rate('111'), 10)
+         # Only the forecasters of a plain dictionary are fed.
+         forecasters = {('acct', 'sms'): BurnRateForecaster()}
+         self.assertEqual(1, UsageHistory.replay(path, forecasters, 150))
+
+   # A crash in the middle of an append leaves part of a sample or of a key;
+   # opening the history drops them.
+   def test_history_recovery(self):
+      with tempfile.TemporaryDirectory() as d:
+         path = os.path.join(d, 'history')
+         with UsageHistory.UsageHistory(path) as h:
+            h.append('acct', '111', 'data', 100.0, 0.1, 1.0)
+            h.append('acct', '111', 'data', 200.0, 0.2, 2.0)
+         with open(path, 'ab') as f:
+            f.write(b'\x00' * 7)
+         with open(path + '.keys', 'ab') as f:
+            f.write(b'acct\t222')
+         # The reader skips them too.
+         with UsageHistory.HistoryReader(path) as r:
+            self.assertEqual(2, len(r))
+         with UsageHistory.UsageHistory(path) as h:
+            h.append('acct', '333', 'data', 150.0, 0.3, 3.0)
+         with UsageHistory.HistoryReader(path) as r:
+            self.assertEqual([
+               (('acct', '111', 'data'), 100.0, 0.1, 1.0),
+               (('acct', '111', 'data'), 200.0, 0.2, 2.0),
+               (('acct', '333', 'data'), 200.0, 0.3, 3.0),
+            ], list(r.samples()))
+         with open(path + '.keys') as f:
+            self.assertEqual('acct\t111\tdata\nacct\t333\tdata\n', f.read())
+
+         with open(path, 'wb') as f:
+            f.write(b'not a history')
+         with self.assertRaises(UsageHistory.Error):
+            UsageHistory.UsageHistory(path)
+         with self.assertRaises(UsageHistory.Error):
+            UsageHistory.HistoryReader(path)
+
+   def test_alerter_forecaster(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 10,
+         'usage': {
+            'Sam': {'quota': 5, 'used': 2},
+            'Bob': {'quota': 5, 'used': 1},
+         },
+      }
+      f = BurnRateForecaster()
+      f.update('Sam', 0.4, 1)
+      f.update('Sam', 0.5, 2)
+      a = Alerter(d, forecaster=f)
+      sam = f.usedEobc('Sam', 0.5, 2)
+      self.assertGreater(sam, 4)
+      self.assertAlmostEqual(a.userStatus('Sam')['used-eobc'], sam)
+      # Bob hasn't been seen by the forecaster: a straight line.
+      self.assertAlmostEqual(a.userStatus('Bob')['used-eobc'], 2)
+      self.assertAlmostEqual(a.globalUsagePrediction(), sam + 2)
+      self.assertEqual(a.allStatuses()['Sam']['used-eobc'], a.userStatus('Sam')['used-eobc'])
+      self.assertAlmostEqual(Alerter(d).globalUsagePrediction(), 6)
+
+   def test_overage_probability(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 10,
+         'usage': {
+            'Frugal': {'quota': 4, 'used': 0.2},
+            'Edgy': {'quota': 3, 'used': 1.5},
+            'Spendy': {'quota': 2, 'used': 2.5},
+            'Free': {'used': 1},
+         },
+      }
+      a = Alerter(d)
+      p = a.predictOverageProbability(paths=4000, seed=1)
+      self.assertEqual(p, a.predictOverageProbability(paths=4000, seed=1))
+      self.assertEqual(p['paths'], 4000)
+      self.assertEqual(p['users']['Frugal'], 0)
+      self.assertEqual(p['users']['Spendy'], 1)
+      # Edgy is headed straight for the quota: a coin toss.
+      self.assertGreater(p['users']['Edgy'], 0.35)
+      self.assertLess(p['users']['Edgy'], 0.65)
+      # Free has no quota of their own, so the account's counts.
+      self.assertEqual(p['users']['Free'], 0)
+      # Everyone together is headed for 10.4 of 10.
+      self.assertGreater(p['account'], 0.5)
+      self.assertLess(p['account'], 1)
+
+      # A steady user goes over much more surely than an erratic one.
+      steady = BurnRateForecaster()
+      for i in range(41, 51):
+         steady.update('Edgy', i / 100, 3.2 * i / 100)
+      self.assertLess(steady.variance('Edgy'), 1e-9)
+      p = Alerter(d, forecaster=steady).predictOverageProbability(paths=1000, seed=1)
+      self.assertEqual(p['users']['Edgy'], 1)
+
+      # No account quota, and nothing left of the cycle.
+      p = Alerter(dict(d, **{'global-quota': None, 'usage': {'Free': {'used': 1}}})).predictOverageProbability(seed=1)
+      self.assertIsNone(p['account'])
+      self.assertIsNone(p['users']['Free'])
+      with self.assertRaises(SuaError):
+         a.predictOverageProbability(paths=0)
+      self.assertEqual(1, a.predictOverageProbability(budget=0, seed=1)['paths'])
+      p = Alerter(dict(d, **{'billing-frac': 1.0})).predictOverageProbability(seed=1)
+      self.assertEqual(p['users'], {'Frugal': 0, 'Edgy': 0, 'Spendy': 1, 'Free': 0})
+      self.assertEqual(p['account'], 0)
+
+   def test_batch_overage_probability(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 10,
+         'usage': {
+            'Edgy': {'quota': 3, 'used': 1.5},
+            'Spendy': {'quota': 2, 'used': 2.5},
+         },
+      }
+      accounts = [d, {'billing-frac': 0.5, 'usage': {'Free': {'used': 1}}}] * 50
+      (b, names) = BatchAlerter.fromAccounts(accounts)
+      (accountP, userP, paths) = b.predictOverageProbability(paths=500, seed=2)
+      self.assertEqual(set(paths), {500})
+      self.assertEqual(len(accountP), 100)
+      self.assertEqual(len(userP), 150)
+      self.assertEqual(userP[1], 1)
+      self.assertTrue(userP[2] != userP[2]) # NaN: no quota at all
+      self.assertTrue(accountP[1] != accountP[1])
+      self.assertGreater(userP[0], 0.3)
+      self.assertLess(userP[0], 0.7)
+      # A budget cuts the paths short.
+      (accountP, userP, paths) = b.predictOverageProbability(paths=10**9, budget=0.05, seed=2)
+      self.assertGreater(min(paths), 0)
+      self.assertLess(max(paths), 10**9)
+      with self.assertRaises(SuaError):
+         b.predictOverageProbability(paths=0)
+
+   # The budget holds for the whole fleet, even if it can't give every
+   # account a single path.
+   def test_batch_overage_budget(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 10,
+         'usage': dict(('u%d' % i, {'quota': 1, 'used': 0.5}) for i in range(10)),
+      }
+      (b, names) = BatchAlerter.fromAccounts([d] * 5000)
+      start = time.perf_counter()
+      (accountP, userP, paths) = b.predictOverageProbability(budget=0.01, seed=2)
+      # Setting up the simulations takes most of it; a round of 16 paths for
+      # every account alone would take seconds.
+      self.assertLess(time.perf_counter() - start, 0.5)
+      self.assertEqual(paths[0], 1)
+      self.assertEqual(paths[-1], 0)
+      self.assertTrue(accountP[-1] != accountP[-1])
+
+   # Rich barely uses any data, while John is headed for an overage.
+   def test_rebalance(self):
+      d = {
+         'billing-frac': 0.8,
+         'global-quota': 10,
+         'usage': {
+            'Rich': {'quota': 5, 'used': 1.0},
+            'John': {'quota': 3, 'used': 3.0},
+            'Amy': {'quota': 2, 'used': 1.2},
+         },
+      }
+      a = Alerter(d)
+      self.assertEqual(a.userStatus('Rich')['warning-code'], Warn.Local.Underuse)
+      self.assertEqual(a.userStatus('John')['warning-code'], Warn.Local.Overuse)
+      r = a.suggestRebalance()
+      self.assertAlmostEqual(r['overage-before'], 0.75)
+      self.assertAlmostEqual(r['overage-after'], 0)
+      # John gets what's needed from Rich; Amy has nothing to spare.
+      self.assertAlmostEqual(r['quotas']['John'], 3.75)
+      self.assertAlmostEqual(r['quotas']['Rich'], 4.25)
+      self.assertAlmostEqual(r['quotas']['Amy'], 2)
+      d['usage'] = dict((name, {'quota': r['quotas'][name], 'used': u['used']}) for (name, u) in d['usage'].items())
+      self.assertEqual(Alerter(d).userStatus('John')['warning-code'], Warn.Local.Ok)
+
+   def test_rebalance_short(self):
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 10,
+         'usage': {
+            'Sam': {'quota': 4, 'used': 3},
+            'Bob': {'quota': 4, 'used': 2.5},
+            'Pat': {'quota': 2, 'used': 0.5},
+            'Free': {'used': 5},
+         },
+      }
+      # Predicted 6, 5 and 1 of 10: Sam and Bob end 0.75 short, and Pat,
+      # who has used 0.5 already, only 0.5.
+      r = Alerter(d).suggestRebalance()
+      self.assertEqual(set(r['quotas']), {'Sam', 'Bob', 'Pat'})
+      self.assertAlmostEqual(sum(r['quotas'].values()), 10)
+      self.assertAlmostEqual(r['quotas']['Sam'], 5.25)
+      self.assertAlmostEqual(r['quotas']['Bob'], 4.25)
+      self.assertAlmostEqual(r['quotas']['Pat'], 0.5)
+      self.assertAlmostEqual(r['overage-before'], 3)
+      self.assertAlmostEqual(r['overage-after'], 2)
+      # Nobody's quota goes below their usage.
+      d['usage']['Sam']['used'] = 7
+      d['usage']['Bob']['used'] = 2
+      r = Alerter(d).suggestRebalance()
+      self.assertAlmostEqual(r['quotas']['Sam'], 7.5)
+      self.assertAlmostEqual(r['quotas']['Bob'], 2)
+      self.assertAlmostEqual(r['quotas']['Pat'], 0.5)
+      # More used than the quotas add up to.
+      d['usage']['Bob']['used'] = 3
+      self.assertIsNone(Alerter(d).suggestRebalance())
+
+   # Polling every 15 minutes, at least every 6 hours, in a 30-day cycle.
+   def test_poll_planner(self):
+      planner = PollPlanner(900, 6*3600)
+      cycle = 30*86400
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 10,
+         'usage': {
+            'far': {'quota': 4, 'used': 0.2},
+            'edge': {'quota': 3, 'used': 2.2},
+            'over': {'quota': 2, 'used': 2.5},
+         },
+      }
+      plan = planner.plan(Alerter(d), cycle)
+      self.assertEqual(plan['far'], 6*3600)
+      self.assertEqual(plan['over'], 6*3600)
+      self.assertLess(plan['edge'], 6*3600)
+      # The check must come no later than the first poll that would see the
+      # projected Overuse.
+      a = Alerter(dict(d, **{'billing-frac': 0.5 + plan['edge'] / cycle,
+         'usage': {'edge': {'quota': 3, 'used': 2.2 * (1 + 2 * plan['edge'] / cycle / 0.5)}}}))
+      self.assertEqual(a.userStatus('edge')['warning-code'], Warn.Local.Overuse)
+
+      # The end of the cycle makes every line due.
+      plan = planner.plan(Alerter(dict(d, **{'billing-frac': 0.999})), cycle)
+      self.assertEqual(set(plan.values()), {3*900})
+      # Nothing to project from on the first day.
+      plan = planner.plan(Alerter(dict(d, **{'billing-frac': 0})), cycle)
+      self.assertEqual(set(plan.values()), {900})
+
+   # The account heading for Overuse makes every line due, even though no
+   # single line is near its own limit.
+   def test_poll_planner_account(self):
+      planner = PollPlanner(900, 6*3600)
+      d = {
+         'billing-frac': 0.5,
+         'global-quota': 10,
+         'usage': {
+            'Sam': {'used': 3.7},
+            'Bob': {'used': 3.7},
+         },
+      }
+      plan = planner.plan(Alerter(d), 30*86400)
+      self.assertEqual(plan['Sam'], plan['Bob'])
+      self.assertLess(plan['Sam'], 6*3600)
+
 unittest.main()
@@ -1,143 +1,426 @@
 #!/bin/env python3
 
+import argparse
 import calendar
+import collections
 import datetime
+import functools
 import os
-import pickle
 import pprint
+import signal
+import Snapshot
+import sys
+import threading
+import time
+import traceback
+from AlertStore import AlertStore
 from EmailTunnel import EmailTunnel
-from VerizonScraper import VerizonScraper
-from SharedUsageAlerter import Warn, Alerter
+from MailDelivery import PrintDelivery, SmtpDelivery, AsyncDelivery
+from ResponseCache import ResponseCache
+from ScrapeScheduler import ScrapeScheduler
+from SessionStore import SessionStore
+import UsageHistory
+from SharedUsageAlerter import LineUsage, AccountUsage, Alerter, BurnRateForecaster
 from OutputFormatter import OutputFormatter
+from PollPlanner import PollPlanner
 
-def getUserWarningTextCooperative(of, usercode, admincode=Warn.Global.Ok):
-   if admincode == Warn.Global.Overage or admincode == Warn.Global.Overuse:
-      return of.warningAdminTextMap[admincode]
-   return of.warningUserTextMap[usercode]
+# Verizon data older than this many seconds is fetched again.
+CACHE_TTL = 3600
+CACHE_FILE = 'vz-cache.snapshot'
+CACHE_MAX_ENTRIES = 100000
+# Logins are kept here between runs.
+SESSION_DIR = 'vz-sessions'
+# Alerts already sent, so they aren't sent again on the next run.
+ALERT_DB = 'vz-alerts.sqlite'
+# Every usage reading, to follow the users' burn rates across runs.  The last
+# HISTORY_REPLAY seconds of it warm up the forecasts at start.
+HISTORY_FILE = 'vz-history.dat'
+HISTORY_REPLAY = 31*86400
+DEAD_LETTERS = 'vz-dead-letters.mbox'
+# Accounts scraped at once, and the limits every Verizon host is held to.
+SCRAPE_WORKERS = 8
+REQUESTS_PER_SECOND_PER_HOST = 10
+REQUESTS_IN_FLIGHT_PER_HOST = 8
+# The chances of an overage are simulated over this many paths, or as many as
+# fit in OVERAGE_BUDGET seconds per account and resource.
+OVERAGE_PATHS = 2000
+OVERAGE_BUDGET = 0.1
+# Seconds between polls in daemon mode.  Lines far from their thresholds are
+# polled less often, but at least every DAEMON_MAX_INTERVAL seconds.
+DAEMON_INTERVAL = 900
+DAEMON_MAX_INTERVAL = 6*3600
 
-def getUserWarningTextIndependent(of, usercode):
-   return of.warningUserTextMap[usercode]
-
-def showDataAlerts(d):
+def showDataAlerts(d, email, forecaster=None):
    resource = "data"
    coopMode = False
    of = OutputFormatter(resource)
-   a = Alerter(d)
-   email = EmailTunnel()
+   a = Alerter(d, forecaster=forecaster)
    # EOBC: End Of Billing Cycle
    print("== DATA ALERTS ==")
-   globalWarning = a.getGlobalWarnText(a.accountHealth())
+   health = a.accountHealth()
+   globalWarning = a.getGlobalWarnText(health)
    print("Global status (%.1f / %.1f GB) is %s.  Estimated usage by EOBC: %.1f GB."
       % (a.globalUsed(), a.globalQuota(), globalWarning, a.globalUsagePrediction()))
-   print("Message to admin: %s" % of.warningAdminTextMap[a.accountHealth()])
-   email.alertAdminGlobally(resource, a.accountHealth(), globalWarning)
+   print("Message to admin: %s" % of.warningAdminTextMap[health])
+   email.alertAdminGlobally(resource, health, globalWarning)
+   overage = a.predictOverageProbability(OVERAGE_PATHS, OVERAGE_BUDGET)
+   showOverageChance("Account overage", overage['account'])
 
-   for (name, usage) in d['usage'].items():
-      status = a.userStatus(name)
-      localquota = usage['quota'] if 'quota' in usage else "inf"
-      print("%s (used %.1f / %.1f GB):" % (name, usage['used'], localquota))
+   for r in of.render(a.iterStatuses(), health):
+      usage = d.usage[r.name]
+      localquota = usage.quota if usage.quota is not None else float("inf")
+      print("%s (used %.1f / %.1f GB):" % (r.name, usage.used, localquota))
       print("\tto account admin: %s.  Est. local use by EOBC: %.1f / %.1f GB."
-         % (a.getLocalWarnText(status['warning-code']), status['used-eobc'], localquota))
-      if 'max-daily-use-to-eobc' in status and status['max-daily-use-to-eobc'] > 0:
-         print("\tto user: you can use up to %.2f GB/day until the end of the billing cycle." % status['max-daily-use-to-eobc'])
-      print("\tto user (coop mode): %s" % getUserWarningTextCooperative(of, status['warning-code'], a.accountHealth()))
-      print("\tto user (ind mode):  %s" % getUserWarningTextIndependent(of, status['warning-code']))
-      if coopMode:
-         email.alertUser(name, resource, status['warning-code'], getUserWarningTextCooperative(of, status['warning-code'], a.accountHealth()))
-      else:
-         email.alertUser(name, resource, status['warning-code'], getUserWarningTextIndependent(of, status['warning-code']))
+         % (a.getLocalWarnText(r.status['warning-code']), r.status['used-eobc'], localquota))
+      showOverageChance("\tOver quota", overage['users'][r.name])
+      if r.daily is not None:
+         print("\tto user: %s" % r.daily)
+      print("\tto user (coop mode): %s" % r.cooperative)
+      print("\tto user (ind mode):  %s" % r.independent)
+      email.alertUser(r.name, resource, r.status['warning-code'], r.cooperative if coopMode else r.independent)
+   showRebalance(a, "%.1f GB")
+   return a
 
-def showSmsAlerts(d):
+def showSmsAlerts(d, email, forecaster=None):
    resource = "SMS"
    coopMode = False
    of = OutputFormatter(resource)
-   a = Alerter(d)
-   email = EmailTunnel()
+   a = Alerter(d, forecaster=forecaster)
    # EOBC: End Of Billing Cycle
    print("== SMS ALERTS ==")
-   globalWarning = a.getGlobalWarnText(a.accountHealth())
+   health = a.accountHealth()
+   globalWarning = a.getGlobalWarnText(health)
    print("Global status (%d / %s) is %s.  Estimated usage by EOBC: %d."
       % (a.globalUsed(), a.globalQuota() if a.globalQuota() is not None else "inf", globalWarning, a.globalUsagePrediction()))
-   print("Message to admin: %s" % of.warningAdminTextMap[a.accountHealth()])
-   email.alertAdminGlobally(resource, a.accountHealth(), globalWarning)
+   print("Message to admin: %s" % of.warningAdminTextMap[health])
+   email.alertAdminGlobally(resource, health, globalWarning)
+   overage = a.predictOverageProbability(OVERAGE_PATHS, OVERAGE_BUDGET)
+   showOverageChance("Account overage", overage['account'])
 
-   for (name, usage) in d['usage'].items():
-      status = a.userStatus(name)
-      localquota = usage['quota'] if 'quota' in usage else "inf"
-      print("%s (used %d / %s):" % (name, usage['used'], localquota))
+   for r in of.render(a.iterStatuses(), health):
+      usage = d.usage[r.name]
+      localquota = usage.quota if usage.quota is not None else float("inf")
+      print("%s (used %d / %s):" % (r.name, usage.used, localquota))
       print("\tto account admin: %s.  Est. local use by EOBC: %d / %s."
-         % (a.getLocalWarnText(status['warning-code']), status['used-eobc'], localquota))
-      if 'max-daily-use-to-eobc' in status and status['max-daily-use-to-eobc'] > 0:
-         print("\tto user: you can send up to %.1f texts/day until the end of the billing cycle." % status['max-daily-use-to-eobc'])
-      print("\tto user (coop mode): %s" % getUserWarningTextCooperative(of, status['warning-code'], a.accountHealth()))
-      print("\tto user (ind mode):  %s" % getUserWarningTextIndependent(of, status['warning-code']))
-      if coopMode:
-         email.alertUser(name, resource, status['warning-code'], getUserWarningTextCooperative(of, status['warning-code'], a.accountHealth()))
-      else:
-         email.alertUser(name, resource, status['warning-code'], getUserWarningTextIndependent(of, status['warning-code']))
+         % (a.getLocalWarnText(r.status['warning-code']), r.status['used-eobc'], localquota))
+      showOverageChance("\tOver quota", overage['users'][r.name])
+      if r.daily is not None:
+         print("\tto user: %s" % r.daily)
+      print("\tto user (coop mode): %s" % r.cooperative)
+      print("\tto user (ind mode):  %s" % r.independent)
+      email.alertUser(r.name, resource, r.status['warning-code'], r.cooperative if coopMode else r.independent)
+   showRebalance(a, "%d")
+   return a
+
+def showOverageChance(what, probability):
+   if probability is not None:
+      print("%s: %.0f%% chance by EOBC." % (what, probability * 100))
 
-def getAuth():
+# Shows the quotas Alerter.suggestRebalance() suggests, if they would cut the
+# predicted overage.
+def showRebalance(a, quotaFormat):
+   suggestion = a.suggestRebalance()
+   if suggestion is None or suggestion['overage-after'] >= suggestion['overage-before']:
+      return
+   print(("Moving quota between lines would cut the predicted overage from %s to %s:" % (quotaFormat, quotaFormat))
+      % (suggestion['overage-before'], suggestion['overage-after']))
+   for (name, quota) in suggestion['quotas'].items():
+      (suggested, current) = (quotaFormat % quota, quotaFormat % a.lines[name].quota)
+      if suggested != current:
+         print("\t%s: %s instead of %s" % (name, suggested, current))
+
+def getAuth(path='auth.dat'):
    db = {}
-   with open('auth.dat', 'r') as f:
+   with open(path, 'r') as f:
       for l in f:
          s = l.strip().split('=')
          db[s[0]] = s[1]
    return db
 
+# mail.dat configures mailing the alerts, one key=value per line: host, port,
+# sender and admin (the admin's address), and the address of every phone line
+# by its number.  Without it, the alerts are printed.  Mail is sent in the
+# background while the next accounts are evaluated; what can't be sent ends up
+# in DEAD_LETTERS.
+def getDelivery():
+   if not os.access('mail.dat', os.R_OK):
+      return PrintDelivery()
+   config = getAuth('mail.dat')
+   addresses = dict((k, v) for (k, v) in config.items() if k.isdigit())
+   return AsyncDelivery(SmtpDelivery(config['host'], int(config.get('port', 25)), config.get('sender', 'alerts@localhost'),
+      addresses, config.get('admin')), deadLetters=DEAD_LETTERS)
+
+# accounts.dat lists one account per line as username=password.  Without it,
+# the single account of auth.dat is used.
+def getAccounts():
+   if not os.access('accounts.dat', os.R_OK):
+      auth = getAuth()
+      return [(auth['username'], auth['password'])]
+   accounts = []
+   with open('accounts.dat', 'r') as f:
+      for l in f:
+         if l.strip():
+            (username, password) = l.strip().split('=', 1)
+            accounts.append((username, password))
+   return accounts
+
 def KbToGb(kb):
    return kb / 1024 / 1024
 
+def loadCache():
+   if os.access(CACHE_FILE, os.R_OK):
+      try:
+         return ResponseCache.load(CACHE_FILE, CACHE_TTL, CACHE_MAX_ENTRIES)
+      except Snapshot.Error as e:
+         sys.stderr.write("Ignoring the cache: %s\n" % e)
+   return ResponseCache(CACHE_TTL, CACHE_MAX_ENTRIES)
+
+class State:
+   """Everything a run needs: the cache, the alerts sent, the configuration
+   and, between the cycles of the daemon, the accounts' sessions and
+   EmailTunnels, so that a cycle only does the work of what changed.
+
+   With a PollPlanner, every overview stays in the cache until the planner
+   says its line is due, so a cycle scrapes only the lines that are due.
+
+   Every new usage reading is appended to the UsageHistory and fed to the
+   account's BurnRateForecasters, which predict the usage by the end of the
+   billing cycle."""
+
+   def __init__(self, planner=None):
+      self.planner = planner
+      self.cache = loadCache()
+      self.store = AlertStore(ALERT_DB)
+      self.sessionStore = SessionStore(SESSION_DIR)
+      self.forecasters = collections.defaultdict(BurnRateForecaster) # (account, resource) -> forecaster
+      if os.access(HISTORY_FILE, os.R_OK):
+         try:
+            UsageHistory.replay(HISTORY_FILE, self.forecasters, time.time() - HISTORY_REPLAY)
+         except UsageHistory.Error as e:
+            sys.stderr.write("Ignoring the usage history: %s\n" % e)
+      self.history = UsageHistory.UsageHistory(HISTORY_FILE)
+      self.readAt = {} # (account, line, resource) -> when its last reading was taken
+      self.sessions = {}
+      self.tunnels = {}
+      self.delivery = None
+      self.reload()
+
+   def reload(self):
+      """Reads the accounts and the mail configuration again."""
+      self.accounts = getAccounts()
+      if self.delivery is not None:
+         self.delivery.close()
+      self.delivery = getDelivery()
+      # Tunnels deliver through the old delivery; their alerts are in the store.
+      self.tunnels = {}
+      for username in set(self.sessions) - set(u for (u, _) in self.accounts):
+         self.sessions.pop(username).close()
+
+   def cycle(self):
+      """Scrapes all accounts and shows and sends their alerts.  Returns how
+      many seconds the cycle took in total and in alert evaluation."""
+      start = time.perf_counter()
+      alerting = 0.0
+      planned = 0
+      dueNext = 0
+      print("Retrieving Verizon Wireless account info of %d account(s)..." % len(self.accounts))
+      scheduler = ScrapeScheduler(self.accounts, SCRAPE_WORKERS, REQUESTS_PER_SECOND_PER_HOST,
+         maxPerHost=REQUESTS_IN_FLIGHT_PER_HOST, sessions=self.sessions, cache=self.cache,
+         sessionStore=self.sessionStore, differential=True)
+      # Every account's alerts are shown as soon as it's scraped.  Whatever
+      # was read is saved even if an account fails the cycle.
+      try:
+         for (username, vz, error) in scheduler.run():
+            if error is not None:
+               sys.stderr.write("Could not retrieve account info of '%s': %s\n" % (username, error))
+               continue
+            alertStart = time.perf_counter()
+            print("== ACCOUNT '%s' ==" % username)
+            showFieldReport(vz.getFieldReport())
+            email = self.tunnels.get(username)
+            if email is None:
+               email = self.tunnels[username] = EmailTunnel(self.store, username, self.delivery)
+            evaluated = showAccountAlerts(vz, email, functools.partial(self.observe, username))
+            if self.planner is not None and evaluated is not None:
+               (cycleSeconds, alerters) = evaluated
+               for (resource, a) in alerters:
+                  for (line, seconds) in self.planner.plan(a, cycleSeconds).items():
+                     # Half a tick early, so the line is fetched by the poll it's
+                     # due at rather than the one after.
+                     self.cache.expireAfter(username, line, resource, seconds - self.planner.tick / 2)
+                     planned += 1
+                     if seconds <= self.planner.tick:
+                        dueNext += 1
+            for message in email.commit():
+               sys.stderr.write("Could not mail the alerts to %s.\n" % message['To'])
+            alerting += time.perf_counter() - alertStart
+      finally:
+         self.cache.save(CACHE_FILE)
+         self.history.flush()
+      stats = self.cache.stats()
+      print("Cache: %d hits, %d misses (%d expired)%s."
+         % (stats['hits'], stats['misses'], stats['expired'],
+            ", %.0f%% hit rate" % (stats['hitRate']*100) if stats['hitRate'] is not None else ""))
+      stats = scheduler.stats()
+      print("Scraped %d account(s), %d failed, in %.1f s; %d requests, %d held back by the rate limit."
+         % (stats['scraped'], stats['failed'], stats['elapsed'], stats['requests'], stats['waited']))
+      if self.planner is not None:
+         print("%d of %d overview(s) are due at the next poll." % (dueNext, planned))
+      return (time.perf_counter() - start, alerting)
+
+   def observe(self, username, resource, d, cycleEnd, cycleSeconds):
+      """Records the usage readings of d, the AccountUsage of a resource, that
+      are new since the last cycle, and returns the account's forecaster of
+      the resource.  cycleEnd is the POSIX time the billing cycle ends."""
+      forecaster = self.forecasters[(username, resource)]
+      now = time.time()
+      for (line, usage) in d.usage.items():
+         key = (username, line, resource)
+         entry = self.cache.peek(*key)
+         readAt = entry[0] if entry is not None else now
+         if self.readAt.get(key) == readAt:
+            continue
+         self.readAt[key] = readAt
+         # The billing fraction at the moment of the reading, not of the day.
+         bf = 1 - (cycleEnd - readAt) / cycleSeconds
+         forecaster.update(line, bf, usage.used)
+         self.history.append(username, line, resource, readAt, bf, usage.used)
+      return forecaster
+
+   def close(self):
+      self.delivery.close()
+      stats = self.delivery.stats()
+      if stats:
+         print("Mail: %d sent, %d retried, %d dead-lettered, %d without an address, over %d connection(s)."
+            % (stats['sent'], stats['retried'], stats['deadLettered'], stats['undeliverable'], stats['opened']))
+      for session in self.sessions.values():
+         session.close()
+      self.store.close()
+      self.history.close()
+
 def run():
-   if os.access('vz.pickle', os.R_OK):
-      print("Loading the pickled Verizon Wireless account info.")
-      with open('vz.pickle', 'rb') as f:
-         vz = pickle.load(f)
-   else:
-      auth = getAuth()
-      print("Retrieving Verizon Wireless account info of '%s'..." % auth['username'])
-      vz = VerizonScraper(auth['username'], auth['password'])
-      with open('vz.pickle', 'wb') as f:
-         pickle.dump(vz, f, pickle.HIGHEST_PROTOCOL)
+   state = State()
+   try:
+      state.cycle()
+   finally:
+      state.close()
 
+# The daemon runs a cycle every interval seconds, keeping its State warm in
+# between.  SIGHUP makes it reread its configuration and run a cycle at once;
+# SIGTERM and SIGINT make it finish the current cycle and exit.  Every cycle
+# scrapes only the lines a PollPlanner finds due; the others are polled at
+# least every maxInterval seconds.  A cycle that fails is reported, and the
+# next one runs as usual.
+def daemon(interval, maxInterval):
+   wake = threading.Event()
+   requests = set()
+   def handle(signum, frame):
+      requests.add(signum)
+      wake.set()
+   for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT):
+      signal.signal(signum, handle)
+
+   state = State(PollPlanner(interval, maxInterval))
+   # Data the planner hasn't seen yet is kept at most maxInterval.
+   state.cache.ttl = maxInterval
+   cycles = 0
+   try:
+      while True:
+         cycles += 1
+         start = time.perf_counter()
+         try:
+            (elapsed, alerting) = state.cycle()
+            print("Cycle %d took %.2f s, %.2f s of it evaluating alerts." % (cycles, elapsed, alerting))
+         except (KeyboardInterrupt, SystemExit):
+            raise
+         except BaseException:
+            # The modules' Errors are BaseExceptions as well.
+            sys.stderr.write("Cycle %d failed:\n%s" % (cycles, traceback.format_exc()))
+            elapsed = time.perf_counter() - start
+         sys.stdout.flush()
+         wake.wait(max(0.0, interval - elapsed))
+         wake.clear()
+         if signal.SIGTERM in requests or signal.SIGINT in requests:
+            break
+         if signal.SIGHUP in requests:
+            print("Reloading the configuration.")
+            state.reload()
+         requests.clear()
+   finally:
+      state.close()
+
+# Tells about the fields Verizon sent that the scraper doesn't know, and the
+# required ones it left out; see VerizonScraper.getFieldReport().
+def showFieldReport(report):
+   for (kind, counter) in (("unknown", report['unknown']), ("missing required", report['missing'])):
+      if counter:
+         sys.stderr.write("Overviews with %s fields: %s\n" % (kind,
+            ', '.join("%s %s (%d)" % (resource, field, n) for ((resource, field), n) in sorted(counter.items()))))
+
+# Returns the length of the billing cycle in seconds and the Alerter of every
+# resource, by its name in the cache, or None if the account has no lines or
+# lacks required fields.
+# observe(resource, d, cycleEnd, cycleSeconds), if given, is told the
+# AccountUsage d of every resource and returns the forecaster to use for it.
+def showAccountAlerts(vz, email, observe=None):
    pp = pprint.PrettyPrinter(indent=2)
    accountInfo = vz.getAccountInfo()
    #pp.pprint(accountInfo)
-   somePhone = iter(vz.getPhoneNumSet()).__next__()
    if len(accountInfo.keys()) == 0:
       sys.stderr.write("Did not find any phone numbers or any account information!\n")
-      sys.exit(1)
+      return
+   # Every overview is checked, cached ones included.  The field report only
+   # counts the overviews fetched in this run; the cached ones were counted
+   # by the run that fetched them.
+   missing = sorted(set((resource, field) for lineInfo in accountInfo.values() for resource in ('sms', 'data')
+      for field in vz.requiredFields[resource] if field not in lineInfo[resource]))
+   if missing:
+      sys.stderr.write("Can't alert on the account; its overviews lack %s.\n"
+         % ', '.join("%s %s" % (resource, field) for (resource, field) in missing))
+      return
+   somePhone = iter(vz.getPhoneNumSet()).__next__()
    (_, daysInMonth) = calendar.monthrange(datetime.date.today().year, datetime.date.today().month)
 
-   d = {
-      'billing-frac': 1 - ((accountInfo[somePhone]['sms']['billCyleEndDate'] - datetime.date.today()).days / daysInMonth),
-      'usage': {}
-   }
+   cycleEndDate = accountInfo[somePhone].sms.billCyleEndDate
+   billingFrac = 1 - ((cycleEndDate - datetime.date.today()).days / daysInMonth)
+   cycleEnd = time.mktime(cycleEndDate.timetuple())
+   cycleSeconds = daysInMonth * 86400
+   if observe is None:
+      observe = lambda resource, d, cycleEnd, cycleSeconds: None
 
-   print("You are %.0f%% of the way into the billing cycle." % (d['billing-frac']*100))
+   print("You are %.0f%% of the way into the billing cycle." % (billingFrac*100))
+   alerters = []
    # SMS
-   d['global-quota'] = 0
+   d = AccountUsage(billingFrac, 0, {})
    isInfinite = False
    for (phone, lineInfo) in accountInfo.items():
-      d['usage'][phone] = {
-         'used': lineInfo['sms']['individualUsage'],
-      }
-      if lineInfo['sms']['summaryAllowance'] == 'Unlimited':
+      d.usage[phone] = LineUsage(lineInfo.sms.individualUsage)
+      if lineInfo.sms.summaryAllowance == 'Unlimited':
          isInfinite = True
       else:
-         d['usage'][phone]['quota'] = lineInfo['sms']['summaryAllowance']
-         d['global-quota'] += lineInfo['sms']['summaryAllowance']
+         d.usage[phone].quota = lineInfo.sms.summaryAllowance
+         d.globalQuota += lineInfo.sms.summaryAllowance
    if isInfinite: 
-      d['global-quota'] = None
-   showSmsAlerts(d)
+      d.globalQuota = None
+   alerters.append(('sms', showSmsAlerts(d, email, observe('sms', d, cycleEnd, cycleSeconds))))
 
    # Data
-   d['global-quota'] = 0
+   d = AccountUsage(billingFrac, 0, {})
    for (phone, lineInfo) in accountInfo.items():
-      d['usage'][phone] = {
-         'quota': KbToGb(lineInfo['data']['summaryAllowanceInKB']),
-         'used': KbToGb(lineInfo['data']['summaryUsageInKB']),
-      }
-      d['global-quota'] += KbToGb(lineInfo['data']['summaryAllowanceInKB'])
-   showDataAlerts(d)
-
-run()
+      # summaryUsageInKB and summaryAllowanceInKB are the whole account's,
+      # repeated in every line's overview; individualUsage is this line's, in
+      # KB.  The lines share the allowance and have no quotas of their own.
+      d.usage[phone] = LineUsage(KbToGb(lineInfo.data.individualUsage))
+      d.globalQuota = KbToGb(lineInfo.data.summaryAllowanceInKB)
+   alerters.append(('data', showDataAlerts(d, email, observe('data', d, cycleEnd, cycleSeconds))))
+   return (cycleSeconds, alerters)
+
+parser = argparse.ArgumentParser(description="Retrieves Verizon usage and alerts about it.")
+parser.add_argument('--daemon', action='store_true', help="keep running and poll every --interval seconds")
+parser.add_argument('--interval', type=float, default=DAEMON_INTERVAL, help="seconds between the starts of the daemon's cycles")
+parser.add_argument('--max-interval', type=float, default=DAEMON_MAX_INTERVAL, help="the longest the daemon goes without polling a line")
+args = parser.parse_args()
+if args.daemon:
+   daemon(args.interval, args.max_interval)
+else:
+   run()